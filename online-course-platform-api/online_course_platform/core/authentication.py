@@ -0,0 +1,35 @@
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from .tokens import TOKEN_VERSION_CLAIM, get_token_version
+
+class ClaimsUser(TokenUser):
+    '''
+    Request user built from the claims of the token, without a database row behind it.
+    '''
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def teacher_id(self):
+        return self.token.get('teacher_id')
+
+    @cached_property
+    def student_id(self):
+        return self.token.get('student_id')
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            # issued before tokens carried claims
+            return super().get_user(validated_token)
+
+        user = ClaimsUser(validated_token)
+        version = get_token_version(user.id)
+        if version is None:
+            raise AuthenticationFailed('User not found or inactive', code='user_not_found')
+        if version != validated_token[TOKEN_VERSION_CLAIM]:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user
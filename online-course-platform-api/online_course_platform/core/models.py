@@ -13,3 +13,5 @@ class User(AbstractUser):
     last_name = models.CharField(_("last name"), max_length=255, null=False, blank=False)
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=2, choices=RoleChoices.choices, default='ST')
+    # part of every issued token, bumping it revokes them, see core.tokens
+    token_version = models.PositiveIntegerField(default=0, editable=False)
@@ -4,6 +4,10 @@ from django.db import transaction
 from .models import User
 from custom.models import Teacher, Student
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from .tokens import ClaimsRefreshToken, TOKEN_VERSION_CLAIM, add_claims
 
 class UserCreateSerializer(BaseUserCreateSerializer):
     class Meta(BaseUserCreateSerializer.Meta):
@@ -27,4 +31,21 @@ class UserSerializer(BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role']
 
-    role = serializers.CharField(read_only=True)
\ No newline at end of file
+    role = serializers.CharField(read_only=True)
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        # the claims of the new access token are read again, a revoked refresh token is refused
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh['user_id'], is_active=True).first()
+        if not user or refresh.get(TOKEN_VERSION_CLAIM, user.token_version) != user.token_version:
+            raise InvalidToken('Token has been revoked')
+
+        access = refresh.access_token
+        add_claims(access, user)
+        return {'access': str(access)}
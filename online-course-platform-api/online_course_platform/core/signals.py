@@ -0,0 +1,20 @@
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+from .models import User
+from .tokens import revoke_tokens
+
+# the fields issued tokens carry or depend on
+TOKEN_FIELDS = ('role', 'is_staff', 'is_active', 'password')
+
+@receiver(pre_save, sender=User)
+def detect_token_fields_changed(sender, instance, update_fields=None, **kwargs):
+    instance._token_fields_changed = False
+    if instance.pk is None or (update_fields and not set(update_fields) & set(TOKEN_FIELDS)):
+        return
+    saved = User.objects.filter(pk=instance.pk).values(*TOKEN_FIELDS).first()
+    instance._token_fields_changed = bool(saved) and any(saved[field] != getattr(instance, field) for field in TOKEN_FIELDS)
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_token_fields_changed(sender, instance, **kwargs):
+    if getattr(instance, '_token_fields_changed', False):
+        revoke_tokens(instance.pk)
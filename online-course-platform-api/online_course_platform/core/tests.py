@@ -1,3 +1,42 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from custom.models import Teacher
+from .models import User
 
-# Create your tests here.
+class ClaimsTokenTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='teacher', email='teacher@example.com', password='pw-123456', role=User.RoleChoices.TEACHER
+        )
+        self.teacher = Teacher.objects.create(user=self.user)
+        tokens = self.client.post('/api/v1/auth/jwt/create/', {'username': 'teacher', 'password': 'pw-123456'}).json()
+        self.refresh = tokens['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+    def test_requests_do_not_load_the_user(self):
+        # first request caches the token version
+        self.client.get('/api/v1/teacher_join_course_requests/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/teacher_join_course_requests/')
+
+        self.assertEqual(response.status_code, 200)
+        # the requests may join users for their data, but never look up the authenticated user
+        self.assertFalse([query['sql'] for query in queries if 'FROM "core_user"' in query['sql']])
+
+    def test_role_change_revokes_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.role = User.RoleChoices.STUDENT
+            self.user.save()
+
+        self.assertEqual(self.client.get('/api/v1/teacher_join_course_requests/').status_code, 401)
+        response = self.client.post('/api/v1/auth/jwt/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_account_endpoints_use_the_user_row(self):
+        response = self.client.get('/api/v1/auth/users/me/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], 'teacher@example.com')
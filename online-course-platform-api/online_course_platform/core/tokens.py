@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.db.models import F
+from rest_framework_simplejwt.tokens import RefreshToken
+from custom.models import Teacher, Student
+from .models import User
+
+# tokens carry what the permission checks need (role, is_staff and the teacher/student profile ids),
+# so authenticated requests do not load the user row. a token is only accepted while its "ver" claim
+# equals the token_version of the user, which is bumped whenever those claims would change
+
+TOKEN_VERSION_CLAIM = 'ver'
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        add_claims(token, user)
+        return token
+
+def add_claims(token, user):
+    # the access token derived from a refresh token copies these claims
+    token['role'] = user.role
+    token['is_staff'] = user.is_staff
+    token['teacher_id'] = Teacher.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    token['student_id'] = Student.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+
+def get_token_version(user_id):
+    '''
+    Current token version of the user, None if the user does not exist or is inactive.
+    Cached for TOKEN_VERSION_CACHE_TTL seconds, the cache of this process is cleared on every bump.
+    '''
+    cache_key = _version_key(user_id)
+    version = cache.get(cache_key)
+    if version is None:
+        # not from a replica, a lagging one would have a revoked version cached
+        row = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list('token_version', 'is_active').first()
+        version = row[0] if row and row[1] else -1
+        cache.set(cache_key, version, settings.TOKEN_VERSION_CACHE_TTL)
+    return None if version < 0 else version
+
+def revoke_tokens(user_id):
+    User.objects.filter(pk=user_id).update(token_version=F('token_version') + 1)
+    transaction.on_commit(lambda: cache.delete(_version_key(user_id)))
+
+def _version_key(user_id):
+    return f'token_version:{user_id}'
@@ -0,0 +1,8 @@
+from rest_framework.routers import DefaultRouter
+from . import views
+
+# djoser.urls, with the user endpoints working on the user row instead of the token user
+router = DefaultRouter()
+router.register('users', views.UserViewSet)
+
+urlpatterns = router.urls
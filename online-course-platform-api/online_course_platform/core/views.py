@@ -1,3 +1,10 @@
-from django.shortcuts import render
+from djoser.views import UserViewSet as BaseUserViewSet
+from .authentication import ClaimsUser
+from .models import User
 
-# Create your views here.
+class UserViewSet(BaseUserViewSet):
+    def perform_authentication(self, request):
+        super().perform_authentication(request)
+        # the account endpoints read and write the user row itself, swap the token user for it
+        if isinstance(request.user, ClaimsUser):
+            request.user = User.objects.get(pk=request.user.id)
@@ -0,0 +1,183 @@
+from functools import wraps
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import URLPattern
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from core.authentication import ClaimsJWTAuthentication
+from .database import database_sync_to_async
+from .fastpath import LessonReader
+from .models import Assignment, AssignmentMaterial, Lesson
+from .pagination import CreatedAtCursorPagination
+from .permissions import IsAdminOrCourseTeacherOrCourseStudent
+from .s3 import aget_presigned_url, get_media_file_key
+from .serializers import LessonSerializer, AssignmentMaterialSerializer
+from .views import get_local_media_file_url
+
+# async versions of the hot read endpoints, for ASGI workers (see gunicorn.conf.py).
+# Django 3.2 has no async ORM and DRF no async views, so each request runs its authentication, permission
+# checks, queries and serialization in one hop to a pool of ASYNC_DB_THREADS database threads,
+# and signs S3 URLs on the event loop (see PresignedUrlCache.aget). the event loop itself never blocks,
+# which lets a worker hold thousands of open requests, e.g. viewers polling the video URL in a live class.
+# only GETs are served here, negotiating the renderer as the viewsets do, the rest and the browsable API go to the
+# viewsets. responses are the same bytes
+
+def _load_lessons(request, course_pk):
+    _check_permissions(request, course_pk)
+    queryset = Lesson.objects.filter(course_id=course_pk).select_related('course', 'teacher', 'teacher__user')
+    if settings.FAST_READ_SERIALIZERS:
+        reader = LessonReader(request)
+        paginator = CreatedAtCursorPagination()
+        page = paginator.paginate_queryset(queryset.values(*reader.values), request)
+        return paginator.get_paginated_response(reader.read(page)).data
+    return _paginate(request, queryset, LessonSerializer, {'course_pk': course_pk})
+
+def _load_lesson(request, course_pk, pk):
+    _check_permissions(request, course_pk)
+    queryset = Lesson.objects.filter(id=pk, course_id=course_pk).select_related('course', 'teacher', 'teacher__user')
+    if settings.FAST_READ_SERIALIZERS:
+        reader = LessonReader(request)
+        row = queryset.values(*reader.values).first()
+        if row is None:
+            raise exceptions.NotFound()
+        return reader.read([row])[0]
+    lesson = queryset.first()
+    if lesson is None:
+        raise exceptions.NotFound()
+    return LessonSerializer(lesson, context={'request': request, 'course_pk': course_pk}).data
+
+def _load_lesson_video(request, course_pk, pk):
+    _check_permissions(request, course_pk)
+    return Lesson.objects.filter(id=pk, course_id=course_pk).first()
+
+def _load_materials(request, course_pk, assignment_pk):
+    # authenticates, then 404 before the permission checks, as AssignmentMaterialViewSet.get_permissions
+    request.user
+    if not Assignment.objects.filter(id=assignment_pk, course_id=course_pk).exists():
+        raise exceptions.NotFound()
+    _check_permissions(request, course_pk)
+    queryset = AssignmentMaterial.objects.filter(assignment_id=assignment_pk)
+    return _paginate(request, queryset, AssignmentMaterialSerializer, {'assignment_pk': assignment_pk})
+
+def _check_permissions(request, course_pk):
+    # the permission classes of the viewsets for safe methods, and DRF's APIView.permission_denied
+    view = SimpleNamespace(kwargs={'course_pk': course_pk})
+    for permission in (IsAuthenticated(), IsAdminOrCourseTeacherOrCourseStudent()):
+        if not permission.has_permission(request, view):
+            if not request.successful_authenticator:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+def _paginate(request, queryset, serializer_class, context):
+    paginator = CreatedAtCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    data = serializer_class(page, many=True, context={'request': request, **context}).data
+    return paginator.get_paginated_response(data).data
+
+async def lesson_list(request, course_pk):
+    return await _respond(request, _load_lessons, course_pk)
+
+async def lesson_detail(request, course_pk, pk):
+    return await _respond(request, _load_lesson, course_pk, pk)
+
+async def lesson_video(request, course_pk, pk):
+    try:
+        lesson = await database_sync_to_async(_load_lesson_video, request, course_pk, pk)
+    except exceptions.APIException as e:
+        return _render_exception(request, e)
+
+    if not lesson:
+        return _render(request, {'message': 'lesson with given id not found'}, status.HTTP_404_NOT_FOUND)
+    elif not lesson.video:
+        return _render(request, {'message': 'lesson video not found'}, status.HTTP_404_NOT_FOUND)
+
+    try:
+        if settings.USE_S3:
+            url = await aget_presigned_url(get_media_file_key(lesson.video))
+        else:
+            url = get_local_media_file_url(request, lesson.video)
+    except Exception as e:
+        return _render(request, {'message': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return _render(request, {'url': url})
+
+async def material_list(request, course_pk, assignment_pk):
+    return await _respond(request, _load_materials, course_pk, assignment_pk)
+
+async def _respond(request, load, *args):
+    try:
+        data = await database_sync_to_async(load, request, *args)
+    except exceptions.APIException as e:
+        return _render_exception(request, e)
+    return _render(request, data)
+
+def _get_drf_request(request):
+    '''
+    The DRF request of the async views, with the renderer the viewsets would answer with, None if not acceptable.
+    '''
+    drf_request = Request(request, authenticators=[ClaimsJWTAuthentication()])
+    renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+    try:
+        # as APIView.perform_content_negotiation, ?format= included
+        drf_request.accepted_renderer, drf_request.accepted_media_type = \
+            DefaultContentNegotiation().select_renderer(drf_request, renderers)
+    except exceptions.NotAcceptable:
+        drf_request.accepted_renderer = drf_request.accepted_media_type = None
+    return drf_request
+
+def _render_exception(request, exc):
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # as APIView.handle_exception
+        exc.auth_header = request.authenticators[0].authenticate_header(request)
+    response = exception_handler(exc, {'request': request})
+    headers = {name: response[name] for name in ('WWW-Authenticate', 'Retry-After') if response.has_header(name)}
+    return _render(request, response.data, response.status_code, headers)
+
+def _render(request, data, status_code=status.HTTP_200_OK, headers=None):
+    # as Response.rendered_content
+    renderer = request.accepted_renderer
+    content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+    content = renderer.render(data, request.accepted_media_type, {'request': request})
+    response = HttpResponse(content, status=status_code, content_type=content_type)
+    response['Vary'] = 'Accept'
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+# url name of the viewset route -> async view serving its GETs
+ASYNC_READ_VIEWS = {
+    'course-lessons-list': lesson_list,
+    'course-lessons-detail': lesson_detail,
+    'course-lessons-video': lesson_video,
+    'course-assignment-materials-list': material_list,
+}
+
+def with_async_reads(patterns):
+    '''
+    Routes of the router urls patterns which ASYNC_READ_VIEWS serve GETs of, the others as they are.
+    '''
+    return [
+        URLPattern(pattern.pattern, _dispatch(ASYNC_READ_VIEWS[pattern.name], pattern.callback), pattern.default_args, pattern.name)
+        if pattern.name in ASYNC_READ_VIEWS and 'format' not in pattern.pattern.regex.groupindex else pattern
+        for pattern in patterns
+    ]
+
+def _dispatch(async_view, viewset_view):
+    sync_view = sync_to_async(viewset_view)
+
+    # keeps cls, actions and csrf_exempt of the viewset view, e.g. for query budgets
+    @wraps(viewset_view)
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            drf_request = _get_drf_request(request)
+            # browsers get the browsable API of the viewset, which also answers what is not acceptable
+            renderer = drf_request.accepted_renderer
+            if renderer is not None and renderer.media_type != 'text/html':
+                return await async_view(drf_request, **kwargs)
+        return await sync_view(request, *args, **kwargs)
+    return view
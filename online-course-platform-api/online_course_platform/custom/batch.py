@@ -0,0 +1,140 @@
+import asyncio
+import io
+import json
+import re
+from asgiref.sync import async_to_sync
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from .membership import clear_memo, share_memo
+
+# several API requests in one round trip, dispatched in-process one after the other through the views of their paths.
+# sub-requests are made as the caller, authenticated once for the whole batch, and share the memo of custom.membership
+# until one of them writes. each runs on its own, a failing one does not roll back the ones before it.
+# paths and bodies may refer to the bodies of earlier responses, e.g. "{{assignments.results.0.id}}" where assignments
+# is the name (or the index) of an earlier sub-request. a string which is just a reference takes the type of the value
+
+REFERENCE = re.compile(r'\{\{\s*([\w-]+)((?:\.[\w-]+)*)\s*\}\}')
+
+# of sub-responses
+RESPONSE_HEADERS = ('Location', 'ETag')
+
+class FailedDependency(Exception):
+    pass
+
+def run_batch(request, sub_requests):
+    '''
+    Responses of the validated sub_requests (method, path, optional body and name) made as the user of the DRF request,
+    each {'status': ..., 'headers': {...}, 'body': ...}.
+    '''
+    responses = []
+    named = {}
+    for index, sub_request in enumerate(sub_requests):
+        try:
+            path = _substitute(sub_request['path'], responses, named)
+            body = _substitute(sub_request.get('body'), responses, named)
+        except FailedDependency as e:
+            response = _error(status.HTTP_424_FAILED_DEPENDENCY, str(e))
+        else:
+            response = _dispatch(request, sub_request['method'], str(path), body)
+        responses.append(response)
+        if sub_request.get('name'):
+            named[sub_request['name']] = index
+        if sub_request['method'] not in SAFE_METHODS:
+            # whatever was remembered about the user may have changed
+            clear_memo(request)
+    return responses
+
+def _dispatch(request, method, path, body):
+    path_info, _, query_string = path.partition('?')
+    try:
+        match = resolve(path_info)
+    except Resolver404:
+        return _error(status.HTTP_404_NOT_FOUND, 'Not found.')
+    if match.url_name == 'batch':
+        return _error(status.HTTP_400_BAD_REQUEST, 'Batches cannot be nested.')
+
+    sub_request = _build_request(request, method, path_info, query_string, body)
+    if asyncio.iscoroutinefunction(match.func):
+        # the async views of custom.async_views
+        response = async_to_sync(match.func)(sub_request, *match.args, **match.kwargs)
+    else:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+
+    if response.streaming:
+        response.close()
+        return _error(status.HTTP_400_BAD_REQUEST, 'Files cannot be fetched in batches.')
+    if hasattr(response, 'render'):
+        response.render()
+    content = response.content
+    if content and response.get('Content-Type', '').startswith('application/json'):
+        content = json.loads(content)
+    elif content:
+        content = content.decode(response.charset, errors='replace')
+    else:
+        content = None
+    return {
+        'status': response.status_code,
+        'headers': {header: response[header] for header in RESPONSE_HEADERS if response.has_header(header)},
+        'body': content,
+    }
+
+def _build_request(request, method, path_info, query_string, body):
+    http_request = request._request
+    content = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        # conditional and content negotiation headers are about the batch, not its parts
+        key: value for key, value in http_request.META.items()
+        if (key.startswith('HTTP_') and not key.startswith(('HTTP_IF_', 'HTTP_ACCEPT')))
+        or key in ('REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL', 'SCRIPT_NAME')
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(content),
+        'wsgi.url_scheme': http_request.scheme,
+    })
+    sub_request = WSGIRequest(environ)
+    if request.user.is_authenticated:
+        # DRF's Request takes these instead of authenticating again, see rest_framework.request.ForcedAuthentication
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+    share_memo(request, sub_request)
+    return sub_request
+
+def _substitute(value, responses, named):
+    if isinstance(value, str):
+        reference = REFERENCE.fullmatch(value)
+        if reference:
+            return _resolve(reference, responses, named)
+        return REFERENCE.sub(lambda reference: str(_resolve(reference, responses, named)), value)
+    if isinstance(value, list):
+        return [_substitute(item, responses, named) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, responses, named) for key, item in value.items()}
+    return value
+
+def _resolve(reference, responses, named):
+    name, keys = reference.group(1), reference.group(2)
+    index = named.get(name, int(name) if name.isdigit() else None)
+    if index is None or index >= len(responses):
+        raise FailedDependency(f'{reference.group(0)} refers to no earlier request.')
+    response = responses[index]
+    if response['status'] >= 400:
+        raise FailedDependency(f'{reference.group(0)} refers to a failed request.')
+
+    value = response['body']
+    for key in keys.split('.')[1:]:
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise FailedDependency(f'{reference.group(0)} is not in the response.')
+    return value
+
+def _error(status_code, detail):
+    return {'status': status_code, 'headers': {}, 'body': {'detail': detail}}
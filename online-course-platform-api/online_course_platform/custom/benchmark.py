@@ -0,0 +1,228 @@
+import itertools
+import json
+import math
+import statistics
+import threading
+import time
+import subprocess
+import urllib.error
+import urllib.request
+from collections import Counter
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.utils.text import compress_string
+from rest_framework import renderers as drf_renderers
+from . import compression, renderers
+from .models import Course, Teacher, Student, Lesson, Assignment
+from .querystats import record_queries
+
+# load benchmark of the API, either in-process through the Django handler or against a running server.
+# see the benchmark command for the scenarios
+
+class BenchmarkSetupError(Exception):
+    pass
+
+class InProcessTransport:
+    '''
+    Sends requests through the Django request handler of this process, counting their queries.
+    '''
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            # raise_request_exception=False: a failing view is a 500 like behind a server.
+            # not from INTERNAL_IPS, the debug toolbar would instrument every request
+            client = self.local.client = Client(
+                SERVER_NAME='localhost', REMOTE_ADDR='192.0.2.1', HTTP_ACCEPT='application/json', raise_request_exception=False
+            )
+
+        extra = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        with record_queries() as stats:
+            response = client.generic(
+                method, path, json.dumps(body) if body is not None else '', content_type='application/json', **extra
+            )
+        return response.status_code, response.content, stats.count
+
+    def release(self):
+        # called by every worker thread when done, each opened its own database connection
+        connections.close_all()
+
+class HttpTransport:
+    '''
+    Sends requests to a running server. Queries are read from X-Query-Count, see QueryStatsMiddleware.
+    '''
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read(), _query_count(response.headers)
+        except urllib.error.HTTPError as error:
+            return error.code, error.read(), _query_count(error.headers)
+
+    def release(self):
+        pass
+
+def _query_count(headers):
+    count = headers.get('X-Query-Count')
+    return int(count) if count is not None else None
+
+def run_scenario(transport, scenario, requests, concurrency, warmup):
+    '''
+    Send the request of scenario, a dict of name, method, path, body and token, requests times
+    from concurrency threads. Returns its latency percentiles, throughput and queries per request.
+    '''
+    def send():
+        started = time.perf_counter()
+        try:
+            status, _, queries = transport.request(scenario['method'], scenario['path'], scenario.get('body'), scenario.get('token'))
+        except Exception:
+            status, queries = None, None
+        return time.perf_counter() - started, status, queries
+
+    for _ in range(warmup):
+        send()
+
+    results = []
+    sent = itertools.count()
+
+    def work():
+        try:
+            while next(sent) < requests:
+                results.append(send())
+        finally:
+            transport.release()
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _, _ in results)
+    statuses = Counter(str(status) for _, status, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'name': scenario['name'],
+        'method': scenario['method'],
+        'path': scenario['path'],
+        'requests': requests,
+        'errors': sum(1 for _, status, _ in results if status is None or status >= 400),
+        'statuses': dict(statuses),
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'mean': round(statistics.mean(latencies), 2),
+            'max': round(latencies[-1], 2),
+        },
+        'queries_per_request': {
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries),
+        } if queries else None,
+    }
+
+def percentile(sorted_values, p):
+    # nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def measure_encoding(data, iterations):
+    '''
+    Mean encode time in ms and bytes of data as JSON rendered by DRF and by custom.renderers and as MessagePack,
+    uncompressed and compressed as custom.compression would. Encodings whose library is not installed are left out.
+    '''
+    encoders = [('json_stdlib', drf_renderers.JSONRenderer())]
+    if renderers.orjson is not None:
+        encoders.append(('json_orjson', renderers.JSONRenderer()))
+    if renderers.msgpack is not None:
+        encoders.append(('msgpack', renderers.MessagePackRenderer()))
+    compressors = [('gzip', compress_string)]
+    if compression.brotli is not None:
+        compressors.append(('br', lambda content: compression.brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)))
+
+    results = {}
+    for name, renderer in encoders:
+        content, encode_ms = _time(lambda: renderer.render(data), iterations)
+        result = results[name] = {'encode_ms': encode_ms, 'bytes': len(content)}
+        for encoding, compress in compressors:
+            compressed, compress_ms = _time(lambda: compress(content), iterations)
+            result[encoding] = {'compress_ms': compress_ms, 'bytes': len(compressed)}
+    return results
+
+def _time(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = function()
+    return result, round((time.perf_counter() - started) / iterations * 1000, 3)
+
+def get_scenarios(transport, prefix, password, names=None):
+    '''
+    The requests to benchmark, as seeded users of seed_data with the given prefix and password.
+    names: only the scenarios whose name starts with one of these, e.g. courses. or auth.jwt_create
+    '''
+    # a seeded student, one of their courses with content and a teacher of that course
+    student = Student.objects.filter(user__username__startswith=f'{prefix}_').select_related('user').order_by('id').first()
+    course = student and Course.objects.filter(students=student, lesson_count__gt=0, assignment_count__gt=0).order_by('id').first()
+    teacher = course and Teacher.objects.filter(courses=course).select_related('user').order_by('id').first()
+    if not teacher:
+        raise BenchmarkSetupError(f'no seeded data with the prefix "{prefix}", run seed_data first')
+    lesson = Lesson.objects.filter(course=course).order_by('id').first()
+    assignment = Assignment.objects.filter(course=course).order_by('id').first()
+
+    student_tokens = _login(transport, student.user, password)
+    teacher_tokens = _login(transport, teacher.user, password)
+    student_token, teacher_token = student_tokens['access'], teacher_tokens['access']
+
+    courses = f'/api/v1/courses/{course.id}'
+    scenarios = [
+        {'name': 'auth.jwt_create', 'method': 'POST', 'path': '/api/v1/auth/jwt/create/',
+         'body': {'username': student.user.username, 'password': password}},
+        {'name': 'auth.jwt_refresh', 'method': 'POST', 'path': '/api/v1/auth/jwt/refresh/',
+         'body': {'refresh': student_tokens['refresh']}},
+        {'name': 'auth.users_me', 'method': 'GET', 'path': '/api/v1/auth/users/me/', 'token': student_token},
+        {'name': 'course_categories.list', 'method': 'GET', 'path': '/api/v1/course_categories/'},
+        {'name': 'courses.list', 'method': 'GET', 'path': '/api/v1/courses/'},
+        {'name': 'courses.list_by_students', 'method': 'GET', 'path': '/api/v1/courses/?ordering=-student_count', 'token': student_token},
+        {'name': 'courses.retrieve', 'method': 'GET', 'path': f'{courses}/'},
+        {'name': 'courses.retrieve_expanded', 'method': 'GET', 'path': f'{courses}/?expand=teachers,students', 'token': student_token},
+        {'name': 'courses.students', 'method': 'GET', 'path': f'{courses}/students/', 'token': teacher_token},
+        {'name': 'teachers.me', 'method': 'GET', 'path': '/api/v1/teachers/me/', 'token': teacher_token},
+        {'name': 'students.me', 'method': 'GET', 'path': '/api/v1/students/me/', 'token': student_token},
+        {'name': 'join_requests.list', 'method': 'GET', 'path': f'/api/v1/teacher_join_course_requests/?course={course.id}', 'token': teacher_token},
+        {'name': 'lessons.list', 'method': 'GET', 'path': f'{courses}/lessons/', 'token': student_token},
+        {'name': 'lessons.retrieve', 'method': 'GET', 'path': f'{courses}/lessons/{lesson.id}/', 'token': student_token},
+        {'name': 'lessons.video', 'method': 'GET', 'path': f'{courses}/lessons/{lesson.id}/video/', 'token': student_token},
+        {'name': 'assignments.list', 'method': 'GET', 'path': f'{courses}/assignments/', 'token': student_token},
+        {'name': 'materials.list', 'method': 'GET', 'path': f'{courses}/assignments/{assignment.id}/materials/', 'token': student_token},
+    ]
+    if names:
+        scenarios = [scenario for scenario in scenarios if scenario['name'].startswith(tuple(names))]
+    return scenarios
+
+def _login(transport, user, password):
+    status, content, _ = transport.request('POST', '/api/v1/auth/jwt/create/', {'username': user.username, 'password': password})
+    if status != 200:
+        raise BenchmarkSetupError(f'logging in as {user.username} failed with {status}: {content[:200]!r}')
+    return json.loads(content)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,118 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from .replicas import use_primary
+
+# versioned response cache of the public catalog endpoints.
+# every model the responses are built from has a version counter, bumped by custom.signals on change,
+# and the cache key of a response contains the versions of the models it depends on
+
+def get_catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+def get_versions(names):
+    cache = get_catalog_cache()
+    keys = [_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # start from a timestamp such that an evicted version is never reused
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key, 0)
+    return [versions[key] for key in keys]
+
+def bump_versions(names):
+    cache = get_catalog_cache()
+    for name in set(names):
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.set(_version_key(name), time.time_ns(), None)
+
+def _version_key(name):
+    return f'catalog_version:{name}'
+
+class CachedCatalogMixin:
+    '''
+    Serves anonymous GET list/retrieve responses from the catalog cache, with a strong ETag of the
+    response body so that If-None-Match is answered with 304 without touching the database.
+    Declare the model names the response is built from in cache_dependencies.
+    '''
+    cache_dependencies = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        # the browsable API renders per user forms, only cache plain JSON and MessagePack for anonymous users
+        if request.user.is_authenticated or request.accepted_renderer.format not in ('json', 'msgpack'):
+            return handler(request, *args, **kwargs)
+
+        versions = get_versions(self.cache_dependencies)
+        key_material = f'{request.build_absolute_uri()}|{request.accepted_media_type}|{versions}'
+        cache_key = 'catalog_response:' + hashlib.sha256(key_material.encode()).hexdigest()
+
+        entry = self._get_or_build(cache_key, lambda: self._build_entry(request, handler, *args, **kwargs))
+        if not isinstance(entry, dict):
+            # not cacheable, e.g. 404
+            return entry
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        # weak comparison, custom.compression makes the etags of compressed responses weak
+        if if_none_match and entry['etag'] in [etag[2:] if etag.startswith('W/') else etag for etag in parse_etags(if_none_match)]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['ETag'] = entry['etag']
+        return response
+
+    def _build_entry(self, request, handler, *args, **kwargs):
+        # a lagging replica would have the entry cached under the new versions until the next change
+        with use_primary():
+            response = self.finalize_response(request, handler(request, *args, **kwargs), *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        response.render()
+        return {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'headers': [(header, value) for header, value in response.items() if header in ('Vary', 'Allow')],
+            'etag': '"%s"' % hashlib.sha256(response.content).hexdigest(),
+        }
+
+    def _get_or_build(self, cache_key, build):
+        cache = get_catalog_cache()
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry
+
+        # stampede protection, only the worker holding the lock rebuilds a hot key,
+        # the others wait for its result for a moment before building it themselves
+        lock_key = f'{cache_key}:lock'
+        if cache.add(lock_key, 1, settings.CATALOG_CACHE_LOCK_TIMEOUT):
+            try:
+                entry = build()
+                if isinstance(entry, dict):
+                    cache.set(cache_key, entry, settings.CATALOG_CACHE_TIMEOUT)
+                return entry
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.monotonic() + settings.CATALOG_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                return entry
+            if cache.get(lock_key) is None:
+                # the rebuild ended without caching anything
+                break
+        return build()
@@ -0,0 +1,102 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from .models import Assignment, AssignmentMaterial, Lesson, Tombstone
+from .replicas import use_primary
+
+# change feeds of courses, so clients sync the lessons, assignments and materials they hold instead of downloading
+# them again. a client passes the watermark of its last sync and gets the rows saved since (updated_at, auto_now)
+# and the ids of the rows deleted since (tombstones written by custom.signals). the watermark stays CHANGE_FEED_LAG
+# seconds behind the clock, so rows saved by transactions still open during a sync come with the next one:
+# rows are handed out at least once and clients upsert them by id.
+# nested teachers and courses are as of the sync, changing those does not touch updated_at
+
+class ChangesExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Deletions this old are not kept anymore, download the course again.'
+    default_code = 'changes_expired'
+
+TOMBSTONE_KINDS = {
+    Lesson: Tombstone.KindChoices.LESSON,
+    Assignment: Tombstone.KindChoices.ASSIGNMENT,
+    AssignmentMaterial: Tombstone.KindChoices.ASSIGNMENT_MATERIAL,
+}
+
+# kind -> key of the feed
+FEED_KEYS = {
+    Tombstone.KindChoices.LESSON: 'lessons',
+    Tombstone.KindChoices.ASSIGNMENT: 'assignments',
+    Tombstone.KindChoices.ASSIGNMENT_MATERIAL: 'materials',
+}
+
+def parse_watermark(value):
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise ParseError('updated_since must be an ISO 8601 date and time, e.g. the watermark of the last sync')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.utc)
+    return since
+
+def get_changes(course_id, since=None):
+    '''
+    Lessons, assignments and materials of the course saved at or after since and the ids of those deleted
+    at or after since, every row and no deletions without since. Includes the watermark for the next sync.
+    '''
+    now = timezone.now()
+    if since is not None and since < now - timedelta(seconds=settings.CHANGE_FEED_RETENTION):
+        raise ChangesExpired()
+    watermark = now - timedelta(seconds=settings.CHANGE_FEED_LAG)
+
+    lessons = Lesson.objects.filter(course_id=course_id).select_related('course', 'teacher', 'teacher__user')
+    assignments = Assignment.objects.filter(course_id=course_id).select_related('teacher', 'teacher__user')
+    materials = AssignmentMaterial.objects.filter(assignment__course_id=course_id)
+    if since is not None:
+        lessons = lessons.filter(updated_at__gte=since)
+        assignments = assignments.filter(updated_at__gte=since)
+        materials = materials.filter(updated_at__gte=since)
+
+    deleted = {key: [] for key in FEED_KEYS.values()}
+    # a lagging replica would miss rows saved before the watermark for good
+    with use_primary():
+        changes = {
+            'watermark': watermark,
+            'lessons': list(lessons.order_by('updated_at', 'id')),
+            'assignments': list(assignments.order_by('updated_at', 'id')),
+            'materials': list(materials.order_by('updated_at', 'id')),
+            'deleted': deleted,
+        }
+        if since is not None:
+            # materials of deleted assignments are gone with them, their tombstones are left to prune_tombstones
+            tombstones = Tombstone.objects.filter(
+                Q(course_id=course_id) | Q(assignment_id__in=Assignment.objects.filter(course_id=course_id).values('id')),
+                deleted_at__gte=since,
+            )
+            for kind, object_id in tombstones.order_by('deleted_at', 'id').values_list('kind', 'object_id'):
+                deleted[FEED_KEYS[kind]].append(object_id)
+    return changes
+
+def record_deletion(instance):
+    kind = TOMBSTONE_KINDS[type(instance)]
+    if kind == Tombstone.KindChoices.ASSIGNMENT_MATERIAL:
+        Tombstone.objects.create(kind=kind, object_id=instance.pk, assignment_id=instance.assignment_id)
+    else:
+        Tombstone.objects.create(kind=kind, object_id=instance.pk, course_id=instance.course_id)
+
+def prune_tombstones(batch_size=1000):
+    '''
+    Delete the tombstones older than CHANGE_FEED_RETENTION, returns how many.
+    '''
+    cutoff = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_RETENTION)
+    pruned = 0
+    while True:
+        ids = list(Tombstone.objects.filter(deleted_at__lt=cutoff).order_by('deleted_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return pruned
+        pruned += Tombstone.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+# brotli when installed and accepted by the client, else gzip. only API responses are compressed: files (ZIP archives,
+# videos, pictures) are either compressed already or served in ranges, which compressing would break
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/msgpack', 'text/')
+
+class CompressionMiddleware(MiddlewareMixin):
+    '''
+    Compresses responses of COMPRESSIBLE_TYPES of at least COMPRESSION_MIN_SIZE bytes, and streaming ones
+    as they stream.
+    '''
+    def process_response(self, request, response):
+        if (
+            response.has_header('Content-Encoding') or response.has_header('Accept-Ranges') or response.status_code == 206
+            or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+            or (not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE)
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            else:
+                content = compress_string(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # the bytes differ from the uncompressed ones, see custom.caching for If-None-Match
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+def choose_encoding(accept_encoding):
+    '''
+    'br', 'gzip' or None, from an Accept-Encoding header, e.g. "gzip, deflate, br" or "br;q=0.5, gzip".
+    '''
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        coding, _, params = coding.partition(';')
+        name, _, value = params.partition('=')
+        try:
+            quality = float(value) if name.strip().lower() == 'q' else 1.0
+        except ValueError:
+            quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    # the first of equally preferred ones
+    chosen, chosen_quality = None, 0.0
+    for encoding in ('br', 'gzip') if brotli is not None else ('gzip',):
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > chosen_quality:
+            chosen, chosen_quality = encoding, quality
+    return chosen
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    for item in sequence:
+        # flushed, parts of streamed responses are sent as they come
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
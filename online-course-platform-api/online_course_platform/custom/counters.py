@@ -0,0 +1,52 @@
+from collections import Counter, defaultdict
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Course, Student, Teacher, Lesson, Assignment, TeacherJoinCourseRequest
+
+# denormalized sizes of what belongs to a course, kept on Course and adjusted with F() expressions
+# by custom.signals and custom.enrollments. recount() rebuilds them from the source tables,
+# see the recount_courses command
+
+def count_of(model):
+    '''
+    Subquery counting the rows of model (with a course_id column) of the outer course.
+    '''
+    count = model.objects.filter(course_id=OuterRef('pk')).order_by().values('course_id').annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(count), 0)
+
+def counted_models():
+    return {
+        'student_count': Student.courses.through,
+        'teacher_count': Teacher.courses.through,
+        'lesson_count': Lesson,
+        'assignment_count': Assignment,
+        'join_request_count': TeacherJoinCourseRequest,
+    }
+
+COUNTER_FIELDS = ('student_count', 'teacher_count', 'lesson_count', 'assignment_count', 'join_request_count')
+
+def recount(course_ids, fields=COUNTER_FIELDS):
+    models = counted_models()
+    Course.objects.filter(id__in=set(course_ids)).update(**{field: count_of(models[field]) for field in fields})
+
+def recount_students(course_ids):
+    recount(course_ids, ['student_count'])
+
+def increment(field, course_ids):
+    '''
+    Add one to field of each course for every time it appears in course_ids.
+    '''
+    for delta, ids in _group_by_delta(course_ids).items():
+        Course.objects.filter(id__in=ids).update(**{field: F(field) + delta})
+
+def decrement(field, course_ids):
+    for delta, ids in _group_by_delta(course_ids).items():
+        # the counters are unsigned, a drifted counter stays as is until recounted
+        Course.objects.filter(id__in=ids, **{f'{field}__gte': delta}).update(**{field: F(field) - delta})
+
+def _group_by_delta(course_ids):
+    # one UPDATE per distinct delta instead of one per course
+    by_delta = defaultdict(list)
+    for course_id, delta in Counter(course_ids).items():
+        by_delta[delta].append(course_id)
+    return by_delta
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from .caching import get_catalog_cache, get_versions
+from .models import Assignment, Course, Lesson
+from .replicas import use_primary
+from .serializers import DashboardCourseSerializer
+
+# the courses of a student or teacher with the latest lessons and open assignments of each, in one response
+# instead of a lesson and an assignment list request per course. three queries however many courses there are.
+# cached per profile under the catalog versions (see custom.caching) of everything it shows,
+# so new lessons and assignments, edits of courses and roster changes show at once
+
+def latest_per_course(queryset, course_ids, limit):
+    '''
+    The latest limit rows of queryset (of a model with course_id and created_at) of each course, in one query.
+    '''
+    # numbered with ROW_NUMBER() in a derived table, Django 3.2 can neither slice prefetches nor filter on windows
+    ranked = queryset.filter(course_id__in=course_ids).annotate(
+        recency=Window(RowNumber(), partition_by=[F('course_id')], order_by=[F('created_at').desc(), F('id').desc()]),
+    ).values('id', 'recency')
+    sql, params = ranked.query.sql_with_params()
+    return queryset.filter(id__in=RawSQL(f'SELECT id FROM ({sql}) ranked WHERE recency <= %s', (*params, limit)))
+
+def get_dashboard(model, profile_id):
+    '''
+    Serialized courses of the Student or Teacher profile, with their latest DASHBOARD_LESSONS lessons
+    as latest_lessons and latest DASHBOARD_ASSIGNMENTS open assignments as latest_open_assignments.
+    '''
+    versions = get_versions(['course', 'lesson', 'assignment', model._meta.model_name])
+    cache_key = f"dashboard:{model._meta.model_name}:{profile_id}:{'.'.join(map(str, versions))}"
+    cache = get_catalog_cache()
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    # a lagging replica would have the dashboard cached under the new versions until the next change
+    with use_primary():
+        courses = list(Course.objects.filter(**{f'{model._meta.model_name}s': profile_id}).order_by('created_at', 'id'))
+        course_ids = [course.id for course in courses]
+        prefetch_related_objects(
+            courses,
+            Prefetch('lessons', to_attr='latest_lessons', queryset=latest_per_course(
+                Lesson.objects.all(), course_ids, settings.DASHBOARD_LESSONS,
+            ).order_by('-created_at', '-id')),
+            Prefetch('assignments', to_attr='latest_open_assignments', queryset=latest_per_course(
+                Assignment.objects.filter(allow_submit=True), course_ids, settings.DASHBOARD_ASSIGNMENTS,
+            ).order_by('-created_at', '-id')),
+        )
+    data = DashboardCourseSerializer(courses, many=True).data
+    cache.set(cache_key, data, settings.DASHBOARD_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import django
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+def check_persistent_connections():
+    '''
+    CONN_HEALTH_CHECKS of Django 4.1 for this Django: a connection kept open across requests (CONN_MAX_AGE)
+    is pinged before a request reuses it and reopened if the database went away meanwhile,
+    e.g. after wait_timeout or a failover, instead of failing the request.
+    '''
+    if django.VERSION >= (4, 1):
+        return
+    for connection in connections.all():
+        if connection.connection is not None and connection.settings_dict.get('CONN_HEALTH_CHECKS') \
+                and not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
+
+# Django 3.2 has no async ORM, async code runs its queries on a pool of ASYNC_DB_THREADS threads per process
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # created on first use, never in the gunicorn master since threads do not survive forking
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='async-db')
+    return _executor
+
+async def database_sync_to_async(func, *args, **kwargs):
+    '''
+    Runs func on one of the database threads. Each thread keeps its connection open across calls
+    (CONN_MAX_AGE), closed and health checked around every call as around the requests of a sync worker.
+    '''
+    def run():
+        close_old_connections()
+        check_persistent_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return await SyncToAsync(run, thread_sensitive=False, executor=_get_executor())()
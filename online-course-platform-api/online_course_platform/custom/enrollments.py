@@ -0,0 +1,222 @@
+import random
+import time
+from django.conf import settings
+from django.db import transaction, IntegrityError, OperationalError
+from django.db.models import Exists, F, OuterRef, Q
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .caching import bump_versions
+from .counters import recount, recount_students, decrement
+from .models import Course, Student, Teacher, TeacherJoinCourseRequest
+from .signals import batch_deletions, roster_changed
+
+# enrollments write the Student.courses through rows directly and keep Course.student_count in step.
+# every writer takes the row lock of the course first (the conditional UPDATE or select_for_update),
+# so the seat limit holds under concurrent enrollments while different courses never wait for each other.
+# the change is announced once with roster_changed instead of one m2m_changed per student
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+COURSE_FULL = 'course_full'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+FORBIDDEN = 'forbidden'
+
+class CourseFull(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The course has no seats left.'
+    default_code = 'course_full'
+
+class AlreadyEnrolled(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'You are already enrolled in this course.'
+    default_code = 'already_enrolled'
+
+class NotEnrolled(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'You are not enrolled in this course.'
+    default_code = 'not_enrolled'
+
+class EnrollmentBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The course is busy, please try again.'
+    default_code = 'enrollment_busy'
+
+def enroll(course_id, student_id):
+    '''
+    Take a seat of the course for the student. Raises CourseFull or AlreadyEnrolled.
+    '''
+    through = Student.courses.through
+
+    def take_seat():
+        with transaction.atomic():
+            # the seat is taken by one conditional UPDATE, which cannot go past the limit however many run at once
+            taken = Course.objects\
+                .filter(Q(seat_limit__isnull=True) | Q(student_count__lt=F('seat_limit')), pk=course_id)\
+                .update(student_count=F('student_count') + 1)
+            if not taken:
+                raise CourseFull()
+            try:
+                with transaction.atomic():
+                    through.objects.create(course_id=course_id, student_id=student_id)
+            except IntegrityError:
+                # give the seat back by rolling back the UPDATE
+                raise AlreadyEnrolled()
+            roster_changed.send(sender=Course, model=Student, course_ids=[course_id])
+
+    _retry_on_lock(take_seat)
+
+def unenroll(course_id, student_id):
+    through = Student.courses.through
+
+    def free_seat():
+        with transaction.atomic():
+            # same lock order as enroll(), the course row first
+            list(Course.objects.select_for_update().filter(pk=course_id).values_list('id'))
+            deleted, _ = through.objects.filter(course_id=course_id, student_id=student_id).delete()
+            if not deleted:
+                raise NotEnrolled()
+            Course.objects.filter(pk=course_id, student_count__gt=0).update(student_count=F('student_count') - 1)
+            roster_changed.send(sender=Course, model=Student, course_ids=[course_id])
+
+    _retry_on_lock(free_seat)
+
+def _retry_on_lock(func):
+    # deadlocks and lock wait timeouts (MySQL) or a locked database (SQLite) roll the transaction back,
+    # retry it a few times after a short random backoff
+    retries = settings.ENROLLMENT_LOCK_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except OperationalError:
+            if attempt == retries:
+                raise EnrollmentBusy()
+            time.sleep(random.uniform(0, settings.ENROLLMENT_LOCK_BACKOFF * 2 ** attempt))
+
+def bulk_enroll(course, values):
+    '''
+    Enroll the students given by id or email into the course, as long as it has seats left.
+    Returns one {'row', 'value', 'status', 'student'} result per value, in order.
+    '''
+    through = Student.courses.through
+    batch_size = settings.BULK_ENROLLMENT_BATCH_SIZE
+    results = []
+    seen = set()
+    enrolled = 0
+
+    with transaction.atomic():
+        course = Course.objects.select_for_update().get(pk=course.pk)
+        seats_left = None if course.seat_limit is None else max(course.seat_limit - course.student_count, 0)
+
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            student_ids = _resolve(batch)
+
+            candidates = set(student_ids.values()) - seen
+            already = set(through.objects.filter(course_id=course.id, student_id__in=candidates)
+                          .values_list('student_id', flat=True))
+
+            new_ids = []
+            for row, value in enumerate(batch, start=start):
+                student_id = student_ids.get(value)
+                if student_id is None:
+                    outcome = INVALID if not _is_id(value) and not _is_email(value) else NOT_FOUND
+                elif student_id in seen or student_id in already:
+                    outcome = ALREADY_ENROLLED
+                elif seats_left is not None and len(new_ids) >= seats_left:
+                    outcome = COURSE_FULL
+                else:
+                    outcome = ENROLLED
+                    new_ids.append(student_id)
+                    seen.add(student_id)
+                results.append({'row': row, 'value': value, 'status': outcome, 'student': student_id})
+
+            through.objects.bulk_create(
+                [through(course_id=course.id, student_id=student_id) for student_id in new_ids],
+                batch_size=batch_size,
+                # rows added meanwhile through Student.courses (e.g. the admin) do not take the course lock
+                ignore_conflicts=True,
+            )
+            if seats_left is not None:
+                seats_left -= len(new_ids)
+            enrolled += len(new_ids)
+
+        if enrolled:
+            recount_students([course.id])
+            roster_changed.send(sender=Course, model=Student, course_ids=[course.id])
+    return results
+
+def _resolve(values):
+    # one IN query for the ids and one for the emails of the batch
+    ids = set(int(value) for value in values if _is_id(value))
+    emails = set(value for value in values if _is_email(value))
+    by_id = set(Student.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+    # emails compare case-insensitively, as in MySQL's default collation. the lowercased ones are asked for too,
+    # for case-sensitive databases
+    emails |= set(email.lower() for email in emails)
+    by_email = {
+        email.lower(): student_id
+        for email, student_id in Student.objects.filter(user__email__in=emails).values_list('user__email', 'id')
+    } if emails else {}
+
+    student_ids = {}
+    for value in values:
+        if _is_id(value) and int(value) in by_id:
+            student_ids[value] = int(value)
+        elif value.lower() in by_email:
+            student_ids[value] = by_email[value.lower()]
+    return student_ids
+
+def _is_id(value):
+    return value.isdigit()
+
+def _is_email(value):
+    return '@' in value
+
+def decide_join_requests(user, decisions):
+    '''
+    Accept or reject teacher join requests, given as {request id: accept}, on behalf of user.
+    Only requests of courses user teaches are processed. Returns {request id: outcome}.
+    '''
+    through = Teacher.courses.through
+    outcomes = {request_id: NOT_FOUND for request_id in decisions}
+    with transaction.atomic():
+        # the requests and whether user teaches their course, in one query. locked until the commit,
+        # a concurrent decision on the same requests waits and then finds them gone
+        requests = list(TeacherJoinCourseRequest.objects.select_for_update().filter(id__in=decisions).annotate(
+            authorized=Exists(through.objects.filter(course_id=OuterRef('course_id'), teacher__user_id=user.id))
+        ).values_list('id', 'teacher_id', 'course_id', 'authorized'))
+
+        accepted = []
+        processed = {}
+        for request_id, teacher_id, course_id, authorized in requests:
+            if not authorized:
+                outcomes[request_id] = FORBIDDEN
+                continue
+            processed[request_id] = course_id
+            if decisions[request_id]:
+                outcomes[request_id] = ACCEPTED
+                accepted.append((teacher_id, course_id))
+            else:
+                outcomes[request_id] = REJECTED
+        if not processed:
+            return outcomes
+
+        # a teacher may have joined meanwhile
+        through.objects.bulk_create(
+            [through(teacher_id=teacher_id, course_id=course_id) for teacher_id, course_id in accepted],
+            ignore_conflicts=True,
+        )
+        # the counters and the catalog version once for the decision, not once per request
+        with batch_deletions() as deleted:
+            TeacherJoinCourseRequest.objects.filter(id__in=list(processed)).delete()
+        decrement('join_request_count', [request.course_id for request in deleted[TeacherJoinCourseRequest]])
+        transaction.on_commit(lambda: bump_versions(['teacherjoincourserequest']))
+        if accepted:
+            accepted_course_ids = set(course_id for _, course_id in accepted)
+            recount(accepted_course_ids, ['teacher_count'])
+            roster_changed.send(sender=Course, model=Teacher, course_ids=accepted_course_ids)
+    return outcomes
@@ -0,0 +1,53 @@
+import io
+from PIL import Image, ImageOps
+
+# image processing run in the worker processes of custom.profile_pictures. nothing here needs django,
+# so the workers need not set it up whichever way they are started
+
+FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+class ImageRejected(Exception):
+    pass
+
+def render_profile_picture(data, extension, sizes, quality, max_pixels):
+    '''
+    Decode an uploaded picture, upright it by its EXIF orientation and encode it again without metadata
+    (EXIF, XMP, comments, GPS) in its own format and as square WebP thumbnails of every size.
+    Returns (the cleaned original, {size: webp bytes}).
+    '''
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > max_pixels:
+            # checked before decoding, a small file can hold a huge image
+            raise ImageRejected(f'{image.width}x{image.height} pixels is more than {max_pixels}')
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ImageRejected(str(e))
+
+    # only the colour profile survives, it is no personal data and dropping it would shift colours.
+    # a CMYK profile does not fit the converted pixels
+    icc_profile = image.info.get('icc_profile') if image.mode != 'CMYK' else None
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+
+    image_format = FORMATS[extension.lower()]
+    original = _encode(image.convert('RGB') if image_format == 'JPEG' else image, image_format, quality=95, icc_profile=icc_profile)
+
+    thumbnails = {}
+    for size in sizes:
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        thumbnails[size] = _encode(thumbnail, 'WEBP', quality=quality, icc_profile=icc_profile)
+    return original, thumbnails
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+def _encode(image, image_format, icc_profile=None, **options):
+    if image_format == 'PNG':
+        # lossless, quality does not apply
+        options = {'optimize': True}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
@@ -0,0 +1,48 @@
+import json
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from custom.benchmark import InProcessTransport, HttpTransport, BenchmarkSetupError, get_scenarios, run_scenario, git_commit
+
+class Command(BaseCommand):
+    help = 'Benchmark the API endpoints with the users generated by seed_data, reporting latency, throughput and queries as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', help='e.g. http://127.0.0.1:8000, requests go through this process when omitted.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario sent first.')
+        parser.add_argument('--scenario', action='append', help='Only run the scenarios with this name prefix, e.g. courses. or auth.jwt_create')
+        parser.add_argument('--prefix', default='seed', help='--prefix given to seed_data.')
+        parser.add_argument('--password', default='seed-password', help='--password given to seed_data.')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        transport = HttpTransport(options['base_url']) if options['base_url'] else InProcessTransport()
+        try:
+            scenarios = get_scenarios(transport, options['prefix'], options['password'], options['scenario'])
+
+            results = []
+            for scenario in scenarios:
+                result = run_scenario(transport, scenario, options['requests'], options['concurrency'], options['warmup'])
+                self.stderr.write(f"{result['name']}: p50 {result['latency_ms']['p50']}ms, p99 {result['latency_ms']['p99']}ms, {result['throughput_rps']} req/s")
+                results.append(result)
+        except BenchmarkSetupError as error:
+            raise CommandError(str(error))
+        finally:
+            transport.release()
+
+        report = json.dumps({
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'target': options['base_url'] or 'in-process',
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'scenarios': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
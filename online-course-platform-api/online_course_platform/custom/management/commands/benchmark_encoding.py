@@ -0,0 +1,55 @@
+import json
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from custom.benchmark import InProcessTransport, BenchmarkSetupError, get_scenarios, measure_encoding, git_commit
+
+# the endpoints with the biggest responses
+DEFAULT_SCENARIOS = ('courses.list', 'courses.retrieve_expanded', 'courses.students', 'lessons.list', 'assignments.list')
+
+class Command(BaseCommand):
+    help = 'Benchmark encoding the responses of the biggest endpoints, as JSON and MessagePack, uncompressed and compressed, reporting encode times and bytes as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Encodings per response and encoding.')
+        parser.add_argument('--page-size', type=int, default=settings.MAX_PAGE_SIZE, help='?page_size= of list endpoints.')
+        parser.add_argument('--scenario', action='append', help='Only these scenarios of the benchmark command, by name prefix.')
+        parser.add_argument('--prefix', default='seed', help='--prefix given to seed_data.')
+        parser.add_argument('--password', default='seed-password', help='--password given to seed_data.')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+        transport = InProcessTransport()
+        try:
+            scenarios = get_scenarios(transport, options['prefix'], options['password'], options['scenario'] or DEFAULT_SCENARIOS)
+
+            results = []
+            for scenario in scenarios:
+                path = scenario['path'] + ('&' if '?' in scenario['path'] else '?') + f"page_size={options['page_size']}"
+                status, content, _ = transport.request('GET', path, token=scenario.get('token'))
+                if status != 200:
+                    raise CommandError(f'{path} answered {status}: {content[:200]!r}')
+                encodings = measure_encoding(json.loads(content), options['iterations'])
+                self.stderr.write(f"{scenario['name']}: " + ', '.join(
+                    f"{name} {result['encode_ms']}ms {result['bytes']}B (gzip {result['gzip']['bytes']}B)"
+                    for name, result in encodings.items()
+                ))
+                results.append({'name': scenario['name'], 'path': path, 'encodings': encodings})
+        except BenchmarkSetupError as error:
+            raise CommandError(str(error))
+        finally:
+            transport.release()
+
+        report = json.dumps({
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'iterations': options['iterations'],
+            'scenarios': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
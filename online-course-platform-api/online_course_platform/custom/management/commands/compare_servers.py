@@ -0,0 +1,108 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from custom.benchmark import HttpTransport, BenchmarkSetupError, get_scenarios, run_scenario, git_commit
+
+# name -> command (without the address) and environment of the server
+GUNICORN = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind']
+SERVERS = {
+    'runserver': ([sys.executable, 'manage.py', 'runserver', '--noreload'], {}),
+    'gunicorn': (GUNICORN, {}),
+    # ASGI with the async views, and with the sync viewsets only
+    'uvicorn': (GUNICORN, {'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker', 'ASYNC_VIEWS': 'yes'}),
+    'uvicorn-sync': (GUNICORN, {'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker', 'ASYNC_VIEWS': 'no'}),
+}
+
+class Command(BaseCommand):
+    help = 'Compare the startup time and throughput of runserver and the gunicorn.conf.py servers on the data of seed_data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', choices=list(SERVERS), help='Default: runserver and gunicorn.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario sent first.')
+        parser.add_argument('--scenario', action='append', help='Only run the scenarios with this name prefix.')
+        parser.add_argument('--prefix', default='seed', help='--prefix given to seed_data.')
+        parser.add_argument('--password', default='seed-password', help='--password given to seed_data.')
+        parser.add_argument('--query-stats', action='store_true', help='Report queries per request, QueryStatsMiddleware makes the async views run synchronously.')
+        parser.add_argument('--startup-timeout', type=float, default=60)
+        parser.add_argument('--output', help='Write the report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        servers = {}
+        for server in options['server'] or ['runserver', 'gunicorn']:
+            port = _free_port()
+            command, environment = SERVERS[server]
+            command = command + [f'127.0.0.1:{port}']
+            base_url = f'http://127.0.0.1:{port}'
+
+            environment = {**os.environ, **environment}
+            if options['query_stats']:
+                # X-Query-Count of QueryStatsMiddleware
+                environment['QUERY_STATS'] = 'yes'
+            started = time.perf_counter()
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                startup = self._wait_until_serving(process, base_url, started, options['startup_timeout'])
+                self.stderr.write(f'{server}: serving after {startup:.2f}s')
+
+                transport = HttpTransport(base_url)
+                try:
+                    scenarios = get_scenarios(transport, options['prefix'], options['password'], options['scenario'])
+                except BenchmarkSetupError as error:
+                    raise CommandError(str(error))
+                results = []
+                for scenario in scenarios:
+                    result = run_scenario(transport, scenario, options['requests'], options['concurrency'], options['warmup'])
+                    self.stderr.write(f"{server} {result['name']}: p50 {result['latency_ms']['p50']}ms, {result['throughput_rps']} req/s")
+                    results.append(result)
+            finally:
+                process.terminate()
+                process.wait()
+
+            servers[server] = {
+                'command': ' '.join(command[1:]),
+                'startup_seconds': round(startup, 2),
+                'total_throughput_rps': round(sum(result['throughput_rps'] or 0 for result in results), 1),
+                'scenarios': results,
+            }
+
+        report = json.dumps({
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'servers': servers,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    def _wait_until_serving(self, process, base_url, started, timeout):
+        # serving = answering the API root, any response counts
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise CommandError(f'the server exited with {process.returncode}')
+            try:
+                urllib.request.urlopen(f'{base_url}/api/v1/', timeout=1).close()
+                return time.perf_counter() - started
+            except urllib.error.HTTPError:
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise CommandError(f'the server did not answer within {timeout}s')
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
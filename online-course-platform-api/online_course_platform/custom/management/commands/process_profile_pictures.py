@@ -0,0 +1,44 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from custom.models import Teacher, Student
+from custom.profile_pictures import is_processed, run_job
+
+class Command(BaseCommand):
+    help = 'Clean the profile pictures of teachers and students and make their thumbnails, for pictures without up to date ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Processes decoding and encoding the pictures.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of profiles read per query.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = {True: 0, False: 0, None: 0}
+        # threads read and store the files while the processes work on others
+        with ProcessPoolExecutor(max_workers=options['processes']) as processes, \
+                ThreadPoolExecutor(max_workers=options['processes'] * 2) as threads:
+            for model in (Teacher, Student):
+                pks = self._unprocessed(model, options['batch_size'])
+                for result in threads.map(lambda pk: run_job(model, pk, processes), pks):
+                    counts[result] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'processed {counts[True]} profile pictures in {time.perf_counter() - started:.1f}s, '
+            f'skipped {counts[False]}, failed {counts[None]} (see the log)'
+        ))
+
+    def _unprocessed(self, model, batch_size):
+        last_id = 0
+        while True:
+            # keyset over the primary key, is_processed compares within the row which not every backend does in SQL
+            rows = list(
+                model.objects.filter(id__gt=last_id).exclude(profile_picture='').exclude(profile_picture=None)
+                .order_by('id').values('id', 'profile_picture', 'profile_picture_variants')[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            for row in rows:
+                if not is_processed(row['profile_picture'], row['profile_picture_variants']):
+                    yield row['id']
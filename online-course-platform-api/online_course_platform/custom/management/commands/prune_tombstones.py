@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from custom.changes import prune_tombstones
+
+class Command(BaseCommand):
+    help = 'Delete the tombstones of the course change feeds older than CHANGE_FEED_RETENTION.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of tombstones deleted per query.')
+
+    def handle(self, *args, **options):
+        pruned = prune_tombstones(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'deleted {pruned} tombstones'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from custom.counters import COUNTER_FIELDS, count_of, counted_models, recount
+from custom.models import Course
+
+class Command(BaseCommand):
+    help = 'Recount the denormalized counters of courses from their source tables, repairing any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of courses checked per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the courses whose counters drifted.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        models = counted_models()
+        actual = {f'actual_{field}': count_of(models[field]) for field in COUNTER_FIELDS}
+        drifted = Q()
+        for field in COUNTER_FIELDS:
+            drifted |= ~Q(**{field: F(f'actual_{field}')})
+
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            # keyset over the primary key, every batch is one indexed range scan
+            ids = list(Course.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+
+            with transaction.atomic():
+                drifted_ids = list(Course.objects.filter(id__in=ids).annotate(**actual).filter(drifted).values_list('id', flat=True))
+                if drifted_ids and not options['dry_run']:
+                    recount(drifted_ids)
+            repaired += len(drifted_ids)
+            if drifted_ids:
+                self.stdout.write(f'courses with drifted counters: {", ".join(map(str, drifted_ids))}')
+
+        action = 'found' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'checked {checked} courses, {action} {repaired}'))
@@ -0,0 +1,119 @@
+import random
+import time
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from core.models import User
+from custom.caching import bump_versions
+from custom.counters import recount
+from custom.models import CourseCategory, Course, Teacher, Student, Lesson, Assignment, AssignmentMaterial
+
+class Command(BaseCommand):
+    help = 'Generate synthetic categories, courses, teachers, students, enrollments, lessons, assignments and materials.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--courses', type=int, default=1000)
+        parser.add_argument('--teachers', type=int, default=200)
+        parser.add_argument('--students', type=int, default=10000)
+        parser.add_argument('--teachers-per-course', type=int, default=2)
+        parser.add_argument('--enrollments-per-student', type=int, default=5)
+        parser.add_argument('--lessons-per-course', type=int, default=10)
+        parser.add_argument('--assignments-per-course', type=int, default=5)
+        parser.add_argument('--materials-per-assignment', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per statement and transaction.')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the generated usernames, emails and titles.')
+        parser.add_argument('--password', default='seed-password', help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed generates the same data.')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        rng = random.Random(options['seed'])
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'users with the prefix "{prefix}" exist already, pass another --prefix')
+
+        # hashing is by design slow, every user shares one hash instead of paying for it a million times
+        password = make_password(options['password'])
+
+        category_ids = self._create(CourseCategory, (
+            CourseCategory(title=f'{prefix} category {i}') for i in range(options['categories'])
+        ))
+        course_ids = self._create(Course, (
+            Course(title=f'{prefix} course {i}', category_id=rng.choice(category_ids)) for i in range(options['courses'])
+        ))
+        teacher_ids = self._create_profiles(Teacher, settings.USER_ROLE_TEACHER, options['teachers'], prefix, password)
+        student_ids = self._create_profiles(Student, settings.USER_ROLE_STUDENT, options['students'], prefix, password)
+
+        teachers_of = {
+            course_id: rng.sample(teacher_ids, min(options['teachers_per_course'], len(teacher_ids)))
+            for course_id in course_ids
+        }
+        through = Teacher.courses.through
+        self._create(through, (
+            through(course_id=course_id, teacher_id=teacher_id)
+            for course_id, teacher_ids_of_course in teachers_of.items() for teacher_id in teacher_ids_of_course
+        ), ids=False)
+        through = Student.courses.through
+        self._create(through, (
+            through(course_id=course_id, student_id=student_id)
+            for student_id in student_ids
+            for course_id in rng.sample(course_ids, min(options['enrollments_per_student'], len(course_ids)))
+        ), ids=False)
+
+        def teacher_of(course_id):
+            return rng.choice(teachers_of[course_id]) if teachers_of[course_id] else None
+
+        self._create(Lesson, (
+            Lesson(title=f'{prefix} lesson {i}', course_id=course_id, teacher_id=teacher_of(course_id), video='course/videos/seed.mp4')
+            for course_id in course_ids for i in range(options['lessons_per_course'])
+        ), ids=False)
+        assignment_ids = self._create(Assignment, (
+            Assignment(title=f'{prefix} assignment {i}', course_id=course_id, teacher_id=teacher_of(course_id))
+            for course_id in course_ids for i in range(options['assignments_per_course'])
+        ))
+        self._create(AssignmentMaterial, (
+            AssignmentMaterial(name=f'{prefix} material {i}', assignment_id=assignment_id, file='assignment/seed.pdf')
+            for assignment_id in assignment_ids for i in range(options['materials_per_assignment'])
+        ), ids=False)
+
+        # bulk_create sends no signals, set the counters and invalidate the catalog cache once at the end
+        for start in range(0, len(course_ids), self.batch_size):
+            recount(course_ids[start:start + self.batch_size])
+        bump_versions(['coursecategory', 'course', 'teacher', 'student', 'user', 'lesson', 'assignment'])
+        self.stdout.write(self.style.SUCCESS(f'seeded, users log in as {prefix}_student_0 or {prefix}_teacher_0'))
+
+    def _create_profiles(self, model, role, count, prefix, password):
+        name = model.__name__.lower()
+        user_ids = self._create(User, (
+            User(
+                username=f'{prefix}_{name}_{i}', email=f'{prefix}_{name}_{i}@example.com', password=password,
+                first_name=name.capitalize(), last_name=str(i), role=role,
+            )
+            for i in range(count)
+        ))
+        return self._create(model, (model(user_id=user_id) for user_id in user_ids))
+
+    def _create(self, model, objects, ids=True):
+        '''
+        Insert the objects, a generator, one batch at a time. Returns the ids of the new rows,
+        assuming nobody else inserts into the table meanwhile (not every backend returns them from bulk_create).
+        '''
+        started = time.perf_counter()
+        before = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        created = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+            created += len(batch)
+        self.stdout.write(f'{model._meta.label}: {created} in {time.perf_counter() - started:.1f}s')
+
+        if not ids:
+            return None
+        return list(model.objects.filter(id__gt=before).order_by('id').values_list('id', flat=True))
@@ -0,0 +1,111 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from core.authentication import ClaimsUser
+from .models import Teacher, Student
+
+# answers "is the requesting user teacher/student of course C" with a single indexed EXISTS query,
+# memoized on the request and optionally cached across requests for COURSE_MEMBERSHIP_CACHE_TTL seconds
+
+def is_course_teacher(request, course_id):
+    return _is_member(request, Teacher, course_id)
+
+def is_course_student(request, course_id):
+    return _is_member(request, Student, course_id)
+
+def get_teacher_id(request):
+    return _get_profile_id(request, Teacher)
+
+def get_student_id(request):
+    return _get_profile_id(request, Student)
+
+def invalidate_course_membership(course_ids):
+    # bumping the version orphans every cached answer of the course
+    for course_id in set(course_ids):
+        try:
+            cache.incr(_version_key(course_id))
+        except ValueError:
+            # no version yet, thus nothing has been cached for this course
+            pass
+
+def share_memo(request, other_request):
+    '''
+    Let other_request, e.g. a part of a batch made as the same user, reuse the answers memoized for request.
+    '''
+    other_request._course_membership = _request_memo(request)
+
+def clear_memo(request):
+    _request_memo(request).clear()
+
+def _is_member(request, model, course_id):
+    user_id = request.user.id
+    if not user_id:
+        return False
+
+    if isinstance(request.user, ClaimsUser) and _profile_claim(request.user, model) is None:
+        # the token tells the user has no such profile
+        return False
+
+    memo = _request_memo(request)
+    memo_key = (model.__name__, str(course_id))
+    if memo_key not in memo:
+        memo[memo_key] = _cached_is_member(request, model, user_id, course_id)
+    return memo[memo_key]
+
+def _cached_is_member(request, model, user_id, course_id):
+    ttl = getattr(settings, 'COURSE_MEMBERSHIP_CACHE_TTL', 0)
+    if not ttl:
+        return _query_is_member(request, model, user_id, course_id)
+
+    cache_key = f'course_membership:{model.__name__}:{course_id}:{_get_version(course_id)}:{user_id}'
+    is_member = cache.get(cache_key)
+    if is_member is None:
+        is_member = _query_is_member(request, model, user_id, course_id)
+        cache.set(cache_key, is_member, ttl)
+    return is_member
+
+def _query_is_member(request, model, user_id, course_id):
+    # hits the unique (profile_id, course_id) index of the through table,
+    # joined by the unique user_id unless the token carries the profile id
+    profile = model.__name__.lower()
+    if isinstance(request.user, ClaimsUser):
+        lookup = {f'{profile}_id': _profile_claim(request.user, model)}
+    else:
+        lookup = {f'{profile}__user_id': user_id}
+    return model.courses.through.objects.filter(course_id=course_id, **lookup).exists()
+
+def _get_profile_id(request, model):
+    user = request.user
+    if isinstance(user, ClaimsUser):
+        return _profile_claim(user, model)
+    if not user.id:
+        return None
+
+    memo = _request_memo(request)
+    memo_key = (model.__name__, 'profile')
+    if memo_key not in memo:
+        memo[memo_key] = model.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    return memo[memo_key]
+
+def _profile_claim(user, model):
+    return getattr(user, f'{model.__name__.lower()}_id')
+
+def _get_version(course_id):
+    version_key = _version_key(course_id)
+    version = cache.get(version_key)
+    if version is None:
+        # start from a timestamp such that an evicted version is never reused
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key, 0)
+    return version
+
+def _version_key(course_id):
+    return f'course_membership_version:{course_id}'
+
+def _request_memo(request):
+    # keep the memo on the django HttpRequest behind the DRF Request, so permissions and views share it
+    http_request = getattr(request, '_request', request)
+    memo = getattr(http_request, '_course_membership', None)
+    if memo is None:
+        memo = http_request._course_membership = {}
+    return memo
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.19 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom', '0004_alter_lesson_video'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['course', 'created_at', 'id'], name='custom_assi_course__ca979c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignmentmaterial',
+            index=models.Index(fields=['assignment', 'created_at', 'id'], name='custom_assi_assignm_2aae9a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['created_at', 'id'], name='custom_cour_created_714b97_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'created_at', 'id'], name='custom_less_course__97d309_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teacherjoincourserequest',
+            index=models.Index(fields=['created_at', 'id'], name='custom_teac_created_5d9876_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.19 on 2026-10-18 13:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_students(apps, schema_editor):
+    Course = apps.get_model('custom', 'Course')
+    through = apps.get_model('custom', 'Student').courses.through
+    count = through.objects.filter(course_id=OuterRef('pk')).order_by().values('course_id').annotate(count=Count('*')).values('count')
+    Course.objects.update(student_count=Coalesce(Subquery(count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom', '0006_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='seat_limit',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='student_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_students, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.19 on 2026-10-18 13:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_all(apps, schema_editor):
+    Course = apps.get_model('custom', 'Course')
+    counted = {
+        'teacher_count': apps.get_model('custom', 'Teacher').courses.through,
+        'lesson_count': apps.get_model('custom', 'Lesson'),
+        'assignment_count': apps.get_model('custom', 'Assignment'),
+        'join_request_count': apps.get_model('custom', 'TeacherJoinCourseRequest'),
+    }
+    counts = {}
+    for field, model in counted.items():
+        count = model.objects.filter(course_id=OuterRef('pk')).order_by().values('course_id').annotate(count=Count('*')).values('count')
+        counts[field] = Coalesce(Subquery(count), 0)
+    Course.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom', '0007_course_seats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='assignment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='join_request_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='teacher_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['student_count', 'id'], name='custom_cour_student_5776f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['teacher_count', 'id'], name='custom_cour_teacher_e41f5f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['lesson_count', 'id'], name='custom_cour_lesson__8c26f1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['assignment_count', 'id'], name='custom_cour_assignm_71fb24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['join_request_count', 'id'], name='custom_cour_join_re_eb4c53_idx'),
+        ),
+        migrations.RunPython(count_all, migrations.RunPython.noop),
+    ]
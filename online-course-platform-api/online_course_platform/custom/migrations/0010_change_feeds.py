@@ -0,0 +1,61 @@
+# Generated by Django 3.2.19 on 2026-10-18 13:58
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # the rows existing before have not been updated since they were created, as far as anybody knows
+    AssignmentMaterial = apps.get_model('custom', 'AssignmentMaterial')
+    AssignmentMaterial.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom', '0009_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('lesson', 'Lesson'), ('assignment', 'Assignment'), ('assignment_material', 'Assignment material')], max_length=32)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('course_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('assignment_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='assignmentmaterial',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['course', 'updated_at', 'id'], name='custom_assi_course__06892d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignmentmaterial',
+            index=models.Index(fields=['assignment', 'updated_at', 'id'], name='custom_assi_assignm_b0724b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'updated_at', 'id'], name='custom_less_course__c19939_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['course_id', 'deleted_at'], name='custom_tomb_course__6d21f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['assignment_id', 'deleted_at'], name='custom_tomb_assignm_f0cc41_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='custom_tomb_deleted_664b45_idx'),
+        ),
+    ]
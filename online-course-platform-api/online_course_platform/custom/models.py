@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.conf import settings
 from django.core.validators import FileExtensionValidator
@@ -16,6 +17,25 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     # TODO: allow category to be null
     category = models.ForeignKey(CourseCategory, on_delete=models.CASCADE, related_name='courses')
+    # null for no limit
+    seat_limit = models.PositiveIntegerField(null=True, blank=True)
+    # counters maintained by custom.counters, the course list orders and filters by them
+    student_count = models.PositiveIntegerField(default=0, editable=False)
+    teacher_count = models.PositiveIntegerField(default=0, editable=False)
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    assignment_count = models.PositiveIntegerField(default=0, editable=False)
+    # pending teacher join requests
+    join_request_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['student_count', 'id']),
+            models.Index(fields=['teacher_count', 'id']),
+            models.Index(fields=['lesson_count', 'id']),
+            models.Index(fields=['assignment_count', 'id']),
+            models.Index(fields=['join_request_count', 'id']),
+        ]
 
     def __str__(self) -> str:
         return self.title
@@ -27,6 +47,8 @@ class Teacher(models.Model):
         FileSizeValidator(max_mb=1),
         FileExtensionValidator(allowed_extensions=['jpg', 'png', 'webp'])
         ])
+    # thumbnails of the profile picture, see custom.profile_pictures
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self) -> str:
         return f'{self.user.first_name} {self.user.last_name}'
@@ -35,6 +57,11 @@ class TeacherJoinCourseRequest(models.Model):
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='teacher_join_course_requests')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='teacher_join_course_requests')
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
     
 class Student(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -43,6 +70,8 @@ class Student(models.Model):
         FileSizeValidator(max_mb=1),
         FileExtensionValidator(allowed_extensions=['jpg', 'png', 'webp'])
         ])
+    # thumbnails of the profile picture, see custom.profile_pictures
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self) -> str:
         return f'{self.user.first_name} {self.user.last_name}'
@@ -56,6 +85,12 @@ class Assignment(models.Model):
     teacher = models.ForeignKey(Teacher, null=True, blank=True, on_delete=models.SET_NULL, related_name='assignments')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='assignments')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'created_at', 'id']),
+            models.Index(fields=['course', 'updated_at', 'id']),
+        ]
+
     def __str__(self) -> str:
         return self.title
 
@@ -66,8 +101,15 @@ class AssignmentMaterial(models.Model):
         FileExtensionValidator(allowed_extensions=['jpg', 'png', 'webp', 'zip', 'pdf', 'txt', 'docx', 'xlsx', 'pptx'])
     ])
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='materials')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['assignment', 'created_at', 'id']),
+            models.Index(fields=['assignment', 'updated_at', 'id']),
+        ]
+
 class Lesson(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
@@ -81,4 +123,70 @@ class Lesson(models.Model):
         validators=[FileSizeValidator(max_mb=10), FileExtensionValidator(allowed_extensions=['mp4', 'webm', 'ogg'])],
         null=True, 
         blank=True
-    )
\ No newline at end of file
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'created_at', 'id']),
+            models.Index(fields=['course', 'updated_at', 'id']),
+        ]
+
+class Tombstone(models.Model):
+    '''
+    A deleted lesson, assignment or assignment material, for the change feeds of custom.changes.
+    '''
+    class KindChoices(models.TextChoices):
+        LESSON = 'lesson', 'Lesson'
+        ASSIGNMENT = 'assignment', 'Assignment'
+        ASSIGNMENT_MATERIAL = 'assignment_material', 'Assignment material'
+
+    kind = models.CharField(max_length=32, choices=KindChoices.choices)
+    object_id = models.PositiveBigIntegerField()
+    # plain ids, not foreign keys, the course or assignment is usually deleted too.
+    # course_id of lessons and assignments, assignment_id of materials (finding their course would cost a query each)
+    course_id = models.PositiveBigIntegerField(null=True, blank=True)
+    assignment_id = models.PositiveBigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['course_id', 'deleted_at']),
+            models.Index(fields=['assignment_id', 'deleted_at']),
+            models.Index(fields=['deleted_at']),
+        ]
+
+class ChunkedUpload(models.Model):
+    class TargetChoices(models.TextChoices):
+        LESSON_VIDEO = 'lesson_video', 'Lesson video'
+        ASSIGNMENT_MATERIAL = 'assignment_material', 'Assignment material'
+
+    class StatusChoices(models.TextChoices):
+        UPLOADING = 'uploading', 'Uploading'
+        COMPLETE = 'complete', 'Complete'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chunked_uploads')
+    target = models.CharField(max_length=32, choices=TargetChoices.choices)
+    # id of the lesson, or of the assignment the new material is attached to
+    object_id = models.PositiveBigIntegerField()
+    name = models.CharField(max_length=255, blank=True) # material name
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # name of the file in the storage of the target field, reserved when the upload starts
+    storage_name = models.CharField(max_length=255)
+    s3_upload_id = models.CharField(max_length=1024, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=StatusChoices.choices, default=StatusChoices.UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class ChunkedUploadPart(models.Model):
+    upload = models.ForeignKey(ChunkedUpload, on_delete=models.CASCADE, related_name='parts')
+    number = models.PositiveIntegerField() # zero based, offset = number * chunk_size
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    s3_etag = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'number'], name='unique_chunked_upload_part'),
+        ]
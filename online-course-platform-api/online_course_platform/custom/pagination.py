@@ -0,0 +1,130 @@
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor
+
+class KeysetCursorPagination(CursorPagination):
+    '''
+    Cursor pagination which seeks on the full ordering tuple, e.g. (created_at, id),
+    instead of DRF's "first field + offset" positions, so every page costs one
+    indexed range scan no matter how deep the client has paged.
+    '''
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 100)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = self._decode_position(queryset.model, self.cursor.position) if self.cursor else None
+
+        if reverse:
+            queryset = queryset.order_by(*[_reverse_ordering(field) for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if position is not None:
+            queryset = queryset.filter(self._seek_filter(position, reverse))
+
+        # fetch one extra row to know if there is anything beyond this page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if self.template is not None:
+            self.display_page_controls = self.has_next or self.has_previous
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # a unique tie-breaker is required for the seek predicate to be exact
+        if 'id' not in [field.lstrip('-') for field in ordering] and 'pk' not in ordering:
+            ordering = tuple(ordering) + ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            cursor = Cursor(offset=0, reverse=False, position=self._encode_position(self.page[-1]))
+        else:
+            # reached here by paging backwards past the last row, reuse the same position
+            cursor = Cursor(offset=0, reverse=False, position=self.cursor.position)
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            cursor = Cursor(offset=0, reverse=True, position=self._encode_position(self.page[0]))
+        else:
+            cursor = Cursor(offset=0, reverse=True, position=self.cursor.position)
+        return self.encode_cursor(cursor)
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
+
+    def _seek_filter(self, position, reverse):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), per-field direction aware
+        seek = Q()
+        for index, ordering_field in enumerate(self.ordering):
+            descending = ordering_field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition = Q(**{f'{self.fields[index]}__{lookup}': position[index]})
+            for equal_index in range(index):
+                condition &= Q(**{self.fields[equal_index]: position[equal_index]})
+            seek |= condition
+        return seek
+
+    def _encode_position(self, instance):
+        values = []
+        for field in self.fields:
+            # rows of .values() querysets too, see custom.fastpath
+            value = instance[field] if isinstance(instance, dict) else getattr(instance, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return json.dumps(values)
+
+    def _decode_position(self, model, encoded):
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(encoded)
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError()
+            return [
+                model._meta.pk.to_python(value) if field == 'pk' else model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+class CreatedAtCursorPagination(KeysetCursorPagination):
+    ordering = ('created_at', 'id')
+
+class IdCursorPagination(KeysetCursorPagination):
+    ordering = ('id',)
+
+def _reverse_ordering(ordering_field):
+    return ordering_field[1:] if ordering_field.startswith('-') else f'-{ordering_field}'
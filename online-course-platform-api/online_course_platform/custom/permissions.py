@@ -1,6 +1,7 @@
 from rest_framework import permissions
 from rest_framework.exceptions import NotAuthenticated, PermissionDenied, NotFound
-from .models import Student, Teacher, Course
+from .models import Course
+from .membership import is_course_teacher, is_course_student
 from django.conf import settings
 
 class IsNotAdminUser(permissions.BasePermission):
@@ -19,22 +20,14 @@ class IsAdminOrCourseTeacherOrCourseStudent(permissions.BasePermission):
             raise Exception('Improper usage of IsAdminOrCourseTeacher permission class')
 
         course_pk = view.kwargs.get('course_pk', None) or view.kwargs['pk']
-        course = Course.objects.filter(pk=course_pk).first()
-        if not course:
-            return NotFound(f'course with id = {course_pk} not found')
-
         if request.user.is_staff:
             return True
-                
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
-        if teacher:
-            if course.id in (teacher_course.id for teacher_course in teacher.courses.all()):
-                return True
-            return False
-        
-        student = Student.objects.filter(user_id=request.user.id).first()
-        return bool(student and \
-                    course.id in (student_course.id for student_course in student.courses.all()))
+
+        if request.user.role == settings.USER_ROLE_TEACHER:
+            is_member = is_course_teacher(request, course_pk)
+        else:
+            is_member = is_course_student(request, course_pk)
+        return is_member or _raise_if_course_not_found(course_pk)
 
 # is admin or teacher of this course
 class IsAdminOrCourseTeacher(permissions.BasePermission):
@@ -43,17 +36,11 @@ class IsAdminOrCourseTeacher(permissions.BasePermission):
             raise Exception('Improper usage of IsAdminOrCourseTeacher permission class')
 
         course_pk = view.kwargs.get('course_pk', None) or view.kwargs['pk']
-        course = Course.objects.filter(pk=course_pk).first()
-        if not course:
-            return NotFound(f'course with id = {course_pk} not found')
-
         if request.user.is_staff:
             return True
-        
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
-        return bool(teacher and \
-                    course.id in (teacher_course.id for teacher_course in teacher.courses.all()))
-    
+
+        return is_course_teacher(request, course_pk) or _raise_if_course_not_found(course_pk)
+
 class IsTeacherButNotCourseTeacher(permissions.BasePermission):
     def has_permission(self, request, view):
         if '/courses/' not in request.path:
@@ -63,11 +50,13 @@ class IsTeacherButNotCourseTeacher(permissions.BasePermission):
             raise PermissionDenied(detail='Method only allowed for teacher.')
 
         course_pk = view.kwargs.get('course_pk', None) or view.kwargs['pk']
-        course = Course.objects.filter(pk=course_pk).first()
-        if not course:
-            return NotFound(f'course with id = {course_pk} not found')
-        
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
-        if course.id in (teacher_course.id for teacher_course in teacher.courses.all()):
+        if is_course_teacher(request, course_pk):
             raise PermissionDenied(detail='Method only allowed for teacher currently not joined the course.')
-        return True
\ No newline at end of file
+        _raise_if_course_not_found(course_pk)
+        return True
+
+# only reached when the membership check failed, so members never pay for this query
+def _raise_if_course_not_found(course_pk):
+    if not Course.objects.filter(pk=course_pk).exists():
+        raise NotFound(f'course with id = {course_pk} not found')
+    return False
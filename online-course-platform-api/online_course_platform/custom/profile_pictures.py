@@ -0,0 +1,101 @@
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from .caching import bump_versions
+from .images import render_profile_picture, ImageRejected
+
+logger = logging.getLogger(__name__)
+
+# profile pictures are cleaned of their metadata and get square WebP thumbnails of PROFILE_PICTURE_SIZES,
+# stored next to them. saving a new picture enqueues a job (see custom.signals) which decodes and encodes
+# on a pool of IMAGE_PROCESSES processes, off the request. profile_picture_variants maps the sizes to the
+# thumbnails, and 'source' to the picture they were made of, the serializers show none of another picture
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pools():
+    # per process, pools do not survive forking, e.g. of gunicorn workers from a preloaded master
+    pid = os.getpid()
+    pools = _pools.get(pid)
+    if pools is None:
+        with _pools_lock:
+            pools = _pools.get(pid)
+            if pools is None:
+                pools = _pools[pid] = (
+                    ThreadPoolExecutor(max_workers=settings.IMAGE_PROCESSES, thread_name_prefix='profile-pictures'),
+                    ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESSES),
+                )
+    return pools
+
+def is_processed(picture_name, variants):
+    return bool(picture_name) and variants.get('source') == picture_name
+
+def enqueue(model, pk):
+    '''
+    Process the profile picture of the Teacher or Student row in the background, returns a Future.
+    '''
+    jobs, processes = _get_pools()
+    return jobs.submit(run_job, model, pk, processes)
+
+def run_job(model, pk, processes):
+    # on a thread of its own, closing its database connection like a request would
+    close_old_connections()
+    try:
+        return process_profile_picture(model, pk, processes)
+    except Exception:
+        logger.exception('processing the profile picture of %s %s failed', model.__name__, pk)
+        return None
+    finally:
+        close_old_connections()
+
+def process_profile_picture(model, pk, processes):
+    '''
+    Clean the profile picture of the row and store its thumbnails, decoding and encoding on the processes executor.
+    Returns whether the row got them, not if it has no picture, has them already or its picture was replaced meanwhile.
+    '''
+    row = model.objects.filter(pk=pk).values('profile_picture', 'profile_picture_variants').first()
+    if row is None or not row['profile_picture'] or is_processed(row['profile_picture'], row['profile_picture_variants']):
+        return False
+    source = row['profile_picture']
+    storage = model._meta.get_field('profile_picture').storage
+    extension = posixpath.splitext(source)[1]
+
+    with storage.open(source) as file:
+        data = file.read()
+    try:
+        cleaned, thumbnails = processes.submit(
+            render_profile_picture, data, extension.lstrip('.'), settings.PROFILE_PICTURE_SIZES,
+            settings.PROFILE_PICTURE_WEBP_QUALITY, settings.PROFILE_PICTURE_MAX_PIXELS,
+        ).result()
+    except ImageRejected as e:
+        logger.warning('profile picture %s of %s %s not processed: %s', source, model.__name__, pk, e)
+        return False
+
+    # the cleaned picture replaces the upload under a new name, the thumbnails are named after it
+    name = storage.save(source, ContentFile(cleaned))
+    stem, _ = posixpath.splitext(name)
+    variants = {'source': name}
+    for size, thumbnail in thumbnails.items():
+        variants[str(size)] = storage.save(f'{stem}_{size}.webp', ContentFile(thumbnail))
+
+    if not model.objects.filter(pk=pk, profile_picture=source).update(profile_picture=name, profile_picture_variants=variants):
+        # replaced or deleted meanwhile, the job of the new picture takes over
+        _delete(storage, variants.values())
+        return False
+    _delete(storage, [source] + [value for key, value in row['profile_picture_variants'].items() if key != 'source'])
+    # update() sends no post_save, the cached rosters show the pictures
+    bump_versions([model._meta.model_name])
+    return True
+
+def _delete(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning('could not delete %s', name, exc_info=True)
@@ -0,0 +1,81 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager, ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# per request SQL statistics: number of queries, repeated identical queries and time spent in the database.
+# views declare the most queries each of their actions may run in query_budgets, e.g. {'list': 3},
+# custom.tests checks them against growing data sets
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+@contextmanager
+def record_queries(using=None):
+    '''
+    Records the queries of the block on the database using, by default on every database.
+    '''
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for alias in [using] if using else connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        yield stats
+
+def get_query_budget(view_func, method):
+    '''
+    The query budget a DRF viewset declares for the action a request is routed to, None if undeclared.
+    '''
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    if view_class is None or action is None:
+        return None
+    return getattr(view_class, 'query_budgets', {}).get(action)
+
+class QueryStatsMiddleware:
+    '''
+    Reports the query statistics of every request in X-Query-* response headers
+    and logs a warning when a request goes over the budget of its view.
+    '''
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_STATS_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as stats:
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = stats.count
+        response['X-Query-Duplicates'] = stats.duplicates
+        response['X-Query-Time'] = f'{stats.duration * 1000:.1f}ms'
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and stats.count > budget:
+            logger.warning('%s %s ran %d queries, over its budget of %d (%d duplicates)',
+                           request.method, request.path, stats.count, budget, stats.duplicates)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = get_query_budget(view_func, request.method)
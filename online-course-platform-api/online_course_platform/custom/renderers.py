@@ -0,0 +1,51 @@
+from rest_framework import renderers
+
+# renderers of REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']. orjson, msgpack and brotli (custom.compression) are optional:
+# without orjson JSON is encoded by the stdlib as before, without msgpack application/msgpack is not offered
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class JSONRenderer(renderers.JSONRenderer):
+    '''
+    DRF's JSONRenderer encoding with orjson when it is installed, the same bytes in a fraction of the time.
+    '''
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # indented (the browsable API, ?indent=) or non-default UNICODE_JSON/COMPACT_JSON output is left to DRF
+        if orjson is None or data is None or not self.compact or self.ensure_ascii \
+                or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # dates and times as DRF's encoder writes them
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # as DRF, these are valid JSON but not valid javascript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    '''
+    application/msgpack, for clients asking for it in Accept or with ?format=msgpack.
+    '''
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = renderers.JSONRenderer.encoder_class
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # values msgpack has no type for (dates, decimals, lazy strings) become what they are in JSON
+        return msgpack.packb(data, default=self.encoder_class().default, use_bin_type=True)
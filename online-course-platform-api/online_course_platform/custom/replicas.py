@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .database import database_sync_to_async
+
+# read replica routing. within requests through ReplicaRoutingMiddleware, reads go to one of
+# settings.DATABASE_REPLICAS, picked round-robin per request among the reachable ones.
+# everything else uses 'default': writes, reads in transactions, reads after the request wrote,
+# and every request of a user within DATABASE_REPLICA_PIN_SECONDS of their last write, so users read their own writes.
+# outside requests (commands, shell) nothing is routed to replicas
+
+class _Routing:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+_routing = ContextVar('replica_routing', default=None)
+
+# alias -> time.monotonic() until which the replica is skipped
+_unreachable_until = {}
+_turns = itertools.count()
+
+@contextmanager
+def use_primary():
+    '''
+    Read from 'default' within the block, e.g. when a stale read would be cached.
+    '''
+    state = _routing.get()
+    pinned = state.pinned if state else None
+    if state:
+        state.pinned = True
+    try:
+        yield
+    finally:
+        if state:
+            state.pinned = pinned
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            # one replica per request, replicas may lag behind by different amounts
+            state.replica = _choose_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows
+        return True
+
+def _choose_replica():
+    replicas = settings.DATABASE_REPLICAS
+    turn = next(_turns)
+    for offset in range(len(replicas)):
+        alias = replicas[(turn + offset) % len(replicas)]
+        if _is_reachable(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+def _is_reachable(alias):
+    if _unreachable_until.get(alias, 0) > time.monotonic():
+        return False
+    connection = connections[alias]
+    if connection.connection is None:
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            _unreachable_until[alias] = time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+            return False
+    return True
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # marks the instance as a coroutine function for django, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        user_id, pinned = _start(request)
+        state = _Routing(pinned)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if state.wrote and user_id is not None:
+            _pin(user_id)
+        return response
+
+    async def __acall__(self, request):
+        # the session user and the cache are synchronous. the routing state is set on the event loop,
+        # SyncToAsync copies it to the threads running the queries
+        user_id, pinned = await database_sync_to_async(_start, request)
+        state = _Routing(pinned)
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if state.wrote and user_id is not None:
+            await database_sync_to_async(_pin, user_id)
+        return response
+
+def _start(request):
+    user_id = _get_user_id(request)
+    return user_id, request.method not in SAFE_METHODS or (user_id is not None and cache.get(_pin_key(user_id)) is not None)
+
+def _pin(user_id):
+    # shared across processes only if CACHES points to a shared backend
+    cache.set(_pin_key(user_id), 1, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+def _get_user_id(request):
+    # the middleware runs before DRF authenticates the request, read the user id from the access token
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) == 2 and header[0] in api_settings.AUTH_HEADER_TYPES:
+        try:
+            return AccessToken(header[1]).get(api_settings.USER_ID_CLAIM)
+        except TokenError:
+            return None
+    # e.g. the admin site
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+def _pin_key(user_id):
+    return f'replica_pin:{user_id}'
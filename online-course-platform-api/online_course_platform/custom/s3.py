@@ -0,0 +1,135 @@
+import os
+import posixpath
+import threading
+import time
+import boto3
+from asgiref.sync import sync_to_async
+from botocore import exceptions
+from botocore.config import Config
+from django.conf import settings
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_s3_client():
+    # building a client costs tens of ms, while a built client is thread safe, so keep one per process and config.
+    # the pid is part of the key since connection pools must not be shared with forked workers
+    config_key = (
+        os.getpid(),
+        getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+        getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+        getattr(settings, 'AWS_S3_REGION_NAME', None),
+        getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+    )
+    client = _clients.get(config_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(config_key)
+            if client is None:
+                _, access_key, secret_key, region, endpoint_url = config_key
+                # boto3.client() goes through the default session which is not thread safe
+                client = boto3.session.Session().client(
+                    's3',
+                    aws_access_key_id=access_key,
+                    aws_secret_access_key=secret_key,
+                    region_name=region,
+                    endpoint_url=endpoint_url,
+                    config=Config(max_pool_connections=getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 10)),
+                )
+                _clients[config_key] = client
+    return client
+
+class PresignedUrlCache:
+    '''
+    Shares signed URLs between concurrent viewers of the same object.
+    Time is cut into buckets of expires_in * (1 - min_remaining) seconds and a URL is only handed out
+    within the bucket it was signed in, so it always has at least min_remaining of its lifetime left.
+    '''
+    def __init__(self, expires_in, min_remaining=0.5):
+        self.expires_in = expires_in
+        self.bucket_seconds = max(1, int(expires_in * (1 - min_remaining)))
+        self.hits = 0
+        self.misses = 0
+        self._urls = {}
+        self._signing_locks = {}
+        self._lock = threading.Lock()
+        self._bucket = None
+
+    def get(self, key, sign):
+        bucket = int(time.time() // self.bucket_seconds)
+        cache_key = (key, bucket)
+
+        url = self._urls.get(cache_key)
+        if url is not None:
+            self._count_hit()
+            return url
+
+        # single flight, only one thread signs an expired entry while the others wait for its result
+        with self._signing_lock(cache_key, bucket):
+            url = self._urls.get(cache_key)
+            if url is not None:
+                self._count_hit()
+                return url
+            url = sign(key, self.expires_in)
+            with self._lock:
+                self._urls[cache_key] = url
+                self.misses += 1
+        return url
+
+    async def aget(self, key, sign):
+        # a URL signed for this bucket is handed out without leaving the event loop,
+        # signing runs in a thread like get() since boto3 is synchronous
+        url = self._urls.get((key, int(time.time() // self.bucket_seconds)))
+        if url is not None:
+            self._count_hit()
+            return url
+        return await sync_to_async(self.get, thread_sensitive=False)(key, sign)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._urls)}
+
+    def clear(self):
+        with self._lock:
+            self.hits = self.misses = 0
+            self._urls.clear()
+            self._signing_locks.clear()
+
+    def _signing_lock(self, cache_key, bucket):
+        with self._lock:
+            if bucket != self._bucket:
+                # entering a new bucket, drop everything signed in the previous ones
+                self._bucket = bucket
+                self._urls = {k: v for k, v in self._urls.items() if k[1] >= bucket}
+                self._signing_locks = {k: v for k, v in self._signing_locks.items() if k[1] >= bucket}
+            return self._signing_locks.setdefault(cache_key, threading.Lock())
+
+    def _count_hit(self):
+        with self._lock:
+            self.hits += 1
+
+presigned_url_cache = PresignedUrlCache(
+    expires_in=getattr(settings, 'SIGNED_MEDIA_URL_EXPIRES_IN', 60),
+    min_remaining=getattr(settings, 'SIGNED_MEDIA_URL_MIN_REMAINING', 0.5),
+)
+
+def get_presigned_url(key):
+    return presigned_url_cache.get(key, _sign_get_object)
+
+async def aget_presigned_url(key):
+    return await presigned_url_cache.aget(key, _sign_get_object)
+
+def get_media_file_key(media_file):
+    return posixpath.join(media_file.storage.location, media_file.name)
+
+def _sign_get_object(key, expires_in):
+    try:
+        return get_s3_client().generate_presigned_url(
+            ClientMethod='get_object',
+            Params={
+                'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+                'Key': key,
+            },
+            ExpiresIn=expires_in)
+    except exceptions.ClientError:
+        raise Exception('S3 Client Error')
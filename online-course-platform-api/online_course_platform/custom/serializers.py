@@ -1,10 +1,61 @@
 from rest_framework import serializers
 from rest_framework import status
-from .models import Course, CourseCategory, Teacher, TeacherJoinCourseRequest, Student, Assignment, AssignmentMaterial, Lesson
+import csv
+import io
+import os
+from .models import Course, CourseCategory, Teacher, TeacherJoinCourseRequest, Student, Assignment, AssignmentMaterial, Lesson, ChunkedUpload
 # FIXME: decouple
 from core.models import User
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.exceptions import ParseError, NotFound, PermissionDenied
+from .membership import is_course_teacher, get_teacher_id
+from .profile_pictures import is_processed
+from .uploads import get_backend, get_target_field, validate_upload_file
+
+class SparseFieldsetMixin:
+    '''
+    Serializes only the fields named in ?fields= (all of them if absent), comma separated.
+    Fields in expandable_fields are costly to build and left out unless named in ?expand= or ?fields=.
+    '''
+    expandable_fields = ()
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        fields = _parse_field_list(request, 'fields')
+        expand = _parse_field_list(request, 'expand')
+        unknown = expand - set(cls.expandable_fields)
+        if unknown:
+            raise ParseError(f"Cannot expand {', '.join(sorted(unknown))}, expandable fields are {', '.join(cls.expandable_fields)}.")
+        return fields, expand | (fields & set(cls.expandable_fields))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.select_fields(list(fields), self.context.get('request'))
+        for name in list(fields):
+            if name not in selected:
+                fields.pop(name)
+        return fields
+
+    @classmethod
+    def select_fields(cls, names, request):
+        '''
+        The field names out of names to serialize for the request, in their order.
+        '''
+        only, expand = cls.get_requested_fields(request)
+        unknown = only - set(names)
+        if unknown:
+            raise ParseError(f"Unknown fields {', '.join(sorted(unknown))}.")
+        return [
+            name for name in names
+            if not ((only and name not in only) or (name in cls.expandable_fields and name not in expand))
+        ]
+
+def _parse_field_list(request, param):
+    value = request.query_params.get(param) if request is not None else None
+    if not value:
+        return set()
+    return set(field.strip() for field in value.split(',') if field.strip())
 
 class SimpleUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,33 +84,62 @@ class SimpleCourseCategorySerializer(serializers.ModelSerializer):
         model = CourseCategory
         fields = ['id', 'title']
 
+class ProfilePictureSrcsetField(serializers.Field):
+    '''
+    URLs of the thumbnails of the profile picture by width, e.g. {"64w": ..., "128w": ...},
+    empty until they are made, see custom.profile_pictures.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, profile):
+        picture = profile.profile_picture
+        return get_profile_picture_srcset(picture.storage, picture.name, profile.profile_picture_variants, self.context.get('request'))
+
+def get_profile_picture_srcset(storage, name, variants, request):
+    if not is_processed(name, variants):
+        return {}
+    srcset = {}
+    for size in sorted(int(key) for key in variants if key != 'source'):
+        # as the url of the picture itself, see serializers.FileField
+        url = storage.url(variants[str(size)])
+        srcset[f'{size}w'] = request.build_absolute_uri(url) if request is not None else url
+    return srcset
+
 class SimpleTeacherSerializer(serializers.ModelSerializer):
     class Meta:
         model = Teacher
-        fields = ['id', 'user', 'profile_picture']
+        fields = ['id', 'user', 'profile_picture', 'profile_picture_srcset']
 
     user = SimpleUserSerializer(read_only=True)
+    profile_picture_srcset = ProfilePictureSrcsetField()
     
 class SimpleStudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
-        fields = ['id', 'user', 'profile_picture']
+        fields = ['id', 'user', 'profile_picture', 'profile_picture_srcset']
     
     user = SimpleUserSerializer(read_only=True)
+    profile_picture_srcset = ProfilePictureSrcsetField()
 
-class RetrieveCourseSerializer(serializers.ModelSerializer):
+class RetrieveCourseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Course
-        fields = ['id', 'title', 'created_at', 'category', 'teachers', 'students']
+        fields = ['id', 'title', 'created_at', 'category', 'seat_limit', 'teacher_count', 'student_count', 'lesson_count', 'assignment_count', 'join_request_count', 'teachers_url', 'students_url', 'teachers', 'students']
+
+    # rosters can be huge, by default only their sizes and links to the paginated rosters are serialized
+    expandable_fields = ('teachers', 'students')
 
     category = SimpleCourseCategorySerializer(read_only=True)
+    teachers_url = serializers.HyperlinkedIdentityField(view_name='courses-teachers')
+    students_url = serializers.HyperlinkedIdentityField(view_name='courses-students')
     teachers = SimpleTeacherSerializer(many=True, read_only=True)
     students = SimpleStudentSerializer(many=True, read_only=True)
 
 class CourseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
-        fields = ['title', 'category']
+        fields = ['title', 'category', 'seat_limit']
         # TODO: allow category to be null  
 
     def validate(self, attrs):
@@ -75,10 +155,11 @@ class UpdateTeacherSerializer(serializers.ModelSerializer):
 class RetrieveTeacherSerializer(serializers.ModelSerializer):
     class Meta:
         model = Teacher
-        fields = ['id', 'user', 'courses', 'profile_picture']
+        fields = ['id', 'user', 'courses', 'profile_picture', 'profile_picture_srcset']
 
     user = SimpleUserSerializer(read_only=True)
     courses = SimpleCourseSerializer(many=True, read_only=True)
+    profile_picture_srcset = ProfilePictureSrcsetField()
 
 class UpdateStudentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -88,10 +169,11 @@ class UpdateStudentSerializer(serializers.ModelSerializer):
 class RetrieveStudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
-        fields = ['id', 'user', 'courses', 'profile_picture']
+        fields = ['id', 'user', 'courses', 'profile_picture', 'profile_picture_srcset']
     
     user = SimpleUserSerializer(read_only=True)
     courses = SimpleCourseSerializer(many=True, read_only=True)
+    profile_picture_srcset = ProfilePictureSrcsetField()
 
 class TeacherJoinCourseRequestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -101,8 +183,8 @@ class TeacherJoinCourseRequestSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         request = self.context['request']
 
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
-        if not teacher:
+        teacher_id = get_teacher_id(request)
+        if not teacher_id:
             raise PermissionDenied("This method is only allowed to teachers")
 
         course_pk = validated_data['course'].id
@@ -110,10 +192,10 @@ class TeacherJoinCourseRequestSerializer(serializers.ModelSerializer):
         if not course:
             raise NotFound(f"Course with id = {course_pk} not found.")
         
-        if course.id in (teacher_course.id for teacher_course in teacher.courses.all()):
+        if is_course_teacher(request, course.id):
             raise PermissionDenied("You are already in this course.")
 
-        validated_data['teacher_id'] = teacher.id
+        validated_data['teacher_id'] = teacher_id
         return super().create(validated_data)
 
 class RetrieveTeacherJoinCourseRequestSerializer(serializers.ModelSerializer):
@@ -124,6 +206,21 @@ class RetrieveTeacherJoinCourseRequestSerializer(serializers.ModelSerializer):
     teacher = SimpleTeacherSerializer()
     course = SimpleCourseSerializer()
 
+class JoinRequestDecisionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    accept = serializers.BooleanField()
+
+class BulkJoinRequestDecisionSerializer(serializers.Serializer):
+    decisions = JoinRequestDecisionSerializer(many=True, allow_empty=False)
+
+    def validate_decisions(self, decisions):
+        if len(decisions) > settings.BULK_JOIN_REQUEST_MAX_DECISIONS:
+            raise serializers.ValidationError(f'At most {settings.BULK_JOIN_REQUEST_MAX_DECISIONS} requests can be decided at once.')
+        ids = [decision['id'] for decision in decisions]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Each request can only be decided once.')
+        return decisions
+
 class AssignmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Assignment
@@ -136,9 +233,9 @@ class AssignmentSerializer(serializers.ModelSerializer):
         validated_data['course_id'] = self.context['course_pk']
 
         request = self.context['request']
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
-        if teacher:
-            validated_data['teacher_id'] = teacher.id
+        teacher_id = get_teacher_id(request)
+        if teacher_id:
+            validated_data['teacher_id'] = teacher_id
             
         return super().create(validated_data)
 
@@ -154,6 +251,14 @@ class AssignmentMaterialSerializer(serializers.ModelSerializer):
         validated_data['assignment_id'] = self.context['assignment_pk']
         return super().create(validated_data)
 
+class AssignmentMaterialChangeSerializer(AssignmentMaterialSerializer):
+    # change feeds hold the materials of every assignment of the course
+    class Meta(AssignmentMaterialSerializer.Meta):
+        fields = AssignmentMaterialSerializer.Meta.fields + ['assignment', 'updated_at']
+
+    assignment = serializers.IntegerField(source='assignment_id', read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+
 class LessonSerializer(serializers.ModelSerializer):
     class Meta:
         model = Lesson
@@ -169,8 +274,125 @@ class LessonSerializer(serializers.ModelSerializer):
         validated_data['course_id'] = self.context['course_pk']
 
         request = self.context['request']
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
-        if teacher:
-            validated_data['teacher_id'] = teacher.id
+        teacher_id = get_teacher_id(request)
+        if teacher_id:
+            validated_data['teacher_id'] = teacher_id
             
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class DashboardLessonSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'created_at', 'updated_at']
+
+class DashboardAssignmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Assignment
+        fields = ['id', 'title', 'created_at', 'updated_at']
+
+class DashboardCourseSerializer(serializers.ModelSerializer):
+    # the prefetched rows of custom.dashboard
+    class Meta:
+        model = Course
+        fields = ['id', 'title', 'lesson_count', 'assignment_count', 'latest_lessons', 'latest_open_assignments']
+
+    latest_lessons = DashboardLessonSerializer(many=True, read_only=True)
+    latest_open_assignments = DashboardAssignmentSerializer(many=True, read_only=True)
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'target', 'object_id', 'name', 'filename', 'size', 'chunk_size', 'status', 'received_chunks', 'uploading_chunks', 'created_at']
+        read_only_fields = ['chunk_size', 'status', 'created_at']
+
+    received_chunks = serializers.SerializerMethodField()
+    # accepted, still being uploaded to S3
+    uploading_chunks = serializers.SerializerMethodField()
+
+    def get_received_chunks(self, upload):
+        uploading = set(self.get_uploading_chunks(upload))
+        return sorted(part.number for part in upload.parts.all() if part.number not in uploading)
+
+    def get_uploading_chunks(self, upload):
+        return sorted(get_backend(upload).get_uploading(upload.parts.all()))
+
+    def validate(self, attrs):
+        attrs['filename'] = os.path.basename(attrs['filename'])
+        try:
+            validate_upload_file(attrs['target'], attrs['filename'], attrs['size'])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'filename': e.messages})
+        return super().validate(attrs)
+
+    def create(self, validated_data):
+        request = self.context['request']
+
+        object_id = validated_data['object_id']
+        if validated_data['target'] == ChunkedUpload.TargetChoices.LESSON_VIDEO:
+            course_id = Lesson.objects.filter(pk=object_id).values_list('course_id', flat=True).first()
+        else:
+            course_id = Assignment.objects.filter(pk=object_id).values_list('course_id', flat=True).first()
+        if course_id is None:
+            raise NotFound(f"{validated_data['target'].split('_')[0].capitalize()} with id = {object_id} not found.")
+
+        if not request.user.is_staff and not is_course_teacher(request, course_id):
+            raise PermissionDenied('You are not teacher of the course.')
+
+        field = get_target_field(validated_data['target'])
+        validated_data['user_id'] = request.user.id
+        validated_data['chunk_size'] = settings.CHUNKED_UPLOAD_CHUNK_SIZE
+        validated_data['storage_name'] = field.storage.get_available_name(
+            field.generate_filename(None, validated_data['filename']), max_length=field.max_length
+        )
+
+        upload = ChunkedUpload(**validated_data)
+        get_backend(upload).start(upload)
+        upload.save()
+        return upload
+
+class BatchRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    # e.g. /api/v1/courses/1/lessons/?page_size=5, may refer to earlier responses, see custom.batch
+    path = serializers.RegexField(r'^/api/v1/')
+    body = serializers.JSONField(required=False)
+    name = serializers.RegexField(r'^[\w-]+$', required=False)
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, requests):
+        if len(requests) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(f'At most {settings.BATCH_MAX_REQUESTS} requests can be batched.')
+        names = [request['name'] for request in requests if 'name' in request]
+        if len(set(names)) != len(names):
+            raise serializers.ValidationError('Names of requests must be unique.')
+        return requests
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    # students by id or email, either as a list or as the first column of a CSV file
+    students = serializers.ListField(child=serializers.CharField(), required=False)
+    csv = serializers.FileField(required=False)
+
+    def validate(self, attrs):
+        if 'csv' in attrs:
+            values = self._read_csv(attrs['csv'])
+        elif 'students' in attrs:
+            values = attrs['students']
+        else:
+            raise serializers.ValidationError('Either students or csv is required.')
+
+        if len(values) > settings.BULK_ENROLLMENT_MAX_ROWS:
+            raise serializers.ValidationError(f'At most {settings.BULK_ENROLLMENT_MAX_ROWS} students can be enrolled at once.')
+        attrs['values'] = values
+        return attrs
+
+    def _read_csv(self, file):
+        try:
+            rows = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig'))
+            values = [row[0].strip() for row in rows if row and row[0].strip()]
+        except (UnicodeDecodeError, csv.Error):
+            raise serializers.ValidationError({'csv': 'File is not a valid UTF-8 CSV file.'})
+        # skip a header row
+        if values and values[0].lower() in ('id', 'email', 'student'):
+            values = values[1:]
+        return values
@@ -0,0 +1,212 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete, post_delete, post_save
+from django.dispatch import receiver, Signal
+from core.tokens import revoke_tokens
+from .models import CourseCategory, Course, Teacher, Student, Lesson, Assignment, AssignmentMaterial, TeacherJoinCourseRequest, Tombstone
+from .membership import invalidate_course_membership
+from .caching import bump_versions
+from .database import check_persistent_connections
+from .counters import increment, decrement
+from .changes import record_deletion
+from .profile_pictures import enqueue, is_processed
+
+# sent once for a batch of through rows written without m2m_changed, e.g. by bulk_create.
+# arguments: model (Teacher or Student), course_ids
+roster_changed = Signal()
+
+# the courses whose through rows a change is about to remove (a clear of Teacher/Student.courses or the deletion of
+# a profile). remembered on the instance by the pre_clear and pre_delete handlers below, since the rows are gone
+# by post_clear and post_delete, where both the membership invalidation and the counters of the courses read them
+
+# deletions in a batch_deletions() block leave the course counters and catalog versions to the caller, who adjusts
+# them once for the batch instead of once per row, e.g. custom.enrollments.decide_join_requests. the other
+# post_delete receivers run as usual
+
+_batched_deletions = ContextVar('batched_deletions', default=None)
+
+@contextmanager
+def batch_deletions():
+    '''
+    Yields {model: [deleted instances]} of the deletions made within the block.
+    '''
+    deleted = defaultdict(list)
+    token = _batched_deletions.set(deleted)
+    try:
+        yield deleted
+    finally:
+        _batched_deletions.reset(token)
+
+def remember_cleared_courses(instance, course_ids):
+    instance._cleared_course_ids = list(course_ids)
+
+def get_cleared_courses(instance):
+    return getattr(instance, '_cleared_course_ids', [])
+
+@receiver(m2m_changed, sender=Teacher.courses.through)
+@receiver(m2m_changed, sender=Student.courses.through)
+def invalidate_membership_on_courses_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        course_ids = [instance.pk] if reverse else list(pk_set)
+    elif action == 'pre_clear':
+        # read by this handler and count_roster_changes on post_clear
+        remember_cleared_courses(instance, [instance.pk] if reverse else instance.courses.values_list('id', flat=True))
+        return
+    elif action == 'post_clear':
+        course_ids = get_cleared_courses(instance)
+    else:
+        return
+    # invalidate after commit, otherwise a concurrent request could cache the pre-commit answer again
+    transaction.on_commit(lambda: invalidate_course_membership(course_ids))
+
+@receiver(pre_delete, sender=Teacher)
+@receiver(pre_delete, sender=Student)
+def remember_courses_before_profile_deleted(sender, instance, **kwargs):
+    # read by invalidate_membership_on_profile_deleted and count_profile_deleted
+    remember_cleared_courses(instance, instance.courses.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Student)
+def invalidate_membership_on_profile_deleted(sender, instance, **kwargs):
+    course_ids = get_cleared_courses(instance)
+    transaction.on_commit(lambda: invalidate_course_membership(course_ids))
+
+@receiver(post_save, sender=CourseCategory)
+@receiver(post_delete, sender=CourseCategory)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+# these change the counters of courses
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_save, sender=TeacherJoinCourseRequest)
+@receiver(post_delete, sender=TeacherJoinCourseRequest)
+def bump_catalog_version_on_saved(sender, instance, signal, update_fields=None, **kwargs):
+    # logging in only touches last_login, which the catalog does not show
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    if signal is post_delete and _batched_deletions.get() is not None:
+        return
+    name = sender._meta.model_name
+    transaction.on_commit(lambda: bump_versions([name]))
+
+@receiver(m2m_changed, sender=Teacher.courses.through)
+@receiver(m2m_changed, sender=Student.courses.through)
+def bump_catalog_version_on_courses_changed(sender, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    # the rosters of courses change with either side of the relation
+    name = 'teacher' if sender is Teacher.courses.through else 'student'
+    transaction.on_commit(lambda: bump_versions([name]))
+
+@receiver(roster_changed)
+def invalidate_on_roster_changed(sender, model, course_ids, **kwargs):
+    name = model._meta.model_name
+    def invalidate():
+        invalidate_course_membership(course_ids)
+        bump_versions([name])
+    transaction.on_commit(invalidate)
+
+# course counters, roster edits made by custom.enrollments adjust them there
+
+ROSTER_COUNTERS = {
+    Teacher.courses.through: 'teacher_count',
+    Student.courses.through: 'student_count',
+}
+
+@receiver(m2m_changed, sender=Teacher.courses.through)
+@receiver(m2m_changed, sender=Student.courses.through)
+def count_roster_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    field = ROSTER_COUNTERS[sender]
+    if action == 'post_add':
+        # pk_set only holds the rows actually added
+        increment(field, [instance.pk] * len(pk_set) if reverse else pk_set)
+    elif action == 'pre_remove':
+        # while here it holds whatever was asked to be removed, count the rows which exist
+        profile = field[:-len('_count')]
+        if reverse:
+            rows = sender.objects.filter(course_id=instance.pk, **{f'{profile}_id__in': pk_set})
+        else:
+            rows = sender.objects.filter(course_id__in=pk_set, **{f'{profile}_id': instance.pk})
+        instance._removed_course_ids = list(rows.values_list('course_id', flat=True))
+    elif action == 'post_remove':
+        decrement(field, getattr(instance, '_removed_course_ids', []))
+    elif action == 'post_clear':
+        if reverse:
+            Course.objects.filter(pk=instance.pk).update(**{field: 0})
+        else:
+            # remembered on pre_clear by invalidate_membership_on_courses_changed
+            decrement(field, get_cleared_courses(instance))
+
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Student)
+def revoke_tokens_on_profile_deleted(sender, instance, **kwargs):
+    # issued tokens carry the id of the profile
+    revoke_tokens(instance.user_id)
+
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Student)
+def count_profile_deleted(sender, instance, **kwargs):
+    field = ROSTER_COUNTERS[sender.courses.through]
+    # remembered on pre_delete by remember_courses_before_profile_deleted
+    decrement(field, get_cleared_courses(instance))
+
+COURSE_CHILD_COUNTERS = {
+    Lesson: 'lesson_count',
+    Assignment: 'assignment_count',
+    TeacherJoinCourseRequest: 'join_request_count',
+}
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=TeacherJoinCourseRequest)
+def count_course_child_created(sender, instance, created, **kwargs):
+    if created:
+        increment(COURSE_CHILD_COUNTERS[sender], [instance.course_id])
+
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=TeacherJoinCourseRequest)
+def count_course_child_deleted(sender, instance, **kwargs):
+    batched = _batched_deletions.get()
+    if batched is not None:
+        batched[sender].append(instance)
+        return
+    decrement(COURSE_CHILD_COUNTERS[sender], [instance.course_id])
+
+# tombstones of the change feeds, see custom.changes. in the transaction of the deletion,
+# a tombstone written after the commit could be lost while the row is gone
+
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=AssignmentMaterial)
+def record_tombstone_on_deleted(sender, instance, **kwargs):
+    record_deletion(instance)
+
+@receiver(post_delete, sender=Course)
+def delete_tombstones_of_course(sender, instance, **kwargs):
+    # sent after those of its lessons and assignments, nobody syncs a deleted course
+    Tombstone.objects.filter(course_id=instance.pk).delete()
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Student)
+def process_profile_picture_on_saved(sender, instance, **kwargs):
+    if instance.profile_picture and not is_processed(instance.profile_picture.name, instance.profile_picture_variants):
+        pk = instance.pk
+        # after commit, the job reads the row from another connection
+        transaction.on_commit(lambda: enqueue(sender, pk))
+
+@receiver(request_started)
+def check_connections_on_request(**kwargs):
+    check_persistent_connections()
@@ -0,0 +1,235 @@
+import mimetypes
+import os
+import posixpath
+import re
+import secrets
+import zipfile
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags
+from storages.backends.s3boto3 import S3Boto3Storage
+from .s3 import get_s3_client, get_media_file_key
+
+RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+# formats compressed already, deflating them again costs CPU for a few bytes at best
+COMPRESSED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.zip', '.docx', '.xlsx', '.pptx', '.pdf', '.mp4', '.webm', '.ogg'}
+
+def serve_file(request, path, content_type=None):
+    '''
+    Serve a file from local disk with HTTP range support (RFC 7233): single and multiple byte ranges,
+    ETag/If-None-Match and If-Range. Whole files and single ranges (a RangeFile, seeked to the start of
+    the range) are handed to the WSGI server's file_wrapper, which gunicorn sends with os.sendfile
+    without copying into userspace. Multiple ranges are streamed as multipart/byteranges.
+    '''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('file not found')
+    size = stat.st_size
+    etag = '"%x-%x"' % (stat.st_mtime_ns, size)
+    last_modified = http_date(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        _set_validators(response, etag, last_modified)
+        return response
+
+    ranges = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, last_modified):
+        ranges = parse_ranges(request.META['HTTP_RANGE'], size)
+
+    if ranges is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = FileResponse(RangeFile(open(path, 'rb'), start, end), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = _multipart_response(path, ranges, size, content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    _set_validators(response, etag, last_modified)
+    return response
+
+def sign_stream(lesson_id):
+    '''
+    Signature of the stream url of a lesson video, for players which cannot send an Authorization header
+    (e.g. <video src>). Valid for SIGNED_MEDIA_URL_EXPIRES_IN seconds, as the signed urls of S3.
+    '''
+    return signing.TimestampSigner(salt='custom.streaming.lesson').sign(str(lesson_id))
+
+def check_stream_signature(signature, lesson_id):
+    try:
+        value = signing.TimestampSigner(salt='custom.streaming.lesson').unsign(signature, max_age=settings.SIGNED_MEDIA_URL_EXPIRES_IN)
+    except signing.BadSignature:
+        return False
+    return value == str(lesson_id)
+
+def parse_ranges(header, size):
+    '''
+    Return the list of inclusive (start, end) byte ranges of a Range header, [] if none of them is
+    satisfiable, or None if the header is invalid and should be ignored.
+    '''
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec.strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if not first:
+            # suffix range, the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+        ranges.append((start, end))
+
+    # too many ranges is a cheap way to make the server do a lot of work, serve the whole file instead
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+class RangeFile:
+    '''
+    File wrapper which only yields the bytes of one range.
+    The file is positioned at the start of the range and fileno() exposed, gunicorn's sendfile sends
+    Content-Length bytes from the current position of the file descriptor.
+    '''
+    def __init__(self, file, start, end):
+        self.file = file
+        self.remaining = end - start + 1
+        self.file.seek(start)
+        self.fileno = file.fileno
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+def _multipart_response(path, ranges, size, content_type):
+    boundary = secrets.token_hex(16)
+    headers = [
+        f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n'.encode()
+        for start, end in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode()
+
+    def parts():
+        with open(path, 'rb') as file:
+            for header, (start, end) in zip(headers, ranges):
+                yield header
+                file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = file.read(min(BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+                yield b'\r\n'
+            yield closing
+
+    response = StreamingHttpResponse(parts(), status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+    response['Content-Length'] = sum(len(header) + end - start + 1 + 2 for header, (start, end) in zip(headers, ranges)) + len(closing)
+    return response
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        # strong comparison, weak etags never match
+        return if_range == etag
+    return if_range == last_modified
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    # the files are only served to course members
+    response['Cache-Control'] = 'private'
+
+def zip_stream(entries):
+    '''
+    Yield a ZIP archive as it is written, of entries (name, date_time, chunks) with chunks an iterable of bytes.
+    Only one chunk is held at a time, entries of compressed formats are stored as they are, the others deflated.
+    '''
+    output = _ZipOutput()
+    # an unseekable output, zipfile writes the sizes after every entry (data descriptors)
+    with zipfile.ZipFile(output, 'w') as archive:
+        for name, date_time, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time)
+            stored = posixpath.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            # entries of unknown size are written without zip64 extras, fine below 4 GB per file
+            with archive.open(info, 'w') as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    if output.pending:
+                        yield output.drain()
+            yield output.drain()
+    # the central directory
+    yield output.drain()
+
+class _ZipOutput:
+    def __init__(self):
+        self.pending = []
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.pending)
+        self.pending.clear()
+        return data
+
+def storage_chunks(field_file):
+    '''
+    Read a stored file in blocks. Files on S3 are streamed from the GetObject response,
+    S3Boto3Storage would download them whole first.
+    '''
+    storage = field_file.storage
+    if isinstance(storage, S3Boto3Storage):
+        body = get_s3_client().get_object(Bucket=storage.bucket_name, Key=get_media_file_key(field_file))['Body']
+        try:
+            yield from body.iter_chunks(BLOCK_SIZE)
+        finally:
+            body.close()
+        return
+
+    with storage.open(field_file.name, 'rb') as file:
+        while True:
+            data = file.read(BLOCK_SIZE)
+            if not data:
+                break
+            yield data
@@ -1,3 +1,1538 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from botocore.exceptions import ClientError
+from PIL import Image
+from urllib.parse import urlparse, parse_qs, urlencode
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections, OperationalError
+from django.db.models.signals import post_delete
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer
+from rest_framework.test import APIClient
+from core.models import User
+from core.tokens import ClaimsRefreshToken
+from core import authentication
+from . import async_views, compression, counters, membership, permissions, profile_pictures, renderers, replicas, s3, uploads, urls
+from .enrollments import bulk_enroll
+from .models import CourseCategory, Course, Teacher, Student, Lesson, Assignment, AssignmentMaterial, TeacherJoinCourseRequest, ChunkedUpload, Tombstone
+from .querystats import record_queries, get_query_budget
+from .serializers import RetrieveCourseSerializer
+from .upload_handlers import FileLimitUploadHandler, FileTooLarge
+from .views import CourseCategoryViewSet
 
-# Create your tests here.
+# a local S3 stand-in (e.g. MinIO on :9000), signing never reaches it so it need not be running
+LOCAL_S3_SETTINGS = {
+    'AWS_ACCESS_KEY_ID': 'test',
+    'AWS_SECRET_ACCESS_KEY': 'test-secret',
+    'AWS_STORAGE_BUCKET_NAME': 'test-bucket',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_S3_ENDPOINT_URL': 'http://127.0.0.1:9000',
+}
+
+@override_settings(**LOCAL_S3_SETTINGS)
+class PresignedUrlCacheTests(SimpleTestCase):
+    def test_client_is_built_once_per_process(self):
+        self.assertIs(s3.get_s3_client(), s3.get_s3_client())
+
+    def test_signed_url_targets_local_stand_in(self):
+        cache = s3.PresignedUrlCache(expires_in=60)
+        url = cache.get('media/course/videos/a.mp4', s3._sign_get_object)
+
+        parsed = urlparse(url)
+        self.assertEqual(parsed.netloc, '127.0.0.1:9000')
+        self.assertEqual(parsed.path, '/test-bucket/media/course/videos/a.mp4')
+        self.assertTrue({'Signature', 'X-Amz-Signature'} & set(parse_qs(parsed.query)))
+
+    def test_url_is_reused_within_bucket(self):
+        cache = s3.PresignedUrlCache(expires_in=60)
+        first = cache.get('media/a.mp4', s3._sign_get_object)
+        second = cache.get('media/a.mp4', s3._sign_get_object)
+        other = cache.get('media/b.mp4', s3._sign_get_object)
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 2})
+
+    def test_url_is_resigned_in_next_bucket(self):
+        cache = s3.PresignedUrlCache(expires_in=60, min_remaining=0.5)
+        sign = mock.Mock(side_effect=lambda key, expires_in: f'{key}?n={sign.call_count}')
+
+        with mock.patch('custom.s3.time.time', return_value=0):
+            cache.get('media/a.mp4', sign)
+        with mock.patch('custom.s3.time.time', return_value=29):
+            cache.get('media/a.mp4', sign)
+        with mock.patch('custom.s3.time.time', return_value=30):
+            cache.get('media/a.mp4', sign)
+
+        # 30 seconds is half of the lifetime, the url signed at 0 must not be handed out anymore
+        self.assertEqual(sign.call_count, 2)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 1})
+
+    def test_concurrent_misses_sign_once(self):
+        cache = s3.PresignedUrlCache(expires_in=60)
+        release = threading.Event()
+
+        def slow_sign(key, expires_in):
+            release.wait(5)
+            return 'signed'
+        sign = mock.Mock(side_effect=slow_sign)
+
+        urls = []
+        threads = [threading.Thread(target=lambda: urls.append(cache.get('media/a.mp4', sign))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sign.call_count, 1)
+        self.assertEqual(urls, ['signed'] * 20)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+CATALOG_CACHE_DIR = tempfile.mkdtemp(prefix='catalog-cache-')
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CATALOG_CACHE_DIR},
+})
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Django', category=self.category)
+        self.url = reverse('courses-detail', kwargs={'pk': self.course.pk})
+
+    def tearDown(self):
+        caches['catalog'].clear()
+
+    def test_hit_is_served_without_queries(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_change_invalidates_after_commit(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Web'
+            self.category.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['category']['title'], 'Web')
+        self.assertNotEqual(response['ETag'], etag)
+
+class EnrollmentConcurrencyTests(TransactionTestCase):
+    STUDENTS = 600
+    SEATS = 100
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # threads share the in-memory database in shared cache mode, where any writer locks out the readers
+            self.skipTest('needs MySQL or a file based SQLite test database')
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Django', category=category, seat_limit=self.SEATS)
+        User.objects.bulk_create([User(username=f'student{i}', email=f'student{i}@example.com') for i in range(self.STUDENTS)])
+        Student.objects.bulk_create([Student(user=user) for user in User.objects.all()])
+
+    def test_seat_limit_holds_under_parallel_enrollments(self):
+        url = reverse('courses-enroll', kwargs={'pk': self.course.pk})
+        users = list(User.objects.all())
+
+        def enroll(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                return client.post(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            codes = list(executor.map(enroll, users))
+
+        self.course.refresh_from_db()
+        enrolled = self.course.students.count()
+        self.assertEqual(codes.count(201), self.SEATS)
+        self.assertEqual(codes.count(409), self.STUDENTS - self.SEATS)
+        self.assertEqual(enrolled, self.SEATS)
+        self.assertEqual(self.course.student_count, self.SEATS)
+
+@override_settings(COURSE_MEMBERSHIP_CACHE_TTL=0)
+class QueryBudgetTests(TestCase):
+    # the data grows through these sizes, the number of queries of every endpoint must not
+    SIZES = (10, 1000, 10000)
+
+    def test_every_action_declares_a_budget(self):
+        for prefix, viewset, basename in urls.router.registry + urls.courses_router.registry + urls.assignments_router.registry:
+            budgets = getattr(viewset, 'query_budgets', {})
+            actions = [name for name in ('list', 'retrieve', 'create', 'update', 'partial_update', 'destroy') if hasattr(viewset, name)]
+            actions += [extra_action.__name__ for extra_action in viewset.get_extra_actions()]
+            for action in actions:
+                with self.subTest(viewset=viewset.__name__, action=action):
+                    self.assertIn(action, budgets)
+
+    @override_settings(QUERY_STATS_ENABLED=True)
+    def test_middleware_reports_query_stats(self):
+        self._seed(10)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.assertLogs('custom.querystats', 'WARNING') as logs, \
+                mock.patch.dict(CourseCategoryViewSet.query_budgets, {'list': 1}):
+            response = client.get('/api/v1/course_categories/')
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertIn('over its budget of 1', logs.output[0])
+
+    def test_query_count_does_not_grow_with_data(self):
+        counts = {}
+        for size in self.SIZES:
+            self._seed(size)
+            for name, client, url in self._endpoints():
+                # warm up, e.g. the token version cache
+                client.get(url)
+                with record_queries() as stats:
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200, f'{name}: {response.content[:200]}')
+                counts.setdefault(name, []).append(stats.count)
+
+                match = resolve(urlparse(url).path)
+                budget = get_query_budget(match.func, 'GET')
+                self.assertIsNotNone(budget, name)
+                self.assertLessEqual(stats.count, budget, f'{name} ran {stats.count} queries at {size} rows, over its budget of {budget}')
+
+        for name, per_size in counts.items():
+            self.assertEqual(len(set(per_size)), 1, f'{name} ran {per_size} queries at {self.SIZES} rows')
+
+    def _seed(self, size):
+        # top up every table to size rows, the main course holds most of them
+        if not hasattr(self, 'category'):
+            self.category = CourseCategory.objects.create(title='Programming')
+            self.course = Course.objects.create(title='Main', category=self.category)
+            self.admin = User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True)
+
+        start = Course.objects.count()
+        Course.objects.bulk_create([Course(title=f'course {i}', category=self.category) for i in range(start, size)])
+
+        start = Teacher.objects.count()
+        users = User.objects.bulk_create(
+            [User(username=f'teacher{i}', email=f'teacher{i}@example.com', role=User.RoleChoices.TEACHER) for i in range(start, size)] +
+            [User(username=f'student{i}', email=f'student{i}@example.com', role=User.RoleChoices.STUDENT) for i in range(start, size)]
+        )
+        users = User.objects.filter(username__in=[user.username for user in users])
+        Teacher.objects.bulk_create([Teacher(user=user) for user in users if user.role == User.RoleChoices.TEACHER])
+        Student.objects.bulk_create([Student(user=user) for user in users if user.role == User.RoleChoices.STUDENT])
+        for model in (Teacher, Student):
+            through = model.courses.through
+            enrolled = set(through.objects.filter(course=self.course).values_list(f'{model.__name__.lower()}_id', flat=True))
+            through.objects.bulk_create([
+                through(course=self.course, **{f'{model.__name__.lower()}_id': profile_id})
+                for profile_id in model.objects.values_list('id', flat=True) if profile_id not in enrolled
+            ])
+        self.teacher = Teacher.objects.select_related('user').order_by('id').first()
+        self.student = Student.objects.select_related('user').order_by('id').first()
+
+        start = Lesson.objects.count()
+        Lesson.objects.bulk_create([Lesson(title=f'lesson {i}', course=self.course, teacher=self.teacher, video='lesson/videos/a.mp4') for i in range(start, size)])
+        start = Assignment.objects.count()
+        Assignment.objects.bulk_create([Assignment(title=f'assignment {i}', course=self.course, teacher=self.teacher) for i in range(start, size)])
+        self.assignment = Assignment.objects.order_by('id').first()
+        start = AssignmentMaterial.objects.count()
+        AssignmentMaterial.objects.bulk_create([AssignmentMaterial(name=f'material {i}', assignment=self.assignment, file='a.pdf') for i in range(start, size)])
+        start = TeacherJoinCourseRequest.objects.count()
+        teacher_ids = list(Teacher.objects.order_by('id').values_list('id', flat=True)[start:size])
+        courses = list(Course.objects.order_by('id').values_list('id', flat=True)[start:size])
+        TeacherJoinCourseRequest.objects.bulk_create([TeacherJoinCourseRequest(teacher_id=teacher_id, course_id=course_id) for teacher_id, course_id in zip(teacher_ids, courses)])
+        if not ChunkedUpload.objects.exists():
+            self.upload = ChunkedUpload.objects.create(
+                user=self.admin, target=ChunkedUpload.TargetChoices.LESSON_VIDEO, object_id=1,
+                filename='a.mp4', size=1, chunk_size=1, storage_name='lesson/videos/a.mp4'
+            )
+
+    def _endpoints(self):
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        teacher, student = APIClient(), APIClient()
+        for client, user in ((teacher, self.teacher.user), (student, self.student.user)):
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+        course = f'/api/v1/courses/{self.course.id}'
+        lesson = Lesson.objects.order_by('id').first()
+        material = AssignmentMaterial.objects.order_by('id').first()
+        join_request = TeacherJoinCourseRequest.objects.order_by('id').first()
+        return [
+            ('course categories', admin, '/api/v1/course_categories/'),
+            ('course category', admin, f'/api/v1/course_categories/{self.category.id}/'),
+            ('courses', admin, '/api/v1/courses/'),
+            ('courses by students', admin, '/api/v1/courses/?ordering=-student_count'),
+            ('course', admin, f'{course}/'),
+            ('course with rosters', admin, f'{course}/?expand=teachers,students'),
+            ('course teachers', admin, f'{course}/teachers/'),
+            ('course students', admin, f'{course}/students/'),
+            ('join requests', teacher, '/api/v1/teacher_join_course_requests/'),
+            ('join request', teacher, f'/api/v1/teacher_join_course_requests/{join_request.id}/'),
+            ('teachers', admin, '/api/v1/teachers/'),
+            ('teacher', admin, f'/api/v1/teachers/{self.teacher.id}/'),
+            ('teacher me', teacher, '/api/v1/teachers/me/'),
+            ('students', admin, '/api/v1/students/'),
+            ('student', admin, f'/api/v1/students/{self.student.id}/'),
+            ('student me', student, '/api/v1/students/me/'),
+            ('teacher dashboard', teacher, '/api/v1/teachers/me/dashboard/'),
+            ('student dashboard', student, '/api/v1/students/me/dashboard/'),
+            ('assignments', teacher, f'{course}/assignments/'),
+            ('assignment', student, f'{course}/assignments/{self.assignment.id}/'),
+            ('materials', student, f'{course}/assignments/{self.assignment.id}/materials/'),
+            ('material', teacher, f'{course}/assignments/{self.assignment.id}/materials/{material.id}/'),
+            ('lessons', student, f'{course}/lessons/'),
+            ('lesson', teacher, f'{course}/lessons/{lesson.id}/'),
+            ('lesson video', student, f'{course}/lessons/{lesson.id}/video/'),
+            ('course changes', student, f'{course}/changes/?{urlencode({"updated_since": timezone.now().isoformat()})}'),
+            ('upload', admin, f'/api/v1/uploads/{self.upload.id}/'),
+        ]
+
+# the seeded rows are not copied to replicas
+@override_settings(ALLOWED_HOSTS=['localhost'], DATABASE_REPLICAS=[])
+class SeedAndBenchmarkTests(TransactionTestCase):
+    def test_benchmark_seeded_data(self):
+        call_command(
+            'seed_data', courses=3, teachers=2, students=5, lessons_per_course=2, assignments_per_course=1,
+            materials_per_assignment=1, batch_size=4, stdout=io.StringIO()
+        )
+        self.assertEqual(Student.courses.through.objects.count(), 5 * 3)
+        self.assertEqual(sorted(Course.objects.values_list('lesson_count', flat=True)), [2, 2, 2])
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark', requests=4, concurrency=2, warmup=1, output=output.name, stderr=io.StringIO())
+            report = json.load(output)
+
+        self.assertEqual(report['target'], 'in-process')
+        for result in report['scenarios']:
+            self.assertEqual(result['statuses'], {'200': 4}, result['name'])
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+            self.assertIsNotNone(result['queries_per_request'])
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_encoding', iterations=1, output=output.name, stderr=io.StringIO())
+            report = json.load(output)
+        for result in report['scenarios']:
+            self.assertGreater(result['encodings']['json_stdlib']['bytes'], result['encodings']['json_stdlib']['gzip']['bytes'])
+
+# the replica of settings_dev, SQLite unless DEV_REPLICA=mysql
+@skipUnless('replica' in settings.DATABASES, 'needs the replica database of settings_dev')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # the replica is a separate database which only catches up when _replicate() copies rows over
+    databases = '__all__'
+
+    def setUp(self):
+        self.replica = 'replica'
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        self.students = []
+        for name in ('alice', 'bob'):
+            user = User.objects.create(username=name, email=f'{name}@example.com')
+            student = Student.objects.create(user=user)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+            self.students.append(client)
+            self._replicate(user, student)
+        self._replicate(category, self.course)
+
+    def tearDown(self):
+        cache.clear()
+        replicas._unreachable_until.clear()
+
+    def _replicate(self, *objects):
+        for obj in objects:
+            obj.save(using=self.replica)
+
+    def _get_title(self, client):
+        return client.get(f'/api/v1/courses/{self.course.id}/').json()['title']
+
+    def test_reads_follow_the_user_last_write(self):
+        alice, bob = self.students
+        Course.objects.filter(pk=self.course.pk).update(title='Python 3')
+        self.assertEqual(self._get_title(alice), 'Python')
+
+        # alice writes, her reads stick to the primary for a while, bob still reads the lagging replica
+        self.assertEqual(alice.post(f'/api/v1/courses/{self.course.id}/enroll/').status_code, 201)
+        self.assertEqual(self._get_title(alice), 'Python 3')
+        self.assertEqual(self._get_title(bob), 'Python')
+
+        # the pin expired
+        cache.delete(f'replica_pin:{User.objects.get(username="alice").pk}')
+        self.assertEqual(self._get_title(alice), 'Python')
+
+    def test_unreachable_replica_is_skipped(self):
+        alice, _ = self.students
+        Course.objects.filter(pk=self.course.pk).update(title='Python 3')
+        # not connected, without closing it: closing an in-memory SQLite test database drops it
+        with mock.patch.object(connections[self.replica], 'connection', None), \
+                mock.patch.object(connections[self.replica], 'ensure_connection', side_effect=OperationalError):
+            self.assertEqual(self._get_title(alice), 'Python 3')
+        # not tried again until DATABASE_REPLICA_RETRY_SECONDS passed
+        self.assertEqual(self._get_title(alice), 'Python 3')
+
+# the API with the async views, see AsyncViewsTests
+urlpatterns = [
+    path('api/v1/', include(urls.router.urls)),
+    path('api/v1/', include(async_views.with_async_reads(urls.courses_router.urls))),
+    path('api/v1/', include(async_views.with_async_reads(urls.assignments_router.urls))),
+]
+
+@override_settings(DATABASE_REPLICAS=[], COURSE_MEMBERSHIP_CACHE_TTL=0)
+class AsyncViewsTests(TransactionTestCase):
+    # the async views run their queries on other threads, which only see committed rows
+
+    def setUp(self):
+        category = CourseCategory.objects.create(title='Programming')
+        course = Course.objects.create(title='Python', category=category)
+        teacher = Teacher.objects.create(user=User.objects.create(username='teacher', email='teacher@example.com', role=User.RoleChoices.TEACHER))
+        student = Student.objects.create(user=User.objects.create(username='student', email='student@example.com'))
+        outsider = Student.objects.create(user=User.objects.create(username='outsider', email='outsider@example.com'))
+        teacher.courses.add(course)
+        student.courses.add(course)
+        lesson = Lesson.objects.create(title='Intro', course=course, teacher=teacher, video='course/videos/intro.mp4')
+        assignment = Assignment.objects.create(title='Homework', course=course, teacher=teacher)
+        AssignmentMaterial.objects.create(name='Sheet', assignment=assignment, file='assignment/sheet.pdf')
+
+        self.tokens = [None, 'invalid'] + [str(ClaimsRefreshToken.for_user(profile.user).access_token) for profile in (teacher, student, outsider)]
+        self.paths = [
+            f'/api/v1/courses/{course.id}/lessons/',
+            f'/api/v1/courses/{course.id}/lessons/{lesson.id}/',
+            f'/api/v1/courses/{course.id}/lessons/{lesson.id}/video/',
+            f'/api/v1/courses/{course.id}/lessons/0/video/',
+            f'/api/v1/courses/{course.id}/assignments/{assignment.id}/materials/',
+            f'/api/v1/courses/{course.id}/assignments/0/materials/',
+            '/api/v1/courses/0/lessons/',
+        ]
+
+    def test_async_views_answer_as_the_viewsets(self):
+        for path_ in self.paths:
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(path_, urlconf=__name__).func), path_)
+            for token in self.tokens:
+                self._assert_same_response(path_, token, 'application/json')
+
+    @skipUnless(renderers.msgpack, 'needs msgpack')
+    def test_renderer_negotiated_as_the_viewsets(self):
+        for path_ in self.paths[:2] + [self.paths[2] + '?format=msgpack', self.paths[4]]:
+            for token in (None, self.tokens[3]):
+                response = self._assert_same_response(path_, token, 'application/msgpack')
+                self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(response.content)['results'][0]['name'], 'Sheet')
+
+    def _assert_same_response(self, path_, token, accept):
+        headers = {'authorization': f'Bearer {token}'} if token else {}
+        expected = self.client.get(path_, HTTP_ACCEPT=accept, **{f'HTTP_{k.upper()}': v for k, v in headers.items()})
+        with self.settings(ROOT_URLCONF=__name__):
+            # served by the async views
+            with mock.patch.object(urls.views.LessonViewSet, 'dispatch', side_effect=AssertionError(path_)), \
+                    mock.patch.object(urls.views.AssignmentMaterialViewSet, 'dispatch', side_effect=AssertionError(path_)):
+                response = async_to_sync(self._async_request)('get', path_, accept=accept, **headers)
+
+        with self.subTest(path=path_, token=token and token[:10], accept=accept):
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response['Content-Type'], expected['Content-Type'])
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response.get('WWW-Authenticate'), expected.get('WWW-Authenticate'))
+        return response
+
+    def test_other_methods_go_to_the_viewsets(self):
+        teacher_token = self.tokens[2]
+        with self.settings(ROOT_URLCONF=__name__):
+            response = async_to_sync(self._async_request)(
+                'post', self.paths[0], {'title': 'Next'}, content_type='application/json', authorization=f'Bearer {teacher_token}'
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Lesson.objects.filter(title='Next').count(), 1)
+
+    async def _async_request(self, method, *args, **kwargs):
+        return await getattr(self.async_client, method)(*args, **kwargs)
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), IMAGE_PROCESSES=1)
+class ProfilePictureTests(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create(username='teacher', email='teacher@example.com', role=User.RoleChoices.TEACHER)
+        self.teacher = Teacher.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def _photo(self, name):
+        # 300x200 stored sideways, as phones do, with the place it was taken
+        image = Image.new('RGB', (300, 200), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x8825] = {1: 'N', 2: (22.0, 17.0, 0.0)}
+        photo = io.BytesIO()
+        image.save(photo, 'JPEG', exif=exif)
+        photo.name = name
+        photo.seek(0)
+        return photo
+
+    def _wait_until_processed(self, profile):
+        for _ in range(100):
+            profile.refresh_from_db()
+            if profile_pictures.is_processed(profile.profile_picture.name, profile.profile_picture_variants):
+                return profile
+            time.sleep(0.1)
+        self.fail('the profile picture was not processed')
+
+    def test_upload_is_cleaned_and_gets_thumbnails(self):
+        response = self.client.put('/api/v1/teachers/me/', {'profile_picture': self._photo('me.jpg')}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        uploaded = Teacher.objects.get(pk=self.teacher.pk).profile_picture.name
+        self.assertEqual(self.client.get('/api/v1/teachers/me/').json()['profile_picture_srcset'], {})
+
+        teacher = self._wait_until_processed(self.teacher)
+        storage = teacher.profile_picture.storage
+        self.assertFalse(storage.exists(uploaded))
+        with Image.open(teacher.profile_picture.path) as cleaned:
+            self.assertEqual(cleaned.size, (200, 300))
+            self.assertEqual(len(cleaned.getexif()), 0)
+        for size in settings.PROFILE_PICTURE_SIZES:
+            with storage.open(teacher.profile_picture_variants[str(size)]) as file, Image.open(file) as thumbnail:
+                self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (size, size)))
+
+        srcset = self.client.get('/api/v1/teachers/me/').json()['profile_picture_srcset']
+        self.assertEqual(list(srcset), [f'{size}w' for size in settings.PROFILE_PICTURE_SIZES])
+        self.assertTrue(srcset['64w'].endswith(teacher.profile_picture_variants['64']))
+
+    def test_backfill_processes_existing_pictures(self):
+        name = Teacher._meta.get_field('profile_picture').storage.save('teacher/images/old.jpg', self._photo('old.jpg'))
+        # written without signals, as pictures uploaded before thumbnails existed
+        Teacher.objects.filter(pk=self.teacher.pk).update(profile_picture=name)
+
+        out = io.StringIO()
+        call_command('process_profile_pictures', processes=1, stdout=out)
+        self.assertIn('processed 1 profile pictures', out.getvalue())
+        self._wait_until_processed(self.teacher)
+
+        out = io.StringIO()
+        call_command('process_profile_pictures', processes=1, stdout=out)
+        self.assertIn('processed 0 profile pictures', out.getvalue())
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'))
+class MaterialArchiveTests(TestCase):
+    def setUp(self):
+        # token versions of the users of other tests are cached by their ids, which are reused
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        course = Course.objects.create(title='Python', category=category)
+        user = User.objects.create(username='student', email='student@example.com')
+        Student.objects.create(user=user).courses.add(course)
+        assignment = Assignment.objects.create(title='Homework', course=course)
+        self.contents = {
+            'Notes.txt': b'notes ' * 20000,
+            'Notes (2).txt': b'more notes',
+            'Slides.png': b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 1000,
+        }
+        for name, filename, content in zip(['Notes', 'Notes', 'Slides'], ['a.txt', 'b.txt', 'c.png'], self.contents.values()):
+            material = AssignmentMaterial(name=name, assignment=assignment)
+            material.file.save(filename, ContentFile(content))
+
+        self.url = f'/api/v1/courses/{course.id}/assignments/{assignment.id}/materials/archive/'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def test_archive_streams_every_material(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/zip')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(archive.namelist(), list(self.contents))
+        for name, content in self.contents.items():
+            self.assertEqual(archive.read(name), content)
+        # png is compressed already
+        self.assertEqual(archive.getinfo('Notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo('Slides.png').compress_type, zipfile.ZIP_STORED)
+
+    def test_unchanged_archive_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        AssignmentMaterial.objects.filter(name='Slides').update(name='Slides v2')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+@override_settings(CHANGE_FEED_LAG=0)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        other = Course.objects.create(title='Go', category=category)
+        user = User.objects.create(username='student', email='student@example.com')
+        Student.objects.create(user=user).courses.add(self.course)
+        self.lesson = Lesson.objects.create(title='Basics', course=self.course)
+        Lesson.objects.create(title='Goroutines', course=other)
+        self.assignment = Assignment.objects.create(title='Homework', course=self.course)
+        self.material = AssignmentMaterial.objects.create(name='Notes', assignment=self.assignment, file='a.txt')
+
+        self.url = f'/api/v1/courses/{self.course.id}/changes/'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def test_first_sync_gets_every_row(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([lesson['id'] for lesson in response.data['lessons']], [self.lesson.id])
+        self.assertEqual([assignment['id'] for assignment in response.data['assignments']], [self.assignment.id])
+        self.assertEqual(response.data['materials'][0]['assignment'], self.assignment.id)
+        self.assertEqual(response.data['deleted'], {'lessons': [], 'assignments': [], 'materials': []})
+
+    def test_sync_gets_rows_saved_and_deleted_since_watermark(self):
+        watermark = self.client.get(self.url).data['watermark']
+        self.lesson.title = 'Basics, revised'
+        self.lesson.save()
+        material_id = self.material.id
+        self.material.delete()
+
+        response = self.client.get(self.url, {'updated_since': watermark})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([lesson['title'] for lesson in response.data['lessons']], ['Basics, revised'])
+        self.assertEqual(response.data['assignments'], [])
+        self.assertEqual(response.data['materials'], [])
+        self.assertEqual(response.data['deleted'], {'lessons': [], 'assignments': [], 'materials': [material_id]})
+
+        # deleting the course takes its tombstones along
+        Course.objects.filter(pk=self.course.pk).delete()
+        self.assertFalse(Tombstone.objects.filter(course_id=self.course.id).exists())
+
+    def test_sync_older_than_retention_is_gone(self):
+        since = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_RETENTION + 60)
+        response = self.client.get(self.url, {'updated_since': since.isoformat()})
+        self.assertEqual(response.status_code, 410)
+
+        response = self.client.get(self.url, {'updated_since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(DASHBOARD_LESSONS=5, DASHBOARD_ASSIGNMENTS=5)
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['catalog'].clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.courses = [Course.objects.create(title=f'course {i}', category=category) for i in range(3)]
+        user = User.objects.create(username='student', email='student@example.com')
+        Student.objects.create(user=user).courses.add(*self.courses[:2])
+        for course in self.courses:
+            for i in range(7):
+                Lesson.objects.create(title=f'lesson {i}', course=course)
+            Assignment.objects.create(title='closed', course=course, allow_submit=False)
+            Assignment.objects.create(title='open', course=course)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+        # caches the token version
+        self.client.get('/api/v1/students/me/')
+
+    def test_dashboard_shows_latest_content_of_each_course(self):
+        with record_queries() as stats:
+            response = self.client.get('/api/v1/students/me/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        # the courses, their lessons and their assignments
+        self.assertEqual(stats.count, 3)
+
+        self.assertEqual([course['id'] for course in response.data], [course.id for course in self.courses[:2]])
+        for course in response.data:
+            self.assertEqual([lesson['title'] for lesson in course['latest_lessons']], [f'lesson {i}' for i in range(6, 1, -1)])
+            self.assertEqual([assignment['title'] for assignment in course['latest_open_assignments']], ['open'])
+
+    def test_dashboard_is_cached_until_new_content(self):
+        self.client.get('/api/v1/students/me/dashboard/')
+        with record_queries() as stats:
+            self.client.get('/api/v1/students/me/dashboard/')
+        self.assertEqual(stats.count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lesson.objects.create(title='lesson 7', course=self.courses[0])
+        response = self.client.get('/api/v1/students/me/dashboard/')
+        self.assertEqual(response.data[0]['latest_lessons'][0]['title'], 'lesson 7')
+
+@override_settings(COURSE_MEMBERSHIP_CACHE_TTL=0, BATCH_MAX_REQUESTS=5)
+class BatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        self.other_course = Course.objects.create(title='Go', category=category)
+        user = User.objects.create(username='student', email='student@example.com')
+        Student.objects.create(user=user).courses.add(self.course)
+        self.assignment = Assignment.objects.create(title='Homework', course=self.course)
+        self.material = AssignmentMaterial.objects.create(name='Notes', assignment=self.assignment, file='a.txt')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def _batch(self, *requests):
+        return self.client.post('/api/v1/batch/', {'requests': list(requests)}, format='json')
+
+    def test_requests_refer_to_earlier_responses_and_share_authentication(self):
+        course = f'/api/v1/courses/{self.course.id}'
+        with mock.patch.object(authentication, 'get_token_version', wraps=authentication.get_token_version) as get_token_version, \
+                mock.patch.object(membership, '_query_is_member', wraps=membership._query_is_member) as query_is_member:
+            response = self._batch(
+                {'method': 'GET', 'path': f'{course}/assignments/', 'name': 'assignments'},
+                {'method': 'GET', 'path': f'{course}/assignments/{{{{assignments.results.0.id}}}}/materials/'},
+                {'method': 'GET', 'path': '/api/v1/courses/0/'},
+                {'method': 'GET', 'path': f'{course}/assignments/{{{{2.id}}}}/'},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 200, 404, 424])
+        self.assertEqual(response.data['responses'][1]['body']['results'][0]['id'], self.material.id)
+        get_token_version.assert_called_once()
+        query_is_member.assert_called_once()
+
+    def test_writes_are_seen_by_later_requests(self):
+        lessons = f'/api/v1/courses/{self.other_course.id}/lessons/'
+        response = self._batch(
+            {'method': 'GET', 'path': lessons},
+            {'method': 'POST', 'path': f'/api/v1/courses/{self.other_course.id}/enroll/'},
+            {'method': 'GET', 'path': lessons},
+        )
+        self.assertEqual([item['status'] for item in response.data['responses']], [403, 201, 200])
+
+    def test_batch_size_is_limited(self):
+        response = self._batch(*[{'method': 'GET', 'path': '/api/v1/courses/'}] * 6)
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(DATABASE_REPLICAS=[], COURSE_MEMBERSHIP_CACHE_TTL=0)
+class FastReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category, seat_limit=30)
+        Course.objects.create(title='Go', category=category)
+        teacher = Teacher.objects.create(
+            user=User.objects.create(username='teacher', email='teacher@example.com'),
+            profile_picture='teacher/profile_pictures/a.webp',
+            profile_picture_variants={'source': 'teacher/profile_pictures/a.webp', '64': 'teacher/profile_pictures/a_64.webp', '256': 'teacher/profile_pictures/a_256.webp'},
+        )
+        # not processed yet
+        student = Student.objects.create(
+            user=User.objects.create(username='student', email='student@example.com'),
+            profile_picture='student/profile_pictures/b.jpg',
+        )
+        teacher.courses.add(self.course)
+        student.courses.add(self.course)
+        Student.objects.create(user=User.objects.create(username='other', email='other@example.com')).courses.add(self.course)
+        self.lesson = Lesson.objects.create(title='Intro', course=self.course, teacher=teacher, description='Hello')
+        Lesson.objects.create(title='Without teacher', course=self.course)
+        admin = User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(admin).access_token}')
+
+    def test_same_bytes_as_serializers(self):
+        paths = [
+            '/api/v1/courses/',
+            '/api/v1/courses/?expand=teachers,students',
+            '/api/v1/courses/?fields=id,title,students_url&expand=students',
+            f'/api/v1/courses/{self.course.id}/',
+            f'/api/v1/courses/{self.course.id}/?expand=teachers',
+            f'/api/v1/courses/{self.course.id}/teachers/',
+            f'/api/v1/courses/{self.course.id}/students/',
+            f'/api/v1/courses/{self.course.id}/students/?page_size=1',
+            f'/api/v1/courses/{self.course.id}/lessons/',
+            f'/api/v1/courses/{self.course.id}/lessons/{self.lesson.id}/',
+        ]
+        for url in paths:
+            with self.subTest(url=url):
+                with override_settings(FAST_READ_SERIALIZERS=False):
+                    expected = self.client.get(url)
+                with override_settings(FAST_READ_SERIALIZERS=True):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+    @override_settings(FAST_READ_SERIALIZERS=True)
+    def test_missing_lesson(self):
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/lessons/0/')
+        self.assertEqual(response.status_code, 404)
+
+class RendererTests(SimpleTestCase):
+    data = {
+        'id': 1, 'title': 'Grüße\u2028"quoted"', 'price': Decimal('9.90'), 'ratio': 0.1, 'empty': None,
+        'created_at': datetime(2023, 6, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc), 'day': date(2023, 6, 1),
+        'lazy': gettext_lazy('Not found.'), 'counts': {1: 2}, 'items': [OrderedDict(a=True)],
+    }
+
+    def test_json_is_drf_json(self):
+        self.assertEqual(renderers.JSONRenderer().render(self.data), DRFJSONRenderer().render(self.data))
+
+    @skipUnless(renderers.msgpack, 'needs msgpack')
+    def test_msgpack(self):
+        decoded = renderers.msgpack.unpackb(renderers.MessagePackRenderer().render(self.data), strict_map_key=False)
+        self.assertEqual(decoded, {**json.loads(DRFJSONRenderer().render(self.data)), 'counts': {1: 2}})
+
+@override_settings(COMPRESSION_MIN_SIZE=100, DATABASE_REPLICAS=[])
+class CompressionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['catalog'].clear()
+        category = CourseCategory.objects.create(title='Programming')
+        for i in range(5):
+            Course.objects.create(title=f'course {i}', category=category)
+
+    def test_gzip(self):
+        plain = self.client.get('/api/v1/courses/')
+        response = self.client.get('/api/v1/courses/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+
+        # weak comparison
+        response = self.client.get('/api/v1/courses/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @skipUnless(compression.brotli, 'needs brotli')
+    def test_brotli_is_preferred(self):
+        plain = self.client.get('/api/v1/courses/')
+        response = self.client.get('/api/v1/courses/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+        self.assertEqual(compression.choose_encoding('br;q=0.5, gzip'), 'gzip')
+
+    def test_only_api_responses_above_threshold(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        middleware = compression.CompressionMiddleware(lambda request: None)
+        for response in (
+            HttpResponse(b'{}', content_type='application/json'),
+            StreamingHttpResponse([b'PK' * 100], content_type='application/zip'),
+            HttpResponse(b'a' * 200, content_type='video/mp4'),
+        ):
+            self.assertFalse(middleware.process_response(request, response).has_header('Content-Encoding'))
+        self.assertEqual(compression.choose_encoding('identity'), None)
+
+        response = middleware.process_response(request, StreamingHttpResponse([b'[', b'1,' * 100, b'1]'], content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'[' + b'1,' * 100 + b'1]')
+
+@override_settings(
+    DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), CHUNKED_UPLOAD_SPOOL_DIR=tempfile.mkdtemp(prefix='spool-'),
+    CHUNKED_UPLOAD_CHUNK_SIZE=16,
+)
+class ChunkedUploadTests(TestCase):
+    content = b'\x00\x00\x00\x18ftypmp42' + bytes(range(32))
+
+    def setUp(self):
+        cache.clear()
+        course = Course.objects.create(title='Python', category=CourseCategory.objects.create(title='Programming'))
+        self.lesson = Lesson.objects.create(title='Intro', course=course)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True))
+        response = self.client.post('/api/v1/uploads/', {
+            'target': 'lesson_video', 'object_id': self.lesson.id, 'filename': 'intro.mp4', 'size': len(self.content),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.url = f"/api/v1/uploads/{response.data['id']}/"
+
+    def _chunk(self, number, data=None, checksum=None):
+        data = self.content[number * 16:(number + 1) * 16] if data is None else data
+        return self.client.generic(
+            'PUT', f'{self.url}chunk/', data, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(number * 16), HTTP_UPLOAD_CHECKSUM=f'sha256 {checksum or hashlib.sha256(data).hexdigest()}',
+        )
+
+    def test_chunks_in_any_order(self):
+        self.assertEqual(self._chunk(2).data['received_chunks'], [2])
+        self.assertEqual(self._chunk(0).status_code, 200)
+        # retried
+        self.assertEqual(self._chunk(0).data['received_chunks'], [0, 2])
+
+        response = self.client.post(f'{self.url}complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['missing_chunks'], [1])
+
+        response = self._chunk(1, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).data['received_chunks'], [0, 2])
+
+        self._chunk(1)
+        self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 201)
+        self.lesson.refresh_from_db()
+        with self.lesson.video.open('rb') as video:
+            self.assertEqual(video.read(), self.content)
+
+        response = self.client.post(f'{self.url}complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['message'], 'upload is already complete')
+
+    def _upload_all(self):
+        for number in range(3):
+            self.assertEqual(self._chunk(number).status_code, 200)
+        upload = ChunkedUpload.objects.get()
+        return upload, os.path.join(settings.CHUNKED_UPLOAD_SPOOL_DIR, str(upload.id))
+
+    def test_target_deleted(self):
+        upload, spool = self._upload_all()
+        self.lesson.delete()
+        self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 404)
+        # aborted, nothing moved into the storage
+        self.assertFalse(os.path.exists(spool))
+        self.assertFalse(Lesson._meta.get_field('video').storage.exists(upload.storage_name))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_attach_fails(self):
+        upload, spool = self._upload_all()
+        storage = Lesson._meta.get_field('video').storage
+        with mock.patch('custom.uploads.attach', side_effect=Lesson.DoesNotExist):
+            self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 404)
+        self.assertFalse(os.path.exists(spool))
+        self.assertFalse(storage.exists(upload.storage_name))
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+        self.client.post('/api/v1/uploads/', {'target': 'lesson_video', 'object_id': self.lesson.id, 'filename': 'intro.mp4', 'size': len(self.content)})
+        self.url = f'/api/v1/uploads/{ChunkedUpload.objects.get().id}/'
+        upload, spool = self._upload_all()
+        with mock.patch('custom.uploads.attach', side_effect=OperationalError), self.assertLogs('custom.uploads', 'ERROR'):
+            response = self.client.post(f'{self.url}complete/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data['message'], 'The upload could not be attached, start a new upload.')
+        self.assertFalse(storage.exists(upload.storage_name))
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_chunk_after_complete_began(self):
+        upload, spool = self._upload_all()
+        read_chunk = uploads.read_chunk
+
+        def complete_meanwhile(*args):
+            # another request completed the upload while this chunk was being received
+            sha256 = read_chunk(*args)
+            self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 201)
+            return sha256
+
+        with mock.patch('custom.views.read_chunk', complete_meanwhile):
+            response = self._chunk(1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(self.url).data['received_chunks'], [0, 1, 2])
+
+    def test_chunk_after_abort(self):
+        upload, spool = self._upload_all()
+        os.remove(spool)
+        response = self._chunk(1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['detail'], 'The upload no longer accepts chunks.')
+        # the part it was to replace is kept
+        self.assertEqual(self.client.get(self.url).data['received_chunks'], [0, 1, 2])
+
+    @override_settings(CHUNKED_UPLOAD_MAX_SIZES={'lesson_video': 32, 'assignment_material': 32})
+    def test_size_limit(self):
+        response = self.client.post('/api/v1/uploads/', {
+            'target': 'lesson_video', 'object_id': self.lesson.id, 'filename': 'intro.mp4', 'size': 33,
+        })
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(
+    DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), CHUNKED_UPLOAD_SPOOL_DIR=tempfile.mkdtemp(prefix='spool-'),
+    CHUNKED_UPLOAD_CHUNK_SIZE=16, CHUNKED_UPLOAD_S3_MAX_WORKERS=2,
+)
+class S3ChunkedUploadTests(TransactionTestCase):
+    content = ChunkedUploadTests.content
+
+    def setUp(self):
+        cache.clear()
+        course = Course.objects.create(title='Python', category=CourseCategory.objects.create(title='Programming'))
+        self.lesson = Lesson.objects.create(title='Intro', course=course)
+        self.admin = User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True)
+
+        self.release = threading.Event()
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.s3 = mock.Mock()
+        self.s3.create_multipart_upload.return_value = {'UploadId': 'abc'}
+        self.s3.upload_part.side_effect = self._upload_part
+        backend = uploads.S3UploadBackend(mock.Mock(bucket_name='bucket', _normalize_name=lambda name: name, _get_write_parameters=lambda name: {}))
+        for target in ('custom.views.get_backend', 'custom.serializers.get_backend', 'custom.uploads.get_backend'):
+            patcher = mock.patch(target, return_value=backend)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('custom.uploads.get_s3_client', return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._shutdown_pools)
+
+        response = self._client().post('/api/v1/uploads/', {
+            'target': 'lesson_video', 'object_id': self.lesson.id, 'filename': 'intro.mp4', 'size': len(self.content),
+        })
+        self.url = f"/api/v1/uploads/{response.data['id']}/"
+
+    def _shutdown_pools(self):
+        self.release.set()
+        for executor, _ in uploads._part_pools.values():
+            executor.shutdown()
+        uploads._part_pools.clear()
+
+    def _upload_part(self, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self.assertTrue(self.release.wait(10))
+            return {'ETag': f'"{kwargs["PartNumber"]}"'}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _client(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client
+
+    def _chunk(self, number):
+        data = self.content[number * 16:(number + 1) * 16]
+        return self._client().generic(
+            'PUT', f'{self.url}chunk/', data, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(number * 16), HTTP_UPLOAD_CHECKSUM=f'sha256 {hashlib.sha256(data).hexdigest()}',
+        )
+
+    def _wait_until_uploaded(self):
+        deadline = time.monotonic() + 10
+        while self._client().get(self.url).data['uploading_chunks']:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_parts_upload_in_the_background(self):
+        # answered while the parts upload
+        self.assertEqual(self._chunk(0).data['uploading_chunks'], [0])
+        response = self._chunk(1)
+        self.assertEqual((response.data['received_chunks'], response.data['uploading_chunks']), ([], [0, 1]))
+
+        # no more than CHUNKED_UPLOAD_S3_MAX_WORKERS parts in flight, the next chunk waits for a worker
+        third = threading.Thread(target=self._chunk, args=(2,))
+        third.start()
+        third.join(0.2)
+        self.assertTrue(third.is_alive())
+        self.assertEqual(self.max_in_flight, 2)
+
+        response = self._client().post(f'{self.url}complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['uploading_chunks'], [0, 1, 2])
+
+        self.release.set()
+        third.join(10)
+        self._wait_until_uploaded()
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertEqual(self._client().post(f'{self.url}complete/').status_code, 201)
+        parts = self.s3.complete_multipart_upload.call_args.kwargs['MultipartUpload']['Parts']
+        self.assertEqual(parts, [{'ETag': f'"{number}"', 'PartNumber': number} for number in (1, 2, 3)])
+
+    def test_failed_part_is_not_received(self):
+        self.s3.upload_part.side_effect = ClientError({'Error': {'Code': 'InternalError'}}, 'UploadPart')
+        with self.assertLogs('custom.uploads', 'ERROR'):
+            self._chunk(0)
+            self._wait_until_uploaded()
+        self.assertEqual(self._client().get(self.url).data['received_chunks'], [])
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), USE_S3=False)
+class VideoStreamTests(TestCase):
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        cache.clear()
+        course = Course.objects.create(title='Python', category=CourseCategory.objects.create(title='Programming'))
+        self.lesson = Lesson.objects.create(title='Intro', course=course)
+        self.lesson.video.save('intro.mp4', ContentFile(self.content))
+        self.url = f'/api/v1/courses/{course.id}/lessons/{self.lesson.id}/video/stream/'
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True))
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_ranges(self):
+        for header, start, end in (('bytes=0-', 0, 1023), ('bytes=100-199', 100, 199), ('bytes=-24', 1000, 1023)):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+                self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_missing_file(self):
+        os.remove(self.lesson.video.path)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_signed_url(self):
+        url = self.client.get(f'/api/v1/courses/{self.lesson.course_id}/lessons/{self.lesson.id}/video/').data['url']
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(url, HTTP_RANGE='bytes=0-9').status_code, 206)
+        self.assertEqual(anonymous.get(self.url).status_code, 401)
+        self.assertEqual(anonymous.get(url.replace(str(self.lesson.id) + '/video', '0/video')).status_code, 401)
+
+@override_settings(DATABASE_REPLICAS=[], COURSE_MEMBERSHIP_CACHE_TTL=0)
+class JoinRequestDecisionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        self.other_course = Course.objects.create(title='Go', category=category)
+        user = User.objects.create(username='teacher', email='teacher@example.com', role=User.RoleChoices.TEACHER)
+        self.teacher = Teacher.objects.create(user=user)
+        self.teacher.courses.add(self.course)
+        self.applicants = [
+            Teacher.objects.create(user=User.objects.create(username=f'applicant{i}', email=f'applicant{i}@example.com', role=User.RoleChoices.TEACHER))
+            for i in range(3)
+        ]
+        self.accepted = TeacherJoinCourseRequest.objects.create(teacher=self.applicants[0], course=self.course)
+        self.rejected = TeacherJoinCourseRequest.objects.create(teacher=self.applicants[1], course=self.course)
+        self.forbidden = TeacherJoinCourseRequest.objects.create(teacher=self.applicants[2], course=self.other_course)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def _decide(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/teacher_join_course_requests/decide/', {'decisions': [
+                {'id': self.accepted.id, 'accept': True},
+                {'id': self.rejected.id, 'accept': False},
+                {'id': self.forbidden.id, 'accept': True},
+                {'id': 999, 'accept': True},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return {result['id']: result['status'] for result in response.data['results']}
+
+    def test_outcomes_and_counters(self):
+        self.assertEqual(self._decide(), {self.accepted.id: 'accepted', self.rejected.id: 'rejected', self.forbidden.id: 'forbidden', 999: 'not_found'})
+        self.assertEqual(set(self.course.teachers.all()), {self.teacher, self.applicants[0]})
+        self.assertEqual(set(TeacherJoinCourseRequest.objects.values_list('id', flat=True)), {self.forbidden.id})
+        self.course.refresh_from_db()
+        self.other_course.refresh_from_db()
+        self.assertEqual((self.course.join_request_count, self.course.teacher_count), (0, 2))
+        self.assertEqual(self.other_course.join_request_count, 1)
+
+        # deciding again changes nothing
+        self.assertEqual(self._decide()[self.accepted.id], 'not_found')
+        self.other_course.refresh_from_db()
+        self.assertEqual(self.other_course.join_request_count, 1)
+
+    def test_deletions_batched(self):
+        receiver = mock.Mock()
+        post_delete.connect(receiver, sender=TeacherJoinCourseRequest)
+        self.addCleanup(post_delete.disconnect, receiver, sender=TeacherJoinCourseRequest)
+        with mock.patch('custom.enrollments.decrement', wraps=counters.decrement) as decrement, \
+                mock.patch('custom.enrollments.bump_versions') as bump_versions, mock.patch('custom.signals.bump_versions') as signal_bump_versions:
+            self._decide()
+        # other receivers still see every deleted request
+        self.assertEqual(sorted(call.kwargs['instance'].teacher_id for call in receiver.call_args_list), [self.applicants[0].id, self.applicants[1].id])
+        decrement.assert_called_once_with('join_request_count', [self.course.id, self.course.id])
+        bump_versions.assert_called_once_with(['teacherjoincourserequest'])
+        self.assertNotIn(mock.call(['teacherjoincourserequest']), signal_bump_versions.call_args_list)
+        # outside of decisions, deletions count as usual
+        self.forbidden.delete()
+        self.other_course.refresh_from_db()
+        self.assertEqual(self.other_course.join_request_count, 0)
+
+@override_settings(DATABASE_REPLICAS=[])
+class CourseCounterTests(TestCase):
+    def setUp(self):
+        category = CourseCategory.objects.create(title='Programming')
+        self.courses = [Course.objects.create(title=f'course {i}', category=category) for i in range(2)]
+        self.students = [
+            Student.objects.create(user=User.objects.create(username=f'student{i}', email=f'student{i}@example.com'))
+            for i in range(3)
+        ]
+        self.teacher = Teacher.objects.create(user=User.objects.create(username='teacher', email='teacher@example.com'))
+
+    def _counts(self, course, *fields):
+        return tuple(Course.objects.filter(pk=course.pk).values_list(*fields).get())
+
+    def test_roster_changes(self):
+        first, second = self.courses
+        self.students[0].courses.add(first, second)
+        first.students.add(self.students[1], self.students[2])
+        # adding again adds nothing
+        first.students.add(self.students[1])
+        self.teacher.courses.add(first)
+        self.assertEqual(self._counts(first, 'student_count', 'teacher_count'), (3, 1))
+        self.assertEqual(self._counts(second, 'student_count'), (1,))
+
+        first.students.remove(self.students[1], self.students[1].pk + 100)
+        self.assertEqual(self._counts(first, 'student_count'), (2,))
+        self.students[0].courses.clear()
+        self.assertEqual((self._counts(first, 'student_count'), self._counts(second, 'student_count')), ((1,), (0,)))
+        first.teachers.clear()
+        self.assertEqual(self._counts(first, 'teacher_count'), (0,))
+
+        bulk_enroll(first, [str(student.pk) for student in self.students])
+        self.assertEqual(self._counts(first, 'student_count'), (3,))
+        self.students[0].delete()
+        self.assertEqual(self._counts(first, 'student_count'), (2,))
+
+    def test_children(self):
+        course = self.courses[0]
+        lesson = Lesson.objects.create(title='Intro', course=course)
+        Lesson.objects.create(title='Next', course=course)
+        Assignment.objects.create(title='Homework', course=course)
+        TeacherJoinCourseRequest.objects.create(teacher=self.teacher, course=course)
+        self.assertEqual(self._counts(course, 'lesson_count', 'assignment_count', 'join_request_count'), (2, 1, 1))
+
+        lesson.delete()
+        TeacherJoinCourseRequest.objects.all().delete()
+        self.assertEqual(self._counts(course, 'lesson_count', 'assignment_count', 'join_request_count'), (1, 1, 0))
+
+    def test_recount_repairs_drift(self):
+        course = self.courses[0]
+        course.students.add(*self.students)
+        Lesson.objects.create(title='Intro', course=course)
+        Course.objects.filter(pk=course.pk).update(student_count=99, lesson_count=0)
+
+        output = io.StringIO()
+        call_command('recount_courses', stdout=output)
+        self.assertIn('repaired 1', output.getvalue())
+        self.assertEqual(self._counts(course, 'student_count', 'lesson_count'), (3, 1))
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), COURSE_MEMBERSHIP_CACHE_TTL=0)
+class UploadLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        course = Course.objects.create(title='Python', category=CourseCategory.objects.create(title='Programming'))
+        assignment = Assignment.objects.create(title='Homework', course=course)
+        user = User.objects.create(username='teacher', email='teacher@example.com', role=User.RoleChoices.TEACHER)
+        Teacher.objects.create(user=user).courses.add(course)
+        self.materials_url = f'/api/v1/courses/{course.id}/assignments/{assignment.id}/materials/'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def _file(self, name, content):
+        file = io.BytesIO(content)
+        file.name = name
+        return file
+
+    def _png(self):
+        png = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(png, 'PNG')
+        return self._file('me.png', png.getvalue())
+
+    def test_allowed_files(self):
+        for name, content in (('notes.pdf', b'%PDF-1.7\n' + b'0' * 100), ('notes.txt', 'Grüße\n'.encode() * 10)):
+            with self.subTest(name=name):
+                response = self.client.post(self.materials_url, {'name': name, 'file': self._file(name, content)}, format='multipart')
+                self.assertEqual(response.status_code, 201)
+
+        response = self.client.put('/api/v1/teachers/me/', {'profile_picture': self._png()}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        handler = FileLimitUploadHandler()
+        handler.new_file('video', 'intro.mp4', 'video/mp4', None)
+        handler.receive_data_chunk(b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 64, 0)
+        self.assertIsNone(handler.file_complete(76))
+
+    def test_content_must_match_extension(self):
+        for name, content in (('notes.pdf', self._png().getvalue()), ('notes.txt', b'\xff\xfe\x00\x00binary')):
+            with self.subTest(name=name):
+                response = self.client.post(self.materials_url, {'name': name, 'file': self._file(name, content)}, format='multipart')
+                self.assertEqual(response.status_code, 415)
+
+        response = self.client.put('/api/v1/teachers/me/', {'profile_picture': self._file('me.png', b'%PDF-1.7\n' + b'0' * 100)}, format='multipart')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(AssignmentMaterial.objects.exists())
+
+    def test_oversized_file(self):
+        png = self._png().getvalue()
+        response = self.client.put('/api/v1/teachers/me/', {'profile_picture': self._file('me.png', png + b'\x00' * 1024 * 1024)}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+
+        # rejected at the chunk crossing the limit of 1 MB, not after the whole file arrived
+        handler = FileLimitUploadHandler()
+        handler.new_file('profile_picture', 'me.png', 'image/png', None)
+        chunk = png + b'\x00' * (64 * 1024 - len(png))
+        with self.assertRaises(FileTooLarge):
+            for start in range(0, 100 * 1024 * 1024, len(chunk)):
+                handler.receive_data_chunk(chunk, start)
+        self.assertEqual(handler.received, 1024 * 1024 + len(chunk))
+
+@override_settings(DATABASE_REPLICAS=[], COURSE_MEMBERSHIP_CACHE_TTL=60)
+class BulkEnrollmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create(title='Python', category=CourseCategory.objects.create(title='Programming'), seat_limit=2)
+        self.students = [
+            Student.objects.create(user=User.objects.create(username=f'student{i}', email=f'student{i}@example.com', role=User.RoleChoices.STUDENT))
+            for i in range(3)
+        ]
+        self.students[0].courses.add(self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True))
+
+    def test_results_per_row(self):
+        values = [str(self.students[0].id), str(self.students[1].id), 'Student2@Example.COM', '999', 'nobody', str(self.students[1].id)]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/v1/courses/{self.course.id}/enrollments/bulk/', {'students': values}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result['row'], result['status']) for result in response.data['results']],
+            [(0, 'already_enrolled'), (1, 'enrolled'), (2, 'course_full'), (3, 'not_found'), (4, 'invalid'), (5, 'already_enrolled')],
+        )
+        self.assertEqual(response.data['enrolled'], 1)
+        self.assertEqual(set(self.course.students.all()), set(self.students[:2]))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.student_count, 2)
+
+    def test_invalidates_cached_membership(self):
+        student = APIClient()
+        student.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.students[1].user).access_token}')
+        lessons_url = f'/api/v1/courses/{self.course.id}/lessons/'
+        self.assertEqual(student.get(lessons_url).status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/courses/{self.course.id}/enrollments/bulk/', {'students': [str(self.students[1].id)]}, format='json')
+        self.assertEqual(student.get(lessons_url).status_code, 200)
+
+@override_settings(DATABASE_REPLICAS=[])
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        for i in range(5):
+            Course.objects.create(title=f'course {i}', category=category)
+            Lesson.objects.create(title=f'lesson {i}', course=self.course)
+        # the id breaks the ties
+        Lesson.objects.update(created_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', email='admin@example.com', role=User.RoleChoices.ADMIN, is_staff=True))
+
+    def _follow(self, url, link):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.append([row['id'] for row in response.data['results']])
+            url, pages = response.data[link], pages + 1
+            self.assertLess(pages, 10)
+        return ids
+
+    def test_next_and_previous_across_ties(self):
+        lesson_ids = list(Lesson.objects.order_by('id').values_list('id', flat=True))
+        pages = self._follow(f'/api/v1/courses/{self.course.id}/lessons/?page_size=2', 'next')
+        self.assertEqual(pages, [lesson_ids[0:2], lesson_ids[2:4], lesson_ids[4:]])
+
+        # back from the last page
+        last = self.client.get(f'/api/v1/courses/{self.course.id}/lessons/?page_size=2')
+        last = self.client.get(self.client.get(last.data['next']).data['next'])
+        self.assertEqual(self._follow(last.data['previous'], 'previous'), [lesson_ids[2:4], lesson_ids[0:2]])
+
+        # descending on a counter every course has the same value of, ascending ids are not enough
+        course_ids = list(Course.objects.order_by('-id').values_list('id', flat=True))
+        pages = self._follow('/api/v1/courses/?ordering=-student_count&page_size=4', 'next')
+        self.assertEqual(sum(pages, []), course_ids)
+
+    def test_tampered_cursor(self):
+        url = f'/api/v1/courses/{self.course.id}/lessons/'
+        for position in ('not json', '["yesterday", "x"]', '[1]', '{"id": 1}'):
+            with self.subTest(position=position):
+                cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'cursor': 'a'}).status_code, 404)
+
+@override_settings(DATABASE_REPLICAS=[], COURSE_MEMBERSHIP_CACHE_TTL=0)
+class MembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        self.other_course = Course.objects.create(title='Django', category=category)
+        self.teacher = Teacher.objects.create(user=User.objects.create(username='teacher', email='teacher@example.com', role=User.RoleChoices.TEACHER))
+        self.student = Student.objects.create(user=User.objects.create(username='student', email='student@example.com', role=User.RoleChoices.STUDENT))
+        self.outsider = Student.objects.create(user=User.objects.create(username='outsider', email='outsider@example.com', role=User.RoleChoices.STUDENT))
+        self.teacher.courses.add(self.course)
+        self.student.courses.add(self.course)
+
+    def _request(self, user, claims=True, path='/'):
+        request = RequestFactory().get(path)
+        request.user = authentication.ClaimsUser(ClaimsRefreshToken.for_user(user).access_token) if claims else user
+        return request
+
+    def test_exists_query(self):
+        through = Student.courses.through._meta.db_table
+        for claims in (True, False):
+            with self.subTest(claims=claims):
+                member, outsider = self._request(self.student.user, claims), self._request(self.outsider.user, claims)
+                with record_queries() as stats:
+                    self.assertTrue(membership.is_course_student(member, self.course.id))
+                    self.assertFalse(membership.is_course_student(outsider, self.course.id))
+                self.assertEqual(stats.count, 2)
+                for sql, _ in stats.statements:
+                    self.assertIn(through, sql)
+                    self.assertIn('LIMIT 1', sql)
+                    # the profile id of the token spares the join
+                    self.assertEqual(Student._meta.db_table + '"' in sql, not claims)
+
+        # no student_id claim, no query
+        request = self._request(self.teacher.user)
+        with record_queries() as stats:
+            self.assertFalse(membership.is_course_student(request, self.course.id))
+        self.assertEqual(stats.count, 0)
+
+    def test_memoized_per_request(self):
+        request = self._request(self.teacher.user)
+        with record_queries() as stats:
+            self.assertTrue(membership.is_course_teacher(request, self.course.id))
+            self.assertTrue(membership.is_course_teacher(request, str(self.course.id)))
+            self.assertFalse(membership.is_course_teacher(request, self.other_course.id))
+            self.assertFalse(membership.is_course_teacher(request, self.other_course.id))
+        self.assertEqual(stats.count, 2)
+
+        # a new request asks again
+        request = self._request(self.teacher.user)
+        with record_queries() as stats:
+            self.assertTrue(membership.is_course_teacher(request, self.course.id))
+        self.assertEqual(stats.count, 1)
+
+    @override_settings(COURSE_MEMBERSHIP_CACHE_TTL=60)
+    def test_cache_invalidated_on_commit(self):
+        self.assertFalse(membership.is_course_student(self._request(self.outsider.user), self.course.id))
+        request = self._request(self.outsider.user)
+        with record_queries() as stats:
+            self.assertFalse(membership.is_course_student(request, self.course.id))
+        self.assertEqual(stats.count, 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.outsider.courses.add(self.course)
+            # not before the enrollment is committed
+            self.assertFalse(membership.is_course_student(self._request(self.outsider.user), self.course.id))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(membership.is_course_student(self._request(self.outsider.user), self.course.id))
+
+        # from the course side, and by clear
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.remove(self.outsider)
+        self.assertFalse(membership.is_course_student(self._request(self.outsider.user), self.course.id))
+        self.assertTrue(membership.is_course_student(self._request(self.student.user), self.course.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.courses.clear()
+        self.assertFalse(membership.is_course_student(self._request(self.student.user), self.course.id))
+
+    def test_permissions_raise_not_found(self):
+        # the baseline returned the NotFound instead of raising it, which let non-members through
+        student = APIClient()
+        student.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.outsider.user).access_token}')
+        self.assertEqual(student.get('/api/v1/courses/999/lessons/').status_code, 404)
+        self.assertEqual(student.get(f'/api/v1/courses/{self.course.id}/lessons/').status_code, 403)
+        self.assertEqual(student.get(f'/api/v1/courses/{self.other_course.id}/lessons/').status_code, 403)
+
+        teacher = APIClient()
+        teacher.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.teacher.user).access_token}')
+        self.assertEqual(teacher.post('/api/v1/courses/999/lessons/', {'title': 'Intro'}).status_code, 404)
+        self.assertEqual(teacher.post(f'/api/v1/courses/{self.other_course.id}/lessons/', {'title': 'Intro'}).status_code, 403)
+
+        permission = permissions.IsTeacherButNotCourseTeacher()
+        view = mock.Mock(kwargs={'course_pk': '999'})
+        with self.assertRaises(NotFound):
+            permission.has_permission(self._request(self.teacher.user, path='/api/v1/courses/999/'), view)
+        view.kwargs['course_pk'] = str(self.other_course.id)
+        self.assertTrue(permission.has_permission(self._request(self.teacher.user, path='/api/v1/courses/1/'), view))
+
+@override_settings(DATABASE_REPLICAS=[], FAST_READ_SERIALIZERS=False)
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(title='Programming')
+        self.course = Course.objects.create(title='Python', category=category)
+        Course.objects.create(title='Go', category=category)
+        self.teachers = [
+            Teacher.objects.create(user=User.objects.create(username=f'teacher{i}', email=f'teacher{i}@example.com', role=User.RoleChoices.TEACHER))
+            for i in range(3)
+        ]
+        self.course.teachers.add(*self.teachers)
+        self.client = APIClient()
+        self.url = f'/api/v1/courses/{self.course.id}/'
+
+    def test_fields(self):
+        default = self.client.get(self.url).json()
+        self.assertNotIn('teachers', default)
+        self.assertNotIn('students', default)
+        self.assertEqual(default['teacher_count'], 3)
+        self.assertIn('teachers_url', default)
+
+        # in the order of the serializer, whatever the order asked
+        response = self.client.get(self.url, {'fields': ' title , id,'})
+        self.assertEqual(list(response.json()), ['id', 'title'])
+        response = self.client.get('/api/v1/courses/', {'fields': 'id'})
+        self.assertEqual([list(row) for row in response.json()['results']], [['id'], ['id']])
+
+    def test_expand(self):
+        response = self.client.get(self.url, {'expand': 'teachers'})
+        self.assertEqual(list(response.json()), [name for name in RetrieveCourseSerializer.Meta.fields if name != 'students'])
+        self.assertEqual([teacher['id'] for teacher in response.json()['teachers']], [teacher.id for teacher in self.teachers])
+        self.assertEqual(response.json()['teachers'][0]['user'], {'id': self.teachers[0].user.id, 'username': 'teacher0', 'email': 'teacher0@example.com'})
+
+        # naming a roster in fields expands it
+        response = self.client.get(self.url, {'fields': 'id,students,teachers'})
+        self.assertEqual(list(response.json()), ['id', 'teachers', 'students'])
+        self.assertEqual(response.json()['students'], [])
+        self.assertEqual(len(response.json()['teachers']), 3)
+
+        # the rosters of a page of courses are prefetched, not queried per course
+        with record_queries() as stats:
+            response = self.client.get('/api/v1/courses/', {'expand': 'teachers,students'})
+        self.assertEqual(stats.count, 3)
+        self.assertEqual([len(row['teachers']) for row in response.json()['results']], [3, 0])
+
+    def test_unknown_fields(self):
+        for fast in (False, True):
+            # nested fields are not selectable, only whole rosters
+            for params, name in (({'fields': 'id,bogus'}, 'bogus'), ({'fields': 'teachers.user'}, 'teachers.user'),
+                                 ({'expand': 'category'}, 'category'), ({'expand': 'teachers,bogus'}, 'bogus')):
+                with self.subTest(fast=fast, params=params), override_settings(FAST_READ_SERIALIZERS=fast):
+                    response = self.client.get(self.url, params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(name, response.data['detail'])
+
+    def test_roster(self):
+        ids, url = [], f'{self.url}teachers/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [teacher['id'] for teacher in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [teacher.id for teacher in self.teachers])
+        self.assertEqual(list(response.data['results'][0]), ['id', 'user', 'profile_picture', 'profile_picture_srcset'])
+
+        # ?ordering= of the courses does not apply
+        response = self.client.get(f'{self.url}teachers/', {'ordering': '-student_count'})
+        self.assertEqual([teacher['id'] for teacher in response.data['results']], ids)
+        self.assertEqual(self.client.get(f'{self.url}students/').data['results'], [])
+        self.assertEqual(self.client.get('/api/v1/courses/999/teachers/').status_code, 404)
@@ -0,0 +1,92 @@
+import os
+from functools import lru_cache
+from django.apps import apps
+from django.core.exceptions import RequestDataTooBig, SuspiciousFileOperation
+from django.core.files.uploadhandler import FileUploadHandler
+from django.core.validators import FileExtensionValidator
+from django.db import models
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .validators import FileSizeValidator, SNIFF_BYTES, content_matches_extension
+
+# both DRF (413/415) and django (400) know how to answer these, whichever view the upload was sent to
+class FileTooLarge(APIException, RequestDataTooBig):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'File is too large.'
+    default_code = 'file_too_large'
+
+class FileContentNotAllowed(APIException, SuspiciousFileOperation):
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    default_detail = 'File content does not match an allowed file type.'
+    default_code = 'file_content_not_allowed'
+
+@lru_cache(maxsize=None)
+def get_upload_limits():
+    '''
+    Map each upload field name to (max bytes, allowed extensions), read from the validators of the
+    FileFields of the custom app. A field name shared by several models gets the most permissive limits,
+    the model validators still apply the exact ones afterwards.
+    '''
+    limits = {}
+    for model in apps.get_app_config('custom').get_models():
+        for field in model._meta.get_fields():
+            if not isinstance(field, models.FileField):
+                continue
+
+            max_bytes, extensions = None, None
+            for validator in field.validators:
+                if isinstance(validator, FileSizeValidator):
+                    max_bytes = validator.max_mb * 1024 * 1024
+                elif isinstance(validator, FileExtensionValidator):
+                    extensions = frozenset(extension.lower() for extension in validator.allowed_extensions)
+
+            if field.name in limits:
+                known_max_bytes, known_extensions = limits[field.name]
+                max_bytes = None if max_bytes is None or known_max_bytes is None else max(max_bytes, known_max_bytes)
+                extensions = None if extensions is None or known_extensions is None else extensions | known_extensions
+            limits[field.name] = (max_bytes, extensions)
+    return limits
+
+class FileLimitUploadHandler(FileUploadHandler):
+    '''
+    Runs before the memory/temporary file handlers and aborts a multipart upload as soon as a file
+    crosses the FileSizeValidator limit of its field, or its leading bytes do not match its extension,
+    instead of receiving the whole body and only rejecting it at model validation.
+    '''
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.max_bytes, self.extensions = get_upload_limits().get(field_name, (None, None))
+        self.extension = os.path.splitext(file_name)[1][1:].lower()
+        self.received = 0
+        self.head = b''
+        self.sniffed = False
+
+        if self.extensions is not None and self.extension not in self.extensions:
+            raise FileContentNotAllowed(f'File extension "{self.extension}" is not allowed.')
+        if self.max_bytes is not None and content_length and content_length > self.max_bytes:
+            raise FileTooLarge(self._too_large_detail())
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.max_bytes is not None and self.received > self.max_bytes:
+            raise FileTooLarge(self._too_large_detail())
+
+        if not self.sniffed and self.extensions is not None:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.sniffed and self.extensions is not None:
+            self._sniff()
+        # let the next handler build the file object
+        return None
+
+    def _sniff(self):
+        self.sniffed = True
+        if not content_matches_extension(self.extension, self.head):
+            raise FileContentNotAllowed(f'File content does not match its extension "{self.extension}".')
+
+    def _too_large_detail(self):
+        return f'Files cannot be larger than {self.max_bytes // (1024 * 1024)}mb.'
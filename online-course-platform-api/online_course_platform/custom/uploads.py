@@ -0,0 +1,287 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from botocore.exceptions import ClientError
+from storages.backends.s3boto3 import S3Boto3Storage
+from .models import ChunkedUpload, ChunkedUploadPart, Lesson, Assignment, AssignmentMaterial
+from .s3 import get_s3_client
+from .upload_handlers import FileContentNotAllowed
+from .validators import SNIFF_BYTES, FileSizeValidator, content_matches_extension
+
+# resumable uploads: the client initiates an upload, PUTs fixed size chunks at offsets that are multiples
+# of chunk_size (in any order, retrying as needed) and completes it, then the file is attached to its target.
+# chunks are spooled to disk for local storages or sent straight to an S3 multipart upload, as parts uploaded by
+# a pool of CHUNKED_UPLOAD_S3_MAX_WORKERS threads per process while the requests go on reading the next chunks
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 64 * 1024
+
+class UploadFailed(APIException):
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    default_detail = 'The upload could not be attached, start a new upload.'
+    default_code = 'upload_failed'
+
+class UploadClosed(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The upload no longer accepts chunks.'
+    default_code = 'upload_closed'
+
+def get_target_field(target):
+    if target == ChunkedUpload.TargetChoices.LESSON_VIDEO:
+        return Lesson._meta.get_field('video')
+    return AssignmentMaterial._meta.get_field('file')
+
+def get_target_model(target):
+    # the model of object_id, materials are created on attach
+    if target == ChunkedUpload.TargetChoices.LESSON_VIDEO:
+        return Lesson
+    return Assignment
+
+def validate_upload_file(target, filename, size):
+    # the validators of the model field (extension) against what the client announced. its size limit is the one
+    # of uploads in a single request, resumable uploads have the larger ones of CHUNKED_UPLOAD_MAX_SIZES
+    file = SimpleNamespace(name=filename, size=size)
+    for validator in get_target_field(target).validators:
+        if not isinstance(validator, FileSizeValidator):
+            validator(file)
+    max_size = settings.CHUNKED_UPLOAD_MAX_SIZES[target]
+    if size > max_size:
+        raise ValidationError(f'Files cannot be larger than {max_size // (1024 * 1024)}mb.')
+
+def get_backend(upload):
+    storage = get_target_field(upload.target).storage
+    if isinstance(storage, S3Boto3Storage):
+        return S3UploadBackend(storage)
+    return LocalUploadBackend(storage)
+
+def read_chunk(stream, length, on_block):
+    '''
+    Read exactly length bytes from the request stream in blocks, return their sha256 hex digest.
+    Returns None if the body is shorter or longer than announced.
+    '''
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining > 0:
+        block = stream.read(min(READ_BLOCK_SIZE, remaining))
+        if not block:
+            return None
+        remaining -= len(block)
+        digest.update(block)
+        on_block(block)
+    if stream.read(1):
+        return None
+    return digest.hexdigest()
+
+class SniffingStream:
+    '''
+    Wraps the stream of the first chunk, enforcing that the content of the file matches its extension.
+    '''
+    def __init__(self, stream, extension):
+        self.stream = stream
+        self.extension = extension
+        self.head = b''
+        self.sniffed = False
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if not self.sniffed:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES or not data:
+                self.sniffed = True
+                if not content_matches_extension(self.extension, self.head):
+                    raise FileContentNotAllowed(f'File content does not match its extension "{self.extension}".')
+        return data
+
+def finalize(upload, parts):
+    '''
+    Complete the upload in its backend and attach the stored file to the target. If that fails after the backend
+    completed (the spool was moved, the multipart upload completed), the upload cannot be completed again:
+    the stored file and the upload are deleted.
+    '''
+    not_found = NotFound(f"{upload.target.split('_')[0].capitalize()} with id = {upload.object_id} not found.")
+    backend = get_backend(upload)
+    if not get_target_model(upload.target).objects.filter(pk=upload.object_id).exists():
+        backend.abort(upload)
+        upload.delete()
+        raise not_found
+
+    storage_name = backend.complete(upload, parts)
+    try:
+        return attach(upload, storage_name)
+    except Exception as e:
+        get_target_field(upload.target).storage.delete(storage_name)
+        upload.delete()
+        if isinstance(e, ObjectDoesNotExist):
+            # deleted since the check above
+            raise not_found
+        logger.exception('attaching upload %s failed', upload.pk)
+        raise UploadFailed()
+
+@transaction.atomic()
+def attach(upload, storage_name):
+    '''
+    Point the target of the upload to the stored file, within one transaction
+    with marking the upload as complete.
+    '''
+    field = get_target_field(upload.target)
+    if upload.target == ChunkedUpload.TargetChoices.LESSON_VIDEO:
+        lesson = Lesson.objects.select_for_update().get(pk=upload.object_id)
+        replaced = lesson.video.name
+        lesson.video.name = storage_name
+        lesson.save(update_fields=['video', 'updated_at'])
+        if replaced:
+            transaction.on_commit(lambda: field.storage.delete(replaced))
+        instance = lesson
+    else:
+        Assignment.objects.select_for_update().get(pk=upload.object_id)
+        instance = AssignmentMaterial.objects.create(
+            name=upload.name or upload.filename,
+            assignment_id=upload.object_id,
+            file=storage_name,
+        )
+
+    upload.status = ChunkedUpload.StatusChoices.COMPLETE
+    upload.save(update_fields=['status'])
+    return instance
+
+class LocalUploadBackend:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def start(self, upload):
+        os.makedirs(settings.CHUNKED_UPLOAD_SPOOL_DIR, exist_ok=True)
+        with open(self._spool_path(upload), 'wb') as spool:
+            spool.truncate(upload.size)
+
+    def write_chunk(self, upload, part, data):
+        try:
+            with open(self._spool_path(upload), 'r+b') as spool:
+                spool.seek(part.number * upload.chunk_size)
+                spool.write(data)
+        except FileNotFoundError:
+            # aborted
+            raise UploadClosed()
+
+    def get_uploading(self, parts):
+        return []
+
+    def complete(self, upload, parts):
+        # the storage moves a file exposing temporary_file_path() instead of copying it
+        spool = SpooledFile(self._spool_path(upload))
+        try:
+            return self.storage.save(upload.storage_name, spool)
+        finally:
+            spool.close()
+
+    def abort(self, upload):
+        try:
+            os.remove(self._spool_path(upload))
+        except FileNotFoundError:
+            pass
+
+    def _spool_path(self, upload):
+        return os.path.join(settings.CHUNKED_UPLOAD_SPOOL_DIR, str(upload.id))
+
+class SpooledFile(File):
+    def __init__(self, path):
+        super().__init__(open(path, 'rb'), name=os.path.basename(path))
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+_part_pools = {}
+_part_pools_lock = threading.Lock()
+
+def _get_part_pool():
+    # per process, pools do not survive forking. the semaphore bounds the parts in flight, queued ones included,
+    # so requests wait for a free worker instead of piling up chunks in memory
+    pid = os.getpid()
+    pool = _part_pools.get(pid)
+    if pool is None:
+        with _part_pools_lock:
+            pool = _part_pools.get(pid)
+            if pool is None:
+                workers = settings.CHUNKED_UPLOAD_S3_MAX_WORKERS
+                pool = _part_pools[pid] = (
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3-upload-part'),
+                    threading.BoundedSemaphore(workers),
+                )
+    return pool
+
+def _submit_part(backend, upload, part, data):
+    executor, slots = _get_part_pool()
+    slots.acquire()
+    try:
+        return executor.submit(_upload_part, backend, upload, part, data, slots)
+    except BaseException:
+        slots.release()
+        raise
+
+def _upload_part(backend, upload, part, data, slots):
+    # on a thread of the pool, closing its database connection like a request would
+    close_old_connections()
+    try:
+        response = get_s3_client().upload_part(
+            Bucket=backend.storage.bucket_name,
+            Key=backend._key(upload),
+            UploadId=upload.s3_upload_id,
+            PartNumber=part.number + 1,
+            Body=data,
+        )
+        # not if the chunk was sent again meanwhile, its row is a new one
+        ChunkedUploadPart.objects.filter(pk=part.pk).update(s3_etag=response['ETag'])
+    except Exception as e:
+        # not received, the client sends the chunk again
+        ChunkedUploadPart.objects.filter(pk=part.pk, s3_etag='').delete()
+        if not (isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') == 'NoSuchUpload'):
+            logger.exception('uploading part %d of upload %s failed', part.number + 1, upload.pk)
+    finally:
+        slots.release()
+        close_old_connections()
+
+class S3UploadBackend:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def start(self, upload):
+        params = self.storage._get_write_parameters(upload.storage_name)
+        response = get_s3_client().create_multipart_upload(Bucket=self.storage.bucket_name, Key=self._key(upload), **params)
+        upload.s3_upload_id = response['UploadId']
+
+    def write_chunk(self, upload, part, data):
+        # a chunk is one S3 part, so chunk_size must be at least the 5 MiB part minimum of S3.
+        # uploaded once the part row is committed, which has no ETag until then
+        transaction.on_commit(lambda: _submit_part(self, upload, part, data))
+
+    def get_uploading(self, parts):
+        return [part.number for part in parts if not part.s3_etag]
+
+    def complete(self, upload, parts):
+        get_s3_client().complete_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self._key(upload),
+            UploadId=upload.s3_upload_id,
+            MultipartUpload={'Parts': [{'ETag': part.s3_etag, 'PartNumber': part.number + 1} for part in parts]},
+        )
+        return upload.storage_name
+
+    def abort(self, upload):
+        get_s3_client().abort_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self._key(upload),
+            UploadId=upload.s3_upload_id,
+        )
+
+    def _key(self, upload):
+        return self.storage._normalize_name(upload.storage_name)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework_nested import routers
 from . import views
+from .async_views import with_async_reads
 
 router = routers.DefaultRouter()
 router.register(r'course_categories', views.CourseCategoryViewSet)
@@ -8,6 +10,7 @@ router.register(r'courses', views.CourseViewSet, basename='courses')
 router.register(r'teacher_join_course_requests', views.TeacherJoinCourseRequestViewSet, basename='teacher_join_course_requests')
 router.register(r'teachers', views.TeacherViewSet)
 router.register(r'students', views.StudentViewSet)
+router.register(r'uploads', views.ChunkedUploadViewSet, basename='uploads')
 
 courses_router = routers.NestedDefaultRouter(router, r'courses', lookup='course')
 courses_router.register(r'assignments', views.AssignmentViewSet, basename='course-assignments')
@@ -16,8 +19,15 @@ courses_router.register(r'lessons', views.LessonViewSet, basename='course-lesson
 assignments_router = routers.NestedDefaultRouter(courses_router, r'assignments', lookup='assignment')
 assignments_router.register(r'materials', views.AssignmentMaterialViewSet, basename='course-assignment-materials')
 
+courses_urls = courses_router.urls
+assignments_urls = assignments_router.urls
+if settings.ASYNC_VIEWS:
+    courses_urls = with_async_reads(courses_urls)
+    assignments_urls = with_async_reads(assignments_urls)
+
 urlpatterns = [
+    path('batch/', views.BatchView.as_view(), name='batch'),
     path('', include(router.urls)),
-    path('', include(courses_router.urls)),
-    path('', include(assignments_router.urls)),
+    path('', include(courses_urls)),
+    path('', include(assignments_urls)),
 ]
\ No newline at end of file
@@ -1,3 +1,4 @@
+import codecs
 from django.core.exceptions import ValidationError
 from django.utils.deconstruct import deconstructible
 
@@ -18,3 +19,40 @@ class FileSizeValidator(object):
             isinstance(other, self.__class__)
             and self.max_mb == other.max_mb
         )
+
+# leading bytes of the formats allowed by the FileExtensionValidator whitelists,
+# the extension of a file only counts if its content starts like one of these
+MAGIC_BYTES = {
+    'jpg': [(0, b'\xff\xd8\xff')],
+    'jpeg': [(0, b'\xff\xd8\xff')],
+    'png': [(0, b'\x89PNG\r\n\x1a\n')],
+    'webp': [(0, b'RIFF'), (8, b'WEBP')],
+    'mp4': [(4, b'ftyp')],
+    'webm': [(0, b'\x1a\x45\xdf\xa3')],
+    'ogg': [(0, b'OggS')],
+    'pdf': [(0, b'%PDF-')],
+    # office open xml documents are zip archives
+    'zip': [(0, b'PK')],
+    'docx': [(0, b'PK')],
+    'xlsx': [(0, b'PK')],
+    'pptx': [(0, b'PK')],
+}
+SNIFF_BYTES = 16
+
+def content_matches_extension(extension, head):
+    '''
+    Check the first SNIFF_BYTES (or fewer for tiny files) of a file against its extension.
+    Plain text has no signature, those bytes must be UTF-8 (possibly ending within a character) without NUL.
+    The rest of a text file is not checked.
+    '''
+    extension = extension.lower()
+    if extension == 'txt':
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        except UnicodeDecodeError:
+            return False
+        return b'\x00' not in head
+    signatures = MAGIC_BYTES.get(extension)
+    if signatures is None:
+        return False
+    return all(head[offset:offset + len(magic)] == magic for offset, magic in signatures)
@@ -1,21 +1,46 @@
 from django.conf import settings
-from .serializers import RetrieveCourseCategorySerializer, CourseSerializer, RetrieveCourseSerializer, CourseCategorySerializer, UpdateTeacherSerializer, RetrieveTeacherSerializer, UpdateStudentSerializer, RetrieveStudentSerializer, AssignmentSerializer, AssignmentMaterialSerializer, LessonSerializer, TeacherJoinCourseRequestSerializer, RetrieveTeacherJoinCourseRequestSerializer
+from .serializers import BatchSerializer, BulkEnrollmentSerializer, BulkJoinRequestDecisionSerializer, SimpleTeacherSerializer, SimpleStudentSerializer, RetrieveCourseCategorySerializer, CourseSerializer, RetrieveCourseSerializer, CourseCategorySerializer, UpdateTeacherSerializer, RetrieveTeacherSerializer, UpdateStudentSerializer, RetrieveStudentSerializer, AssignmentSerializer, AssignmentMaterialSerializer, AssignmentMaterialChangeSerializer, LessonSerializer, TeacherJoinCourseRequestSerializer, RetrieveTeacherJoinCourseRequestSerializer, ChunkedUploadSerializer
 from django.shortcuts import get_object_or_404
-from .models import CourseCategory, Course, Teacher, TeacherJoinCourseRequest, Student, Assignment, AssignmentMaterial, Lesson
-from rest_framework import status
+from .models import CourseCategory, Course, Teacher, TeacherJoinCourseRequest, Student, Assignment, AssignmentMaterial, Lesson, ChunkedUpload, ChunkedUploadPart
+from rest_framework import status, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, action
 from rest_framework.views import APIView
+from rest_framework.filters import OrderingFilter
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, ListModelMixin
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, SAFE_METHODS
 from django.db import transaction
+from django.db.models import Prefetch
 from .permissions import IsAdminOrCourseTeacher, IsAdminOrCourseTeacherOrCourseStudent, IsAdminOrTeacher, IsNotAdminUser
+from .pagination import CreatedAtCursorPagination, IdCursorPagination
+from .membership import is_course_teacher, get_teacher_id, get_student_id
 from rest_framework.exceptions import ParseError, NotFound, MethodNotAllowed, PermissionDenied
-import boto3
-from botocore import exceptions
+from .s3 import get_presigned_url, get_media_file_key
+from .streaming import check_stream_signature, serve_file, sign_stream, storage_chunks, zip_stream
+from .uploads import get_backend, finalize, read_chunk, SniffingStream, UploadFailed
+from .caching import CachedCatalogMixin
+from .enrollments import bulk_enroll, enroll, unenroll, decide_join_requests
+from .counters import COUNTER_FIELDS
+from .changes import get_changes, parse_watermark
+from .dashboard import get_dashboard
+from .batch import run_batch
+from .fastpath import CourseReader, FastReadMixin, LessonReader, ProfileReader, is_enabled as fast_read_enabled
+from django.http import HttpResponseRedirect, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.urls import reverse
+import hashlib
+import math
+import os
+import posixpath
+from urllib.parse import urlencode
 
-class CourseCategoryViewSet(ModelViewSet):
+class CourseCategoryViewSet(CachedCatalogMixin, ModelViewSet):
+    # most queries each action may run, see custom.querystats
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 8}
+    cache_dependencies = ('coursecategory', 'course')
     queryset = CourseCategory.objects.prefetch_related('courses').all()
     
     def get_permissions(self):
@@ -37,8 +62,11 @@ class TeacherViewSet(
 ):
     queryset = Teacher.objects.select_related('user').prefetch_related('courses').all()
     serializer_class = RetrieveTeacherSerializer
+    query_budgets = {'list': 2, 'retrieve': 2, 'destroy': 7, 'me': 3, 'dashboard': 3}
 
     def get_permissions(self):
+        if self.action == 'dashboard':
+            return [IsAuthenticated(), IsNotAdminUser()]
         if '/me/' in self.request.path:
             return [IsNotAdminUser()]
         if self.request.method in SAFE_METHODS or self.request.method == 'DELETE':
@@ -59,6 +87,16 @@ class TeacherViewSet(
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data)
+
+    @action(detail=False, methods=['GET'], url_path='me/dashboard')
+    def dashboard(self, request):
+        '''
+        Courses of the teacher with their latest lessons and open assignments, see custom.dashboard.
+        '''
+        teacher_id = get_teacher_id(request)
+        if not teacher_id:
+            return Response('your account is not a teacher account', status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_dashboard(Teacher, teacher_id))
         
 class TeacherJoinCourseRequestViewSet(
     ListModelMixin, 
@@ -66,6 +104,9 @@ class TeacherJoinCourseRequestViewSet(
     CreateModelMixin, 
     DestroyModelMixin, 
     GenericViewSet):
+    pagination_class = CreatedAtCursorPagination
+    query_budgets = {'list': 1, 'retrieve': 1, 'create': 5, 'destroy': 9, 'decide': 8}
+
     def get_queryset(self):
         course_id = self.request.query_params.get('course')
         teacher_id = self.request.query_params.get('teacher')
@@ -75,25 +116,40 @@ class TeacherJoinCourseRequestViewSet(
             queryset = queryset.filter(course_id=course_id)
         if teacher_id:
             queryset = queryset.filter(teacher_id=teacher_id)
-        return queryset.select_related('teacher', 'course').all()
+        return queryset.select_related('teacher', 'teacher__user', 'course').all()
 
     def get_permissions(self):
-        if self.request.method in SAFE_METHODS or self.request.method == 'DELETE':
+        if self.request.method in SAFE_METHODS or self.request.method == 'DELETE' or self.action == 'decide':
             return [IsAuthenticated()]
         elif self.request.method == 'POST':
             return [IsNotAdminUser()]
         return [IsAdminUser()]
 
     def get_serializer_class(self):
+        if self.action == 'decide':
+            return BulkJoinRequestDecisionSerializer
         if self.request.method in SAFE_METHODS:
             return RetrieveTeacherJoinCourseRequestSerializer
         return TeacherJoinCourseRequestSerializer
+
+    @action(detail=False, methods=['POST'])
+    def decide(self, request):
+        '''
+        Accept or reject many requests at once, e.g. {"decisions": [{"id": 1, "accept": true}]}
+        '''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        decisions = {decision['id']: decision['accept'] for decision in serializer.validated_data['decisions']}
+        outcomes = decide_join_requests(request.user, decisions)
+        return Response({
+            'results': [{'id': request_id, 'status': outcome} for request_id, outcome in outcomes.items()]
+        })
     
     def destroy(self, request, *args, **kwargs):
-        teacher = Teacher.objects.filter(user_id=request.user.id).first()
         instance = self.get_object()
 
-        if not teacher or instance.course.id not in (teacher_course.id for teacher_course in teacher.courses.all()):
+        if not is_course_teacher(request, instance.course_id):
             raise PermissionDenied('You are not teacher of the course.')
         
         isAccept = (self.request.query_params.get('accept') == 'accept')
@@ -113,8 +169,11 @@ class StudentViewSet(
 ):
     queryset = Student.objects.select_related('user').prefetch_related('courses').all()
     serializer_class = RetrieveStudentSerializer
+    query_budgets = {'list': 2, 'retrieve': 2, 'destroy': 7, 'me': 3, 'dashboard': 3}
 
     def get_permissions(self):
+        if self.action == 'dashboard':
+            return [IsAuthenticated(), IsNotAdminUser()]
         if '/me/' in self.request.path:
             return [IsNotAdminUser()]
         if self.request.method in SAFE_METHODS or self.request.method == 'DELETE':
@@ -136,14 +195,59 @@ class StudentViewSet(
             serializer.save()
             return Response(serializer.data)
 
-class CourseViewSet(ModelViewSet):
+    @action(detail=False, methods=['GET'], url_path='me/dashboard')
+    def dashboard(self, request):
+        '''
+        Courses of the student with their latest lessons and open assignments, see custom.dashboard.
+        '''
+        student_id = get_student_id(request)
+        if not student_id:
+            return Response('your account is not a student account', status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_dashboard(Student, student_id))
+
+class CourseViewSet(CachedCatalogMixin, FastReadMixin, ModelViewSet):
+    pagination_class = CreatedAtCursorPagination
+    fast_reader_class = CourseReader
+    # e.g. ?ordering=-student_count, every orderable field is indexed together with id for the keyset pagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['created_at', *COUNTER_FIELDS]
+    ordering = ('created_at', 'id')
+    # bulk_enroll: per batch of BULK_ENROLLMENT_BATCH_SIZE students
+    query_budgets = {
+        'list': 1, 'retrieve': 3, 'create': 8, 'update': 4, 'partial_update': 4, 'destroy': 8,
+        'enroll': 8, 'unenroll': 6, 'bulk_enroll': 8, 'teachers': 2, 'students': 2, 'changes': 6,
+    }
+    cache_dependencies = ('course', 'coursecategory', 'teacher', 'student', 'user', 'lesson', 'assignment', 'teacherjoincourserequest')
+
     def get_queryset(self):
-        return Course.objects\
-            .select_related('category')\
-            .prefetch_related('teachers', 'students', 'teachers__user', 'students__user')\
-            .all()
+        queryset = Course.objects.select_related('category')
+        if self.action not in ('list', 'retrieve') or self.request.method != 'GET':
+            return queryset.all()
+
+        # e.g. ?student_count__gte=10&lesson_count__lte=0
+        for field in COUNTER_FIELDS:
+            for lookup in ('gte', 'lte'):
+                value = self.request.query_params.get(f'{field}__{lookup}')
+                if value is None:
+                    continue
+                if not value.isdigit():
+                    raise ParseError(f'{field}__{lookup} must be a non-negative integer')
+                queryset = queryset.filter(**{f'{field}__{lookup}': int(value)})
+
+        # only prefetch what is going to be serialized
+        _, expand = RetrieveCourseSerializer.get_requested_fields(self.request)
+        for model, name in ((Teacher, 'teacher'), (Student, 'student')):
+            if f'{name}s' in expand:
+                queryset = queryset.prefetch_related(Prefetch(f'{name}s', queryset=model.objects.select_related('user').order_by('id')))
+        return queryset.all()
 
     def get_permissions(self):
+        if self.action == 'bulk_enroll':
+            return [IsAuthenticated(), IsAdminOrCourseTeacher()]
+        if self.action in ('enroll', 'unenroll'):
+            return [IsAuthenticated()]
+        if self.action == 'changes':
+            return [IsAuthenticated(), IsAdminOrCourseTeacherOrCourseStudent()]
         if self.request.method in SAFE_METHODS:
             return [AllowAny()]
         elif self.request.method == 'PUT':
@@ -153,21 +257,103 @@ class CourseViewSet(ModelViewSet):
         return [IsAdminUser()]
 
     def get_serializer_class(self):
+        if self.action == 'bulk_enroll':
+            return BulkEnrollmentSerializer
         if self.request.method == 'GET':
             return RetrieveCourseSerializer
         return CourseSerializer
     
     def perform_create(self, serializer):
-        teacher = Teacher.objects.filter(user_id=self.request.user.id).first()    
+        teacher_id = get_teacher_id(self.request)
 
         with transaction.atomic():
             newCourse = serializer.save()
             # if user is teacher, add course to the teacher
-            if teacher:
-                teacher.courses.add(newCourse)
-                teacher.save()
+            if teacher_id:
+                newCourse.teachers.add(teacher_id)
+
+    @action(detail=True, methods=['POST'])
+    def enroll(self, request, *args, **kwargs):
+        course = get_object_or_404(Course, pk=self.kwargs['pk'])
+        enroll(course.id, self._get_student_id(request))
+        return Response({
+            'message': 'enrolled'
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['POST'])
+    def unenroll(self, request, *args, **kwargs):
+        course = get_object_or_404(Course, pk=self.kwargs['pk'])
+        unenroll(course.id, self._get_student_id(request))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _get_student_id(self, request):
+        student_id = get_student_id(request)
+        if not student_id:
+            raise PermissionDenied('This method is only allowed to students')
+        return student_id
+
+    @action(detail=True, methods=['POST'], url_path='enrollments/bulk')
+    def bulk_enroll(self, request, *args, **kwargs):
+        course = get_object_or_404(Course, pk=self.kwargs['pk'])
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = bulk_enroll(course, serializer.validated_data['values'])
+        summary = {name: 0 for name in ('enrolled', 'already_enrolled', 'course_full', 'not_found', 'invalid')}
+        for result in results:
+            summary[result['status']] += 1
+        return Response({**summary, 'results': results})
+
+    @action(detail=True, methods=['GET'])
+    def teachers(self, request, *args, **kwargs):
+        return self._roster(Teacher, SimpleTeacherSerializer)
+
+    @action(detail=True, methods=['GET'])
+    def students(self, request, *args, **kwargs):
+        return self._roster(Student, SimpleStudentSerializer)
+
+    @action(detail=True, methods=['GET'])
+    def changes(self, request, *args, **kwargs):
+        '''
+        Lessons, assignments and materials of the course saved since ?updated_since= (all of them without it),
+        the ids of those deleted since, and the watermark to pass as updated_since next time. See custom.changes.
+        '''
+        course_id = self.kwargs['pk']
+        if not Course.objects.filter(pk=course_id).exists():
+            raise NotFound()
+        since = request.query_params.get('updated_since')
+        changes = get_changes(course_id, parse_watermark(since) if since else None)
+
+        context = self.get_serializer_context()
+        return Response({
+            'watermark': serializers.DateTimeField().to_representation(changes['watermark']),
+            'lessons': LessonSerializer(changes['lessons'], many=True, context=context).data,
+            'assignments': AssignmentSerializer(changes['assignments'], many=True, context=context).data,
+            'materials': AssignmentMaterialChangeSerializer(changes['materials'], many=True, context=context).data,
+            'deleted': changes['deleted'],
+        })
+
+    def _roster(self, model, serializer_class):
+        course_id = self.kwargs['pk']
+        if not Course.objects.filter(pk=course_id).exists():
+            raise NotFound()
+
+        paginator = IdCursorPagination()
+        queryset = model.objects.filter(courses=course_id).select_related('user')
+        # not view=self, the ?ordering= of courses does not apply to their rosters
+        if fast_read_enabled(self):
+            reader = ProfileReader(model, self.request)
+            page = paginator.paginate_queryset(queryset.values(*reader.values), self.request)
+            return paginator.get_paginated_response(reader.read(page))
+        page = paginator.paginate_queryset(queryset, self.request)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
 class AssignmentViewSet(ModelViewSet):
+    pagination_class = CreatedAtCursorPagination
+    # destroy: plus the tombstone of each material
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 5, 'update': 3, 'partial_update': 3, 'destroy': 6}
+
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
             return [IsAuthenticated(), IsAdminOrCourseTeacherOrCourseStudent()]
@@ -190,12 +376,18 @@ class AssignmentViewSet(ModelViewSet):
         return AssignmentSerializer
     
 class AssignmentMaterialViewSet(ModelViewSet):
+    pagination_class = CreatedAtCursorPagination
+    query_budgets = {'list': 3, 'retrieve': 3, 'create': 5, 'update': 4, 'partial_update': 4, 'destroy': 5, 'archive': 3}
+
     def get_permissions(self):
         # since 3 levels deep nested router won't check if the assignment with that assignment id exists or not in the course with that course id
         # thus need to check here and return 404 if not found
-        if not Assignment.objects.filter(id=self.kwargs['assignment_pk'], course_id=self.kwargs['course_pk']).first():
-            raise NotFound()
-        
+        # get_permissions() runs again for the object permissions of detail actions, check only once
+        if not getattr(self, '_assignment_found', False):
+            if not Assignment.objects.filter(id=self.kwargs['assignment_pk'], course_id=self.kwargs['course_pk']).exists():
+                raise NotFound()
+            self._assignment_found = True
+
         if self.request.method in SAFE_METHODS:
             return [IsAuthenticated(), IsAdminOrCourseTeacherOrCourseStudent()]
         elif self.request.method in ('PUT', 'POST'):
@@ -213,8 +405,47 @@ class AssignmentMaterialViewSet(ModelViewSet):
         context['assignment_pk'] = self.kwargs['assignment_pk']
         return context
 
-class LessonViewSet(ModelViewSet):
+    def perform_content_negotiation(self, request, force=False):
+        # the archive action answers with a ZIP file whatever is accepted
+        return super().perform_content_negotiation(request, force=force or self.action == 'archive')
+
+    @action(detail=False, methods=['GET'])
+    def archive(self, request, *args, **kwargs):
+        '''
+        All materials of the assignment in one ZIP file, streamed from the storage as it is built.
+        '''
+        materials = list(self.get_queryset().order_by('id'))
+        # the archive changes with the set of materials, their names and files (replaced files get new names)
+        digest = hashlib.sha256()
+        for material in materials:
+            digest.update(f'{material.id}\0{material.name}\0{material.file.name}\n'.encode())
+        # weak, the bytes of deflated entries may differ between zlib versions
+        etag = f'W/"{digest.hexdigest()[:32]}"'
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            entries = (
+                (name, timezone.localtime(material.created_at).timetuple()[:6], storage_chunks(material.file))
+                for name, material in zip(_archive_names(materials), materials)
+            )
+            response = StreamingHttpResponse(zip_stream(entries), content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="assignment-{self.kwargs["assignment_pk"]}-materials.zip"'
+        response['ETag'] = etag
+        # only for course members, and checked with the server before reuse
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+class LessonViewSet(FastReadMixin, ModelViewSet):
+    pagination_class = CreatedAtCursorPagination
+    fast_reader_class = LessonReader
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 5, 'update': 3, 'partial_update': 3, 'destroy': 4, 'video': 2, 'stream': 2}
+
     def get_permissions(self):
+        if self.action == 'stream' and check_stream_signature(self.request.query_params.get('signature', ''), self.kwargs['pk']):
+            # a url handed out by the video action to a course member
+            return []
         if self.request.method in SAFE_METHODS:
             return [IsAuthenticated(), IsAdminOrCourseTeacherOrCourseStudent()]
         if self.request.method in ('PUT', 'POST'):
@@ -224,7 +455,7 @@ class LessonViewSet(ModelViewSet):
     def get_queryset(self):
         return Lesson.objects.filter(
             course_id=self.kwargs['course_pk']
-            ).select_related('course').all()
+            ).select_related('course', 'teacher', 'teacher__user').all()
 
     def get_serializer_class(self):
         return LessonSerializer
@@ -234,11 +465,14 @@ class LessonViewSet(ModelViewSet):
         context = super().get_serializer_context()
         context['course_pk'] = self.kwargs['course_pk']
         return context
+
+    def perform_content_negotiation(self, request, force=False):
+        # video players ask for video/*, the stream action answers with the file itself or a JSON error
+        return super().perform_content_negotiation(request, force=force or self.action == 'stream')
     
     @action(detail=True, methods=['GET'], permission_classes=[IsAuthenticated, IsAdminOrCourseTeacherOrCourseStudent])
     def video(self, request, *args, **kwargs):
-        lesson_id = self.kwargs['pk']
-        lesson = Lesson.objects.filter(id=lesson_id).first()
+        lesson = Lesson.objects.filter(id=self.kwargs['pk'], course_id=self.kwargs['course_pk']).first()
         if not lesson:
             return Response({
                 'message': 'lesson with given id not found'
@@ -249,7 +483,7 @@ class LessonViewSet(ModelViewSet):
             }, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            url = get_media_file_url(lesson.video)
+            url = get_media_file_url(request, lesson.video)
         except Exception as e:
             return Response({
                 'message': str(e)
@@ -258,38 +492,171 @@ class LessonViewSet(ModelViewSet):
         return Response({
             'url': url
         })
+
+    @action(detail=True, methods=['GET'], url_path='video/stream', permission_classes=[IsAuthenticated, IsAdminOrCourseTeacherOrCourseStudent])
+    def stream(self, request, *args, **kwargs):
+        lesson = Lesson.objects.filter(id=self.kwargs['pk'], course_id=self.kwargs['course_pk']).first()
+        if not lesson:
+            return Response({
+                'message': 'lesson with given id not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        elif not lesson.video:
+            return Response({
+                'message': 'lesson video not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        if settings.USE_S3:
+            # S3 serves byte ranges itself
+            return HttpResponseRedirect(get_s3_media_file_url(request, lesson.video))
+        return serve_file(request, lesson.video.path)
     
-def get_s3_media_file_url(media_file):
-    print("media file url", media_file.url)
-    index = media_file.url.find('.com/')
-    if index == -1:
-        raise ValueError(".com/ not found in media_file_url")
-
-    s3_media_file_name = media_file.url[index+5:]
-
-    # Generate s3 client
-    s3_client = boto3.client(
-        's3', 
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID, 
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    )
-
-    # Generate a signed URL for the media file
-    try:
-        presigned_url = s3_client.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={
-                'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
-                'Key': s3_media_file_name,
-            },
-            ExpiresIn=60) # URL expires in 1 hour
-         
-    except exceptions.ClientError:
-        raise Exception('S3 Client Error')
-    
-    return presigned_url  
+class ChunkedUploadViewSet(
+    CreateModelMixin,
+    RetrieveModelMixin,
+    DestroyModelMixin,
+    GenericViewSet):
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [IsAuthenticated]
+    query_budgets = {'create': 3, 'retrieve': 2, 'destroy': 4, 'chunk': 7, 'complete': 8}
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(user_id=self.request.user.id).prefetch_related('parts')
+
+    def perform_destroy(self, upload):
+        if upload.status == ChunkedUpload.StatusChoices.UPLOADING:
+            get_backend(upload).abort(upload)
+        upload.delete()
+
+    @action(detail=True, methods=['PUT'])
+    def chunk(self, request, *args, **kwargs):
+        upload = self.get_object()
+        if upload.status != ChunkedUpload.StatusChoices.UPLOADING:
+            return Response({
+                'message': 'upload is already complete'
+            }, status=status.HTTP_409_CONFLICT)
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise ParseError('Upload-Offset header is required')
+        algorithm, _, checksum = request.headers.get('Upload-Checksum', '').partition(' ')
+        if algorithm.lower() != 'sha256' or not checksum:
+            raise ParseError('Upload-Checksum header is required, in the form of "sha256 <hex digest>"')
+        if offset < 0 or offset >= upload.size or offset % upload.chunk_size:
+            raise ParseError(f'Upload-Offset must be a multiple of {upload.chunk_size} smaller than {upload.size}')
+
+        length = min(upload.chunk_size, upload.size - offset)
+        if request.META.get('CONTENT_LENGTH') != str(length):
+            raise ParseError(f'chunk at offset {offset} must be exactly {length} bytes')
+
+        number = offset // upload.chunk_size
+        stream = request.stream
+        if number == 0:
+            stream = SniffingStream(stream, os.path.splitext(upload.filename)[1][1:])
+        # read and checked before taking the lock of the upload, which chunks then only hold while writing
+        blocks = []
+        sha256 = read_chunk(stream, length, blocks.append)
+        if sha256 is None:
+            raise ParseError(f'chunk at offset {offset} must be exactly {length} bytes')
+        if sha256 != checksum.lower():
+            return Response({
+                'message': 'checksum mismatch, upload the chunk again'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # complete reads the parts and finalizes the backend under the same lock
+            upload = ChunkedUpload.objects.select_for_update().filter(pk=upload.pk).first()
+            if upload is None:
+                raise NotFound()
+            if upload.status != ChunkedUpload.StatusChoices.UPLOADING:
+                return Response({
+                    'message': 'upload is already complete'
+                }, status=status.HTTP_409_CONFLICT)
+
+            # the chunk is being overwritten. rolled back if the backend does not take it (UploadClosed, 409)
+            ChunkedUploadPart.objects.filter(upload=upload, number=number).delete()
+            part = ChunkedUploadPart.objects.create(upload=upload, number=number, size=length, sha256=sha256)
+            get_backend(upload).write_chunk(upload, part, b''.join(blocks))
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=['POST'])
+    def complete(self, request, *args, **kwargs):
+        upload = self.get_object()
+        with transaction.atomic():
+            # a concurrent complete waits for this one and then finds the upload complete, instead of attaching it twice
+            upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+            if upload.status != ChunkedUpload.StatusChoices.UPLOADING:
+                return Response({
+                    'message': 'upload is already complete'
+                }, status=status.HTTP_409_CONFLICT)
+
+            parts = list(upload.parts.order_by('number'))
+            received = set(part.number for part in parts)
+            missing = [number for number in range(math.ceil(upload.size / upload.chunk_size)) if number not in received]
+            if missing:
+                return Response({
+                    'message': 'upload has missing chunks',
+                    'missing_chunks': missing,
+                }, status=status.HTTP_409_CONFLICT)
+            uploading = get_backend(upload).get_uploading(parts)
+            if uploading:
+                # complete again once they are uploaded, or send them again if they stay uploading
+                return Response({
+                    'message': 'upload has chunks still uploading',
+                    'uploading_chunks': uploading,
+                }, status=status.HTTP_409_CONFLICT)
+
+            try:
+                instance = finalize(upload, parts)
+            except (NotFound, UploadFailed) as e:
+                # returned, not raised, so that the deletion of the upload is committed
+                return Response({
+                    'message': e.detail
+                }, status=e.status_code)
+
+        if upload.target == ChunkedUpload.TargetChoices.LESSON_VIDEO:
+            serializer = LessonSerializer(instance, context={'request': request})
+        else:
+            serializer = AssignmentMaterialSerializer(instance, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class BatchView(APIView):
+    def post(self, request):
+        '''
+        Several requests in one, e.g. {"requests": [{"method": "GET", "path": "/api/v1/courses/1/"}, ...]}.
+        Answers {"responses": [{"status": ..., "headers": ..., "body": ...}, ...]} in the same order, see custom.batch.
+        '''
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'responses': run_batch(request, serializer.validated_data['requests'])})
+
+def _archive_names(materials):
+    # material names are not unique and carry no extension
+    names = []
+    taken = set()
+    for material in materials:
+        extension = posixpath.splitext(material.file.name)[1]
+        stem = material.name.replace('/', '_').replace('\\', '_').strip() or 'material'
+        if stem.lower().endswith(extension.lower()):
+            stem = stem[:len(stem) - len(extension)]
+        name = f'{stem}{extension}'
+        number = 1
+        while name.lower() in taken:
+            number += 1
+            name = f'{stem} ({number}){extension}'
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+def get_s3_media_file_url(request, media_file):
+    # signed urls are shared between viewers of the same video, see custom.s3.PresignedUrlCache
+    return get_presigned_url(get_media_file_key(media_file))
     
-def get_local_media_file_url(media_file):
-    return media_file.url
+def get_local_media_file_url(request, media_file):
+    # static() only serves media under DEBUG and without byte ranges, point to the stream action instead.
+    # signed, video elements cannot send the Authorization header
+    lesson = media_file.instance
+    url = reverse('course-lessons-stream', kwargs={'course_pk': lesson.course_id, 'pk': lesson.pk})
+    return request.build_absolute_uri(f'{url}?{urlencode({"signature": sign_stream(lesson.pk)})}')
 
 get_media_file_url = get_s3_media_file_url if settings.USE_S3 else get_local_media_file_url;
\ No newline at end of file
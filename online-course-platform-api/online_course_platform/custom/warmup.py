@@ -0,0 +1,62 @@
+import inspect
+import logging
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.urls import get_resolver, resolve, Resolver404
+from django.utils import translation
+from rest_framework import serializers
+from core import serializers as core_serializers
+from . import serializers as custom_serializers, s3
+
+logger = logging.getLogger(__name__)
+
+def warm_up():
+    '''
+    Do the one-off work of the first requests before serving any: compiling URL patterns, model and
+    serializer introspection, translations and storage clients. gunicorn.conf.py calls it in the master
+    process before forking, so that every worker starts warm.
+    '''
+    started = time.perf_counter()
+    _warm_up_urls()
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta.related_objects
+    _warm_up_serializers()
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('This field is required.')
+    translation.deactivate()
+    default_storage._setup()
+    # nothing should have connected, but a connection must never be shared with forked workers
+    connections.close_all()
+    logger.info('warmed up in %.2fs', time.perf_counter() - started)
+
+def warm_up_worker():
+    '''
+    The part of the warm-up every worker process does itself, after forking.
+    '''
+    if settings.USE_S3:
+        # clients are kept per process, building one loads the S3 service model
+        s3.get_s3_client()
+
+def _warm_up_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    # a path matching nothing compiles the pattern of every route on its way
+    try:
+        resolve('/api/v1/__warm_up__/')
+    except Resolver404:
+        pass
+
+def _warm_up_serializers():
+    for module in (custom_serializers, core_serializers):
+        for _, serializer_class in inspect.getmembers(module, inspect.isclass):
+            if not issubclass(serializer_class, serializers.Serializer) or serializer_class.__module__ != module.__name__:
+                continue
+            try:
+                serializer_class(context={}).fields
+            except Exception:
+                # e.g. a serializer which needs a request, the others still count
+                logger.debug('could not warm up %s', serializer_class.__name__, exc_info=True)
@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+
+# production server, started with: gunicorn -c gunicorn.conf.py
+# every setting can be overridden with the GUNICORN_* environment variables below or on the command line
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+# gthread: every worker serves requests from a few threads, each thread keeps its own database connection,
+# so the database sees up to workers * threads connections (and as many per replica).
+# for uvicorn.workers.UvicornWorker the ASGI application is served instead, with the async views
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# gunicorn turns sync workers into gthread ones when threads > 1
+threads = int(os.getenv('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+if 'uvicorn' in worker_class:
+    wsgi_app = 'online_course_platform.asgi:application'
+    # see ASYNC_VIEWS in settings.py
+    os.environ.setdefault('ASYNC_VIEWS', 'yes')
+else:
+    wsgi_app = 'online_course_platform.wsgi:application'
+
+# import the application once in the master, workers are forked from it warm and share its memory
+preload_app = os.getenv('GUNICORN_PRELOAD', 'yes') == 'yes'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then, jittered so they do not all restart at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+if os.path.isdir('/dev/shm'):
+    # the worker heartbeat file, a disk backed /tmp in containers can block workers
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
+
+def when_ready(server):
+    # before the workers are forked
+    if preload_app:
+        from custom.warmup import warm_up
+        warm_up()
+
+def post_worker_init(worker):
+    from custom.warmup import warm_up, warm_up_worker
+    if not preload_app:
+        warm_up()
+    warm_up_worker()
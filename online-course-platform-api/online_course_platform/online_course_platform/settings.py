@@ -15,6 +15,7 @@ import sys
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import timedelta
+from importlib.util import find_spec
 
 # .env file should be put inside the same folder of this settings.py
 load_dotenv()
@@ -51,10 +52,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'custom.compression.CompressionMiddleware',
+    'custom.querystats.QueryStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'custom.replicas.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -90,6 +94,14 @@ DATABASES = {
     }
 }
 
+# aliases of read replicas of 'default', see custom.replicas. reads of requests go to them, except after the request
+# or, for DATABASE_REPLICA_PIN_SECONDS, the user wrote something, so that users always read their own writes
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['custom.replicas.ReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = 5
+# seconds an unreachable replica is skipped before it is tried again
+DATABASE_REPLICA_RETRY_SECONDS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -141,6 +153,9 @@ if USE_S3:
     AWS_DEFAULT_ACL = 'public-read'
     AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
     AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
+    AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME')
+    # point both django-storages and the signing client to a local S3 stand-in, e.g. MinIO
+    AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')
 
     # s3 static settings
     AWS_LOCATION = 'static'
@@ -160,6 +175,80 @@ else:
     MEDIA_URL = '/media/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# lifetime of signed lesson video urls, a cached url is reused while it has at least
+# SIGNED_MEDIA_URL_MIN_REMAINING of its lifetime left
+SIGNED_MEDIA_URL_EXPIRES_IN = 60
+SIGNED_MEDIA_URL_MIN_REMAINING = 0.5
+
+# reject oversized or disguised files while they stream in, see custom.upload_handlers
+FILE_UPLOAD_HANDLERS = [
+    'custom.upload_handlers.FileLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# resumable uploads of lesson videos and assignment materials, see custom.uploads.
+# chunks are S3 multipart parts when the target storage is S3, thus at least 5 MiB
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKED_UPLOAD_SPOOL_DIR = os.path.join(BASE_DIR, 'upload_spool')
+# S3 parts uploading at once per process, chunk requests wait for a free worker beyond that
+CHUNKED_UPLOAD_S3_MAX_WORKERS = 8
+# resumable uploads are not buffered by a worker, so they may be larger than the model validators allow
+# for uploads in a single request
+CHUNKED_UPLOAD_MAX_SIZES = {
+    'lesson_video': 2 * 1024 * 1024 * 1024,
+    'assignment_material': 200 * 1024 * 1024,
+}
+
+# bulk enrollment resolves and inserts students this many at a time, see custom.enrollments
+BULK_ENROLLMENT_BATCH_SIZE = 1000
+BULK_ENROLLMENT_MAX_ROWS = 20000
+BULK_JOIN_REQUEST_MAX_DECISIONS = 1000
+
+# a self enrollment rolled back by a deadlock or a locked database is retried this many times,
+# after a random backoff of up to ENROLLMENT_LOCK_BACKOFF * 2 ** attempt seconds
+ENROLLMENT_LOCK_RETRIES = 5
+ENROLLMENT_LOCK_BACKOFF = 0.02
+
+# report the SQL count, duplicates and time of every request in X-Query-* headers and
+# log requests going over the query budget of their view, see custom.querystats
+QUERY_STATS_ENABLED = os.getenv('QUERY_STATS') == 'yes'
+
+# serve GETs of the lesson and assignment material endpoints with the async views of custom.async_views,
+# only worth it under ASGI (gunicorn.conf.py turns it on for uvicorn workers) and with only async capable middleware,
+# QUERY_STATS and the debug toolbar included
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'yes'
+# threads per process running the database work of async views, each holding a database connection
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 10))
+
+# build the responses of the course, roster and lesson endpoints from .values() rows instead of
+# model instances and DRF serializers, the same bytes in a fraction of the time, see custom.fastpath
+FAST_READ_SERIALIZERS = os.getenv('FAST_READ_SERIALIZERS') == 'yes'
+
+# profile pictures get square WebP thumbnails of these sizes in pixels, made off the request
+# on IMAGE_PROCESSES processes per server process, see custom.profile_pictures
+PROFILE_PICTURE_SIZES = (64, 128, 256)
+PROFILE_PICTURE_WEBP_QUALITY = 80
+# larger pictures are left as they are, a 1 MB upload can decompress to gigabytes
+PROFILE_PICTURE_MAX_PIXELS = 25_000_000
+IMAGE_PROCESSES = int(os.getenv('IMAGE_PROCESSES', 2))
+
+# change feeds of courses, see custom.changes. the watermark of a sync stays CHANGE_FEED_LAG seconds behind,
+# longer than transactions saving lessons, assignments or materials take (and than the clocks of the servers differ).
+# deletions are kept CHANGE_FEED_RETENTION seconds (see the prune_tombstones command),
+# clients which last synced longer ago get 410 and download the course again
+CHANGE_FEED_LAG = 30
+CHANGE_FEED_RETENTION = 30 * 24 * 60 * 60
+
+# the dashboards of students and teachers show the latest DASHBOARD_LESSONS lessons and DASHBOARD_ASSIGNMENTS
+# open assignments of each of their courses. they are cached per user in the catalog cache, see custom.dashboard
+DASHBOARD_LESSONS = 5
+DASHBOARD_ASSIGNMENTS = 5
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# most requests in one batch of /api/v1/batch/, see custom.batch
+BATCH_MAX_REQUESTS = 20
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -170,10 +259,25 @@ SERVER_PORT = '5000'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'custom.pagination.IdCursorPagination',
+    'PAGE_SIZE': 20,
+    # JSON encoded with orjson when installed, and application/msgpack when msgpack is, see custom.renderers
+    'DEFAULT_RENDERER_CLASSES': [
+        'custom.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['custom.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    ],
 }
 
+# API responses this big or bigger are compressed with brotli when installed or gzip, see custom.compression
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# hard upper bound of the ?page_size= query param of list endpoints
+MAX_PAGE_SIZE = 100
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -181,8 +285,14 @@ INTERNAL_IPS = [
 SIMPLE_JWT = {
    'AUTH_HEADER_TYPES': ('Bearer',),
    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
+   'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.TokenObtainPairSerializer',
+   'TOKEN_REFRESH_SERIALIZER': 'core.serializers.TokenRefreshSerializer',
 }
 
+# seconds the token version of a user is cached, role changes revoke issued tokens at most this late
+# in other processes unless CACHES points to a shared backend
+TOKEN_VERSION_CACHE_TTL = 30
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'core.serializers.UserCreateSerializer',
@@ -190,6 +300,27 @@ DJOSER = {
     }
 }
 
+# seconds an answer of "is user U teacher/student of course C" may be reused across requests, 0 to disable.
+# answers are invalidated on roster changes, across processes only if CACHES points to a shared backend
+COURSE_MEMBERSHIP_CACHE_TTL = 30
+
+# the catalog cache holds anonymous responses of the course and category endpoints, see custom.caching.
+# point it to a shared backend (e.g. memcached or redis) when running several processes,
+# a file based cache works too, e.g. for tests
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': os.getenv('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CATALOG_CACHE_LOCATION', 'catalog'),
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 300
+# seconds other workers wait for the worker rebuilding a hot key before building it themselves
+CATALOG_CACHE_LOCK_TIMEOUT = 5
+
 # about the 'Core' app
 AUTH_USER_MODEL = 'core.User'
 USER_ROLE_STUDENT = 'ST'
@@ -25,12 +25,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # before the toolbar, which cannot read compressed pages
+    'custom.compression.CompressionMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'custom.querystats.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'custom.replicas.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -50,3 +54,15 @@ DATABASES = {
         },
     }
 }
+
+# a second local database acting as a lagging replica of 'default': it only catches up when rows are copied over,
+# e.g. by hand or, with DEV_REPLICA=mysql, by MySQL replication. reads are routed to it with DEV_REPLICA=yes or mysql
+# (run migrate --database replica first), custom.tests.ReplicaRoutingTests always use it
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+}
+if os.getenv('DEV_REPLICA') == 'mysql':
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': 'online_course_replica'}
+if os.getenv('DEV_REPLICA') in ('yes', 'mysql'):
+    DATABASE_REPLICAS = ['replica']
@@ -18,9 +18,19 @@ DATABASES = {
             'charset': 'utf8mb4',
             'sql_mode': 'STRICT_ALL_TABLES',
         },
+        # keep connections to RDS open across requests instead of connecting on every request,
+        # checked before reuse by custom.database.check_persistent_connections
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 300)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# comma separated hosts of read replicas of the RDS instance, see custom.replicas
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('AWS_RDS_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
 DEBUG = False
 
 ALLOWED_HOSTS = [
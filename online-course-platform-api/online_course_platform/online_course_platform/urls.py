@@ -23,7 +23,7 @@ urlpatterns = [
     path(r'api/v1/', include('custom.urls')),
     path(r'admin/', admin.site.urls),
     path(r'__debug__/', include('debug_toolbar.urls')),
-    path(r'api/v1/auth/', include('djoser.urls')),
+    path(r'api/v1/auth/', include('core.urls')),
     path(r'api/v1/auth/', include('djoser.urls.jwt')),
 ]
 